@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""Fingerprinted, precompressed static files.
+
+``python assets.py`` copies every script under static/ to static/dist/ with
+the content hash in its name (``game.3f2a9c1b0d4e.js``), writes gzip and, when
+the brotli package is installed, brotli variants next to it, and records the
+names in static/dist/manifest.json. Run it before deploying. The hashed
+copies of the previous build are kept, since a test page cached before a
+deploy (main.py lets caches keep it for INDEX_MAX_AGE seconds) still links
+to them. Older ones are deleted.
+
+``url_for('static', filename=...)`` then links to the hashed copy from the
+manifest, as long as the source still has the hash the copy was built from.
+Files the manifest does not know, or that changed since it was built, get a
+``v=<content hash>`` parameter instead. Either way a file's URL changes whenever the file does, so
+browsers and caches may keep it for a year: a new deploy links to new URLs
+instead of waiting for old copies to expire. On App Engine the static
+handlers in app.yaml set the same lifetime; ``init_app`` does it for the
+Flask server.
+
+The App Engine static handlers cannot pick a variant by Accept-Encoding (the
+frontend compresses on the fly instead). With SERVE_PRECOMPRESSED set, as
+``python main.py`` does, the Flask server sends the .br or .gz variant itself.
+
+    python assets.py --bandwidth 1.6
+"""
+
+import argparse
+import functools
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+FINGERPRINT_LENGTH = 12
+IMMUTABLE = 'public, max-age=31536000, immutable'
+DIST = 'dist'
+MANIFEST = 'manifest.json'
+
+# what a phone loads for one test, see templates/index.html
+PAGE_ASSETS = ('libraries/p5.min.js', 'libraries/p5.sound.min.js', 'animations-0.js', 'game.js', 'donald_2021.js')
+
+# Accept-Encoding token and file suffix, best first
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+def fingerprint(path: str) -> str:
+    """Return a short hash of the file's content, or '' when it does not exist."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ''
+    # hashed again only when the file changed
+    return _content_hash(path, stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=None)
+def _content_hash(path: str, mtime_ns: int, size: int) -> str:
+    try:
+        with open(path, 'rb') as handle:
+            return hashlib.sha256(handle.read()).hexdigest()[:FINGERPRINT_LENGTH]
+    except OSError:
+        return ''
+
+
+def hashed_name(relative: str, version: str) -> str:
+    """Return the name under dist/ of the copy of ``relative`` with content hash ``version``."""
+    stem, extension = os.path.splitext(relative)
+    return f'{DIST}/{stem}.{version}{extension}'
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+def build(static_dir: str) -> dict:
+    """Write hashed and precompressed copies of the scripts; return the manifest."""
+    dist = os.path.join(static_dir, DIST)
+    previous = load_manifest(static_dir)
+    brotli = _brotli()
+    manifest = {}
+    for directory, subdirectories, files in os.walk(static_dir):
+        if os.path.abspath(directory) == os.path.abspath(static_dir):
+            subdirectories[:] = [name for name in subdirectories if name != DIST]
+        for name in sorted(files):
+            source = os.path.join(directory, name)
+            relative = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            target_dir = os.path.join(dist, os.path.dirname(relative))
+            if name.endswith('.map'):
+                # source maps are looked up next to the script under their own name
+                os.makedirs(target_dir, exist_ok=True)
+                shutil.copyfile(source, os.path.join(target_dir, name))
+                continue
+            if not name.endswith('.js'):
+                continue
+            with open(source, 'rb') as handle:
+                data = handle.read()
+            hashed = hashed_name(relative, hashlib.sha256(data).hexdigest()[:FINGERPRINT_LENGTH])
+            target = os.path.join(static_dir, hashed)
+            os.makedirs(target_dir, exist_ok=True)
+            with open(target, 'wb') as handle:
+                handle.write(data)
+            with open(target + '.gz', 'wb') as handle:
+                handle.write(gzip.compress(data, compresslevel=9, mtime=0))
+            if brotli is not None:
+                with open(target + '.br', 'wb') as handle:
+                    handle.write(brotli.compress(data, quality=11))
+            manifest[relative] = hashed
+    os.makedirs(dist, exist_ok=True)
+    with open(os.path.join(dist, MANIFEST), 'w', encoding='utf-8') as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+    prune(static_dir, set(manifest.values()) | set(previous.values()))
+    return manifest
+
+
+def prune(static_dir: str, keep: set[str]) -> None:
+    """Delete the hashed copies under dist/, and their variants, that are not in ``keep``."""
+    for directory, _, files in os.walk(os.path.join(static_dir, DIST)):
+        for name in files:
+            path = os.path.join(directory, name)
+            relative = os.path.relpath(path, static_dir).replace(os.sep, '/')
+            for _, suffix in ENCODINGS:
+                relative = relative.removesuffix(suffix)
+            if relative.endswith('.js') and relative not in keep:
+                os.unlink(path)
+
+
+def load_manifest(static_dir: str) -> dict:
+    """Return the manifest written by ``build``, or {} when it was not run."""
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST), encoding='utf-8') as handle:
+            return json.load(handle)
+    except FileNotFoundError:
+        return {}
+
+
+def init_app(app) -> None:
+    """Link static files by content hash and cache them for a year."""
+    from flask import request, send_from_directory
+
+    manifest = load_manifest(app.static_folder)
+
+    @app.url_defaults
+    def add_fingerprint(endpoint, values):
+        if endpoint != 'static' or 'v' in values:
+            return
+        filename = values['filename']
+        version = fingerprint(os.path.join(app.static_folder, filename))
+        # a manifest built before the source was edited would link the old copy
+        if version and manifest.get(filename) == hashed_name(filename, version):
+            values['filename'] = manifest[filename]
+        elif version:
+            values['v'] = version
+
+    @app.before_request
+    def send_precompressed():
+        if not app.config.get('SERVE_PRECOMPRESSED') or request.endpoint != 'static':
+            return None
+        filename = request.view_args['filename']
+        for encoding, suffix in ENCODINGS:
+            if encoding in request.accept_encodings and os.path.isfile(
+                    os.path.join(app.static_folder, filename + suffix)):
+                response = send_from_directory(app.static_folder, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+        return None
+
+    @app.after_request
+    def cache_fingerprinted(response):
+        if request.endpoint != 'static' or response.status_code not in (200, 206, 304):
+            return response
+        filename = request.view_args.get('filename', '') if request.view_args else ''
+        if request.args.get('v') or filename.startswith(DIST + '/'):
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Build hashed, precompressed static files.')
+    parser.add_argument('--static', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static'),
+                        help='The static directory (default: the one next to this script).')
+    parser.add_argument('--bandwidth', type=float, default=1.6,
+                        help='Mbit/s used to estimate the download time of a test page (default: 1.6).')
+    args = parser.parse_args()
+
+    manifest = build(args.static)
+    print(f'wrote {len(manifest)} scripts to {os.path.join(args.static, DIST)}')
+    if _brotli() is None:
+        print('brotli is not installed, only gzip variants were written')
+
+    print(f"{'file':<28} {'plain':>9} {'gzip':>9} {'brotli':>9}")
+    totals = [0, 0, 0]
+    for name in PAGE_ASSETS:
+        path = os.path.join(args.static, manifest[name])
+        sizes = [os.path.getsize(path), os.path.getsize(path + '.gz'),
+                 os.path.getsize(path + '.br') if os.path.exists(path + '.br') else 0]
+        totals = [total + size for total, size in zip(totals, sizes)]
+        print(f'{name:<28} {sizes[0]:>9} {sizes[1]:>9} {sizes[2]:>9}')
+    print(f"{'one test page':<28} {totals[0]:>9} {totals[1]:>9} {totals[2]:>9}")
+    seconds = [total * 8 / (args.bandwidth * 1e6) for total in totals]
+    print(f"{'seconds at %g Mbit/s' % args.bandwidth:<28} {seconds[0]:>9.2f} {seconds[1]:>9.2f} {seconds[2]:>9.2f}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,57 @@
+"""Running a storage job over the testRecords batch by batch.
+
+Shared by purge.py and compact.py: both walk the stored records one batch at
+a time, report every batch, and stop when they are done or when their time
+budget runs out, handing back a cursor to resume from.
+"""
+
+import argparse
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+
+@dataclass
+class BatchProgress:
+    batches: int = 0
+    cursor: Optional[str] = None
+    done: bool = False
+
+    def as_dict(self) -> dict:
+        return {'batches': self.batches, 'cursor': self.cursor, 'done': self.done}
+
+
+def run_batches(step: Callable[[Optional[str]], Optional[str]], progress: BatchProgress,
+                time_budget: Optional[float] = None,
+                report: Optional[Callable[[BatchProgress], None]] = None) -> BatchProgress:
+    """Call ``step`` with the cursor of ``progress`` until it returns None.
+
+    ``step`` processes one batch, updates the counts in ``progress`` and
+    returns the cursor of the next batch. Stops early once ``time_budget``
+    seconds have passed; ``progress`` then carries the cursor to resume from.
+    """
+    started = time.monotonic()
+    while True:
+        progress.cursor = step(progress.cursor)
+        progress.batches += 1
+        progress.done = progress.cursor is None
+        if report:
+            report(progress)
+        if progress.done:
+            return progress
+        if time_budget is not None and time.monotonic() - started >= time_budget:
+            return progress
+
+
+def add_batch_arguments(parser: argparse.ArgumentParser) -> None:
+    """Add --batch-size, --cursor and --time-budget to ``parser``."""
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--cursor', default=None, help='Resume a previous run from this cursor.')
+    parser.add_argument('--time-budget', type=float, default=None,
+                        help='Stop after this many seconds and print the cursor.')
+
+
+def print_resume_hint(progress: BatchProgress) -> None:
+    """Print how to resume a run that stopped before it was done."""
+    if not progress.done:
+        print(f'not finished, resume with --cursor {progress.cursor}')
@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Write cost and storage of the testRecord entity layouts.
+
+Builds synthetic results in every line layout of the course years and
+compares, per stored result:
+
+- the layout ingest used before: every property, typed copies included,
+  indexed
+- the compact layout of storage/datastore_backend.py
+- the compact layout with the raw line deflated (COMPRESS_VALUES=1)
+
+It reports the index rows a write adds, the bytes of the entity in the
+commit request, and the stored bytes of the entity and its index rows.
+Stored sizes follow the storage size rules documented for Firestore in
+Datastore mode: a string is its UTF-8 length + 1, an int or timestamp 8, a
+null 1, a key the sizes of its kind and name + 16, an entity its key, its
+property names and values + 32, an index row the entity key, the kind, the
+property name(s) and value(s) + 32. Every indexed property has an ascending
+and a descending built-in index row, plus one row per composite index in
+index.yaml.
+
+    python benchmarks/bench_entity_layout.py --records 100000
+"""
+
+import argparse
+import random
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from google.cloud import datastore  # noqa: E402
+from google.cloud.datastore.helpers import entity_to_protobuf  # noqa: E402
+
+from idalloc import alnum4  # noqa: E402
+from records import parse_result  # noqa: E402
+from storage.base import line_hash, record_key  # noqa: E402
+from storage.datastore_backend import INDEXED_PROPERTIES, compact_properties  # noqa: E402
+
+KIND = 'testRecord'
+
+# the composite indexes of index.yaml
+COMPOSITE_INDEXES = (('testID', 'testIndex'), ('testID', 'testIndex', 'timeStamp'), ('testSet', 'testID'))
+
+QUESTIONNAIRES = (
+    [],
+    ['21', '7', 'geen'],
+    ['20', '8', 'koffie', 'niet kleurenblind'],
+    ['22', '6', 'geen', 'niet kleurenblind', 'donald is mij uitgelegd', 'zeg ik niet'],
+)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=10000,
+                        help="Number of synthetic results (default: 10000).")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def synthetic_records(count: int, seed: int) -> list[dict]:
+    rng = random.Random(seed)
+    stamp = datetime(2026, 5, 1)
+    records = []
+    for n in range(count):
+        level = rng.randint(2, 9)
+        requested = [str(rng.randrange(4)) for _ in range(level)]
+        status = rng.choice(('correct', 'correct', 'wrong', 'timeout'))
+        recorded = requested if status == 'correct' else requested[:rng.randrange(level)]
+        fields = [alnum4(1000 + n // 12), str(n % 12 + 1), f'PARAMS-{rng.randrange(5)}', '20', '120', '40', '120',
+                  '360', ','.join(requested), ','.join(recorded), status, str(rng.randint(30, 361)),
+                  str(rng.randint(0, 3)), rng.choice(('412x766', '390x844', '1280x720', '360x640'))]
+        line = '\t'.join(fields + rng.choice(QUESTIONNAIRES))
+        records.append(parse_result(line, stamp + timedelta(seconds=n * 7)))
+    return records
+
+
+def value_size(value) -> int:
+    if value is None:
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, bytes):
+        return len(value) + 1
+    return len(value.encode('utf-8')) + 1
+
+
+def measure(name: str, properties: dict, indexed: set) -> dict:
+    """Return the index rows and sizes of one entity in the given layout."""
+    key_size = value_size(KIND) + value_size(name) + 16
+    entity_size = key_size + sum(value_size(prop) + value_size(value) for prop, value in properties.items()) + 32
+    index_rows = 0
+    index_size = 0
+    for prop in indexed:
+        index_rows += 2
+        index_size += 2 * (key_size + value_size(KIND) + value_size(prop) + value_size(properties[prop]) + 32)
+    for composite in COMPOSITE_INDEXES:
+        if all(prop in indexed for prop in composite):
+            index_rows += 1
+            index_size += key_size + value_size(KIND) + sum(
+                value_size(prop) + value_size(properties[prop]) for prop in composite) + 32
+
+    entity = datastore.Entity(key=datastore.Key(KIND, name, project='bench'),
+                              exclude_from_indexes=tuple(set(properties) - indexed))
+    entity.update(properties)
+    return {'rows': index_rows, 'request': entity_to_protobuf(entity)._pb.ByteSize(),
+            'entity': entity_size, 'index': index_size}
+
+
+def layouts(record: dict) -> dict[str, tuple[dict, set]]:
+    digest = line_hash(record)
+    before = dict(record, lineHash=digest)
+    compact = compact_properties(record, digest)
+    deflated = compact_properties(record, digest, compress=True)
+    return {
+        'all indexed': (before, set(before)),
+        'compact': (compact, set(INDEXED_PROPERTIES)),
+        'compact + zlib': (deflated, set(INDEXED_PROPERTIES)),
+    }
+
+
+def main() -> int:
+    args = parse_args()
+    records = synthetic_records(args.records, args.seed)
+    totals = {}
+    for record in records:
+        name = record_key(record)
+        for layout, (properties, indexed) in layouts(record).items():
+            sums = totals.setdefault(layout, {'rows': 0, 'request': 0, 'entity': 0, 'index': 0})
+            for metric, value in measure(name, properties, indexed).items():
+                sums[metric] += value
+
+    count = len(records)
+    baseline = totals['all indexed']
+    print(f"{args.records} synthetic results, averages per result")
+    print(f"{'layout':<16} {'index rows':>10} {'request B':>10} {'entity B':>9} {'index B':>8} "
+          f"{'stored B':>9} {'saved':>6}")
+    for layout, sums in totals.items():
+        stored = sums['entity'] + sums['index']
+        saved = 1 - stored / (baseline['entity'] + baseline['index'])
+        print(f"{layout:<16} {sums['rows'] / count:>10.1f} {sums['request'] / count:>10.0f} "
+              f"{sums['entity'] / count:>9.0f} {sums['index'] / count:>8.0f} {stored / count:>9.0f} {saved:>6.0%}")
+    stored = totals['compact + zlib']['entity'] + totals['compact + zlib']['index']
+    print(f"stored for {args.records} results: {(baseline['entity'] + baseline['index']) / 1e6:.1f} MB "
+          f"before, {stored / 1e6:.1f} MB compact with zlib")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Contention benchmark for test ID allocation.
+
+Runs 1, 10 and 100 concurrent clients against the in-memory Datastore
+stand-in and reports IDs per second for the per-request counter transaction
+(block size 1, the original behaviour) and for block reservation.
+
+    python benchmarks/bench_id_allocation.py --latency 0.005 --ids 2000
+"""
+
+import argparse
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.datastore_standin import StandinClient  # noqa: E402
+from idalloc import BlockIDAllocator, alnum4  # noqa: E402
+from storage.datastore_backend import DatastoreStorage  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--block-sizes", type=int, nargs="+", default=[1, 20, 100])
+    parser.add_argument("--ids", type=int, default=2000,
+                        help="Total IDs to allocate per run (default: 2000).")
+    parser.add_argument("--latency", type=float, default=0.005,
+                        help="Simulated Datastore round trip in seconds (default: 0.005).")
+    return parser.parse_args()
+
+
+def run(clients: int, block_size: int, total: int, latency: float) -> tuple[float, int]:
+    """Allocate ``total`` IDs from ``clients`` threads; return (IDs/s, transactions)."""
+    client = StandinClient(rpc_latency=latency)
+    allocator = BlockIDAllocator(DatastoreStorage(client), block_size=block_size)
+    per_client = max(1, total // clients)
+    results: list[list[int]] = [[] for _ in range(clients)]
+
+    def worker(slot: list[int]) -> None:
+        for _ in range(per_client):
+            slot.append(allocator.next_id())
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in results]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ids = [value for slot in results for value in slot]
+    codes = {alnum4(value) for value in ids}
+    if len(set(ids)) != len(ids) or len(codes) != len(ids):
+        raise SystemExit(f"duplicate IDs with clients={clients} block_size={block_size}")
+    return len(ids) / elapsed, client.transactions
+
+
+def main() -> int:
+    args = parse_args()
+    print(f"{'clients':>8} {'block':>6} {'IDs/s':>10} {'transactions':>13}")
+    for clients in args.clients:
+        for block_size in args.block_sizes:
+            rate, transactions = run(clients, block_size, args.ids, args.latency)
+            print(f"{clients:>8} {block_size:>6} {rate:>10.0f} {transactions:>13}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
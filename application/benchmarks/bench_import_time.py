@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""Import time of main.py, the cold start cost of every new instance.
+
+Imports main in a fresh interpreter with ``python -X importtime``, then
+serves one test page. It reports the time to import main, the time to the
+first page, and the modules main imports directly, slowest first.
+With ``--budget`` it exits with 1 when the import is slower, so a
+regression can fail a check.
+
+    python benchmarks/bench_import_time.py --runs 5 --budget 1.0
+"""
+
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+APPLICATION = Path(__file__).resolve().parent.parent
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+main.app.test_client().get('/?set=0').close()
+print(json.dumps({'import': imported - start, 'first_page': time.perf_counter() - imported,
+                  'datastore_loaded': 'google.cloud.datastore' in sys.modules}))
+"""
+
+LINE = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)')
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters to start (default: 3).")
+    parser.add_argument("--top", type=int, default=12, help="Modules to list (default: 12).")
+    parser.add_argument("--storage", default="datastore", help="DONALD_STORAGE to import with (default: datastore).")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="Fail when the fastest import of main takes longer than this many seconds.")
+    return parser.parse_args()
+
+
+def run_once(storage: str) -> tuple[dict, list[tuple[int, str]]]:
+    """Import main once; return the child's timings and main's direct imports."""
+    env = dict(os.environ, DONALD_STORAGE=storage, RATE_LIMITS='0')
+    if storage == 'sqlite':
+        env.setdefault('DONALD_SQLITE_PATH', os.path.join(tempfile.gettempdir(), 'donald-bench-import.sqlite3'))
+    child = subprocess.run([sys.executable, '-X', 'importtime', '-c', CHILD], cwd=APPLICATION, env=env,
+                           capture_output=True, text=True, check=True)
+    # a module's imports are printed just before it, one level deeper
+    direct = []
+    for line in child.stderr.splitlines():
+        match = LINE.match(line)
+        if not match:
+            continue
+        depth, name = len(match.group(3)), match.group(4)
+        if depth == 0:
+            if name == 'main':
+                break
+            direct = []
+        elif depth == 2:
+            direct.append((int(match.group(2)), name))
+    return json.loads(child.stdout.strip().splitlines()[-1]), direct
+
+
+def main() -> int:
+    args = parse_args()
+    runs = [run_once(args.storage) for _ in range(args.runs)]
+    timings, direct = min(runs, key=lambda run: run[0]['import'])
+
+    print(f"import main: {timings['import'] * 1000:.0f} ms (fastest of {args.runs})")
+    print(f"first page:  {timings['first_page'] * 1000:.0f} ms")
+    print(f"google.cloud.datastore loaded before any storage call: {timings['datastore_loaded']}")
+    print(f"{'module':<40} {'cumulative ms':>14}")
+    for microseconds, name in sorted(direct, reverse=True)[:args.top]:
+        print(f"{name:<40} {microseconds / 1000:>14.1f}")
+
+    if args.budget is not None and timings['import'] > args.budget:
+        print(f"import of main exceeds the budget of {args.budget * 1000:.0f} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""Serial versus partitioned full export on a local backend.
+
+Fills a temporary SQLite file with synthetic results and reads the full export
+serially and with the testID ranges of parallelexport.py fetched at the same
+time. Every page fetch sleeps for ``--latency`` seconds to stand in for the
+Datastore round trip a page costs in production; without it SQLite answers
+from the page cache and there is nothing to overlap.
+
+    python benchmarks/bench_parallel_export.py --tests 2000 --latency 0.02
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from idalloc import alnum4  # noqa: E402
+from parallelexport import parallel_query_results  # noqa: E402
+from records import parse_result  # noqa: E402
+from storage.sqlite_backend import SQLiteStorage  # noqa: E402
+
+LINE = '{}\t{}\tPARAMS-1\t20\t120\t40\t120\t360\t1,3,3,0\t1,3,3,0\tcorrect\t361\t1\t412x766'
+
+
+class SlowPages:
+    """Delegate to a storage backend, sleeping once per fetched page."""
+
+    def __init__(self, storage, latency: float):
+        self.storage = storage
+        self.latency = latency
+
+    def __getattr__(self, name):
+        return getattr(self.storage, name)
+
+    def query_results(self, **kwargs):
+        pages = self.storage.query_results(**kwargs)
+        while True:
+            time.sleep(self.latency)
+            page = next(pages, None)
+            if page is None:
+                return
+            yield page
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tests", type=int, default=2000,
+                        help="Number of synthetic tests (default: 2000).")
+    parser.add_argument("--attempts", type=int, default=10,
+                        help="Results per test (default: 10).")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--latency", type=float, default=0.02,
+                        help="Simulated round trip per page in seconds (default: 0.02).")
+    return parser.parse_args()
+
+
+def fill(storage, tests: int, attempts: int) -> int:
+    first = storage.allocate_ids(tests)
+    stamp = datetime(2026, 5, 1)
+    for n in range(tests):
+        storage.insert_results([parse_result(LINE.format(alnum4(first + n), index), stamp + timedelta(seconds=n))
+                                for index in range(1, attempts + 1)])
+    return tests * attempts
+
+
+def main() -> int:
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteStorage(str(Path(directory) / 'bench.sqlite3'))
+        total = fill(backend, args.tests, args.attempts)
+        storage = SlowPages(backend, args.latency)
+
+        print(f"{'concurrency':>12} {'seconds':>8} {'records/s':>10} {'speedup':>8}")
+        expected = serial_seconds = None
+        for concurrency in args.concurrency:
+            start = time.perf_counter()
+            keys = [(r['testID'], r['testIndex'])
+                    for page in parallel_query_results(storage, page_size=args.page_size, concurrency=concurrency)
+                    for r in page]
+            seconds = time.perf_counter() - start
+            if len(keys) != total or (expected is not None and keys != expected):
+                raise SystemExit(f"concurrency {concurrency} returned a different export")
+            expected = expected or keys
+            serial_seconds = serial_seconds or seconds
+            print(f"{concurrency:>12} {seconds:>8.2f} {total / seconds:>10.0f} {serial_seconds / seconds:>7.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
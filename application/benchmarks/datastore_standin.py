@@ -0,0 +1,116 @@
+"""In-memory stand-in for the parts of ``datastore.Client`` the app uses.
+
+Every RPC sleeps for ``rpc_latency`` seconds and transactions hold a single
+lock for their whole duration, which mimics the serialisation Datastore
+imposes on writes to one entity group. It is only meant for benchmarks.
+"""
+
+import threading
+import time
+
+from google.cloud import datastore
+
+
+class StandinTransaction:
+    """Context manager holding the client's transaction lock."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def __enter__(self):
+        self.client._txn_lock.acquire()
+        self.client.transactions += 1
+        self.client._rpc()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # the commit is one more round trip
+        self.client._rpc()
+        self.client._txn_lock.release()
+        return False
+
+
+class StandinClient:
+    """Dictionary backed client with simulated round trip latency."""
+
+    def __init__(self, rpc_latency: float = 0.005, project: str = 'standin'):
+        self.rpc_latency = rpc_latency
+        self.project = project
+        self.entities = {}
+        self.transactions = 0
+        self._txn_lock = threading.Lock()
+        self._data_lock = threading.Lock()
+
+    def _rpc(self):
+        if self.rpc_latency:
+            time.sleep(self.rpc_latency)
+
+    def key(self, *path_args, **kwargs):
+        kwargs.setdefault('project', self.project)
+        return datastore.Key(*path_args, **kwargs)
+
+    def transaction(self):
+        return StandinTransaction(self)
+
+    def get(self, key):
+        found = self.get_multi([key])
+        return found[0] if found else None
+
+    def get_multi(self, keys):
+        self._rpc()
+        with self._data_lock:
+            return [self._copy(key, self.entities[self._path(key)]) for key in keys
+                    if self._path(key) in self.entities]
+
+    def put(self, entity):
+        self.put_multi([entity])
+
+    def put_multi(self, entities):
+        self._rpc()
+        with self._data_lock:
+            for entity in entities:
+                self.entities[self._path(entity.key)] = (dict(entity), set(entity.exclude_from_indexes))
+
+    def query(self, kind, namespace=None):
+        return StandinQuery(self, kind, namespace)
+
+    @staticmethod
+    def _path(key):
+        return key.namespace, key.flat_path
+
+    @staticmethod
+    def _copy(key, stored):
+        values, exclude_from_indexes = stored
+        entity = datastore.Entity(key, exclude_from_indexes=tuple(exclude_from_indexes))
+        entity.update(values)
+        return entity
+
+
+class StandinQuery:
+    """Query of all entities of one kind in key order; filters are not supported."""
+
+    def __init__(self, client, kind, namespace=None):
+        self.client = client
+        self.kind = kind
+        self.namespace = namespace
+        self.order = []
+
+    def fetch(self, limit=None, start_cursor=None):
+        self.client._rpc()
+        with self.client._data_lock:
+            paths = sorted((path for namespace, path in self.client.entities
+                            if namespace == self.namespace and path[-2] == self.kind),
+                           key=lambda path: [(isinstance(part, str), part) for part in path])
+        start = int(start_cursor) if start_cursor else 0
+        end = len(paths) if limit is None else start + limit
+        page = [self.client._copy(self.client.key(*path, namespace=self.namespace),
+                                  self.client.entities[self.namespace, path]) for path in paths[start:end]]
+        return StandinIterator(page, str(end).encode('ascii') if end < len(paths) else None)
+
+
+class StandinIterator:
+    """The one page a fetch returns and the cursor after it."""
+
+    def __init__(self, page, next_page_token):
+        self.pages = iter([page])
+        self.next_page_token = next_page_token
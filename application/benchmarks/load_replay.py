@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+"""Replay recorded test sessions against the app and measure it.
+
+Reads the result lines of data/POST-data-*.txt and groups them by testID
+into sessions. Each session is replayed as a phone plays it: GET /?set=<n>,
+GET /id for a fresh test ID, then a POST / per attempt at the spacing of the
+recorded dtstamps. Sessions start at their recorded moment too, so a lecture
+arrives as the burst it was; every delay is divided by ``--speed``.
+``--busiest`` replays only the sessions that started in the busiest window
+of that many minutes.
+
+By default the app runs in this process on a temporary SQLite file, with the
+rate limits off (RATE_LIMITS=0) so the tool measures the app rather than the
+limiter; ``--url`` replays against a server started elsewhere. Without data
+files, ``--synthetic`` makes up a lecture of that many students.
+
+It reports throughput, p50/p95/p99 latency and the error rate per route, and
+the peak request rate of the recorded trace, the number to size instances by.
+
+    python benchmarks/load_replay.py --busiest 60 --speed 10
+    python benchmarks/load_replay.py --synthetic 300 --speed 5
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from pathlib import Path
+
+APPLICATION = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(APPLICATION))
+
+DATA_DIR = APPLICATION.parent / 'data'
+
+# field counts of a recorded line, the posted fields plus dtstamp; see
+# data/collate_post_data.py
+RECORDED_SIZES = (15, 18, 19, 21)
+
+ROUTES = ('GET /', 'GET /id', 'POST /')
+
+
+@dataclass
+class Session:
+    testSet: str
+    attempts: list[tuple[datetime, str]] = field(default_factory=list)
+
+    @property
+    def start(self) -> datetime:
+        return self.attempts[0][0]
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data-dir", type=Path, default=DATA_DIR,
+                        help="Directory with the POST-data-*.txt files (default: data/ of the repository).")
+    parser.add_argument("--synthetic", type=int, default=0, metavar="STUDENTS",
+                        help="Replay a made-up lecture of this many students instead of the data files.")
+    parser.add_argument("--busiest", type=float, default=None, metavar="MINUTES",
+                        help="Only replay sessions that started in the busiest window of this many minutes.")
+    parser.add_argument("--max-sessions", type=int, default=None)
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="Time compression: 10 replays an hour in six minutes (default: 1).")
+    parser.add_argument("--concurrency", type=int, default=256,
+                        help="Sessions that can be in progress at once (default: 256).")
+    parser.add_argument("--url", default=None, help="Replay against this server instead of an in-process app.")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Seconds before a request counts as failed.")
+    parser.add_argument("--seed", type=int, default=1)
+    return parser.parse_args()
+
+
+def parse_recorded_line(line: str):
+    """Return (dtstamp, posted line, testID, testSet) of a recorded line, or None."""
+    fields = line.rstrip('\r\n').split('\t')
+    if len(fields) not in RECORDED_SIZES or fields[0] == 'testID':
+        return None
+    try:
+        stamp = datetime.fromisoformat(fields[-1])
+    except ValueError:
+        return None
+    return stamp, '\t'.join(fields[:-1]), fields[0], fields[2]
+
+
+def load_sessions(data_dir: Path) -> list[Session]:
+    """Group the recorded lines of every POST-data file by testID."""
+    sessions = {}
+    for path in sorted(data_dir.glob('POST-data-*.txt')):
+        # the collated file repeats the yearly ones
+        if path.name == 'POST-data-TOTAL.txt':
+            continue
+        with path.open(encoding='utf-8', errors='replace') as handle:
+            for line in handle:
+                parsed = parse_recorded_line(line)
+                if parsed is None:
+                    continue
+                stamp, text, testID, testSet = parsed
+                sessions.setdefault(testID, Session(testSet)).attempts.append((stamp, text))
+    for session in sessions.values():
+        session.attempts.sort()
+    return sorted(sessions.values(), key=lambda session: session.start)
+
+
+def synthetic_sessions(students: int, seed: int) -> list[Session]:
+    """A lecture: students start within ten minutes and play a dozen levels."""
+    rng = random.Random(seed)
+    begin = datetime(2026, 5, 20, 9, 0)
+    sessions = []
+    for n in range(students):
+        testSet = f'PARAMS-{rng.randrange(5)}'
+        stamp = begin + timedelta(seconds=rng.uniform(0, 600))
+        session = Session(testSet)
+        for counter in range(1, rng.randint(8, 16) + 1):
+            level = 2 + counter // 2
+            requested = ','.join(str(rng.randrange(4)) for _ in range(level))
+            status = rng.choice(('correct', 'correct', 'wrong', 'timeout'))
+            fields = [f'S-{n:04d}', str(counter), testSet, '10', '60', '20', '60', '240', requested,
+                      requested if status == 'correct' else '', status, str(rng.randint(30, 241)), '0',
+                      '412x766', '21', '7', 'geen', 'niet kleurenblind', '', '']
+            session.attempts.append((stamp, '\t'.join(fields)))
+            stamp += timedelta(seconds=rng.uniform(4, 20))
+        sessions.append(session)
+    return sorted(sessions, key=lambda session: session.start)
+
+
+def busiest_window(sessions: list[Session], minutes: float) -> list[Session]:
+    """Return the sessions that started in the window of ``minutes`` with the most attempts."""
+    width = timedelta(minutes=minutes)
+    best, best_attempts = (0, 0), -1
+    first, attempts = 0, 0
+    for last, session in enumerate(sessions):
+        attempts += len(session.attempts)
+        while session.start - sessions[first].start > width:
+            attempts -= len(sessions[first].attempts)
+            first += 1
+        if attempts > best_attempts:
+            best, best_attempts = (first, last + 1), attempts
+    return sessions[best[0]:best[1]]
+
+
+def peak_rate(sessions: list[Session]) -> tuple[int, datetime]:
+    """Return the most requests the recorded trace makes in one second, and when."""
+    per_second = Counter()
+    for session in sessions:
+        # the page and the ID are fetched just before the first attempt
+        per_second[session.start.replace(microsecond=0)] += 2
+        per_second.update(stamp.replace(microsecond=0) for stamp, _ in session.attempts)
+    second, count = per_second.most_common(1)[0]
+    return count, second
+
+
+class Recorder:
+    """Latencies and outcomes per route, shared by the session threads."""
+
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.outcomes = defaultdict(Counter)
+        self.lag = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, route: str, seconds: float, outcome: str) -> None:
+        with self._lock:
+            self.latencies[route].append(seconds)
+            self.outcomes[route][outcome] += 1
+
+    def late(self, seconds: float) -> None:
+        with self._lock:
+            self.lag = max(self.lag, seconds)
+
+
+def request(base: urllib.parse.SplitResult, method: str, path: str, body: bytes, timeout: float,
+            recorder: Recorder, route: str) -> bytes:
+    connection = http.client.HTTPConnection(base.hostname, base.port or 80, timeout=timeout)
+    start = time.perf_counter()
+    try:
+        connection.request(method, path, body=body or None,
+                           headers={'Content-Type': 'text/plain'} if body else {})
+        response = connection.getresponse()
+        data = response.read()
+        outcome = str(response.status)
+    except (OSError, http.client.HTTPException) as error:
+        data, outcome = b'', type(error).__name__
+    finally:
+        connection.close()
+    recorder.add(route, time.perf_counter() - start, outcome)
+    return data
+
+
+def replay_session(session: Session, due: float, base, speed: float, timeout: float,
+                   recorder: Recorder, rng: random.Random) -> None:
+    wait = due - time.monotonic()
+    if wait > 0:
+        time.sleep(wait)
+    else:
+        recorder.late(-wait)
+    number = session.testSet.rpartition('-')[2]
+    request(base, 'GET', '/?set=' + (number if number.isdigit() else str(rng.randrange(5))), b'',
+            timeout, recorder, 'GET /')
+    try:
+        testID = json.loads(request(base, 'GET', '/id', b'', timeout, recorder, 'GET /id'))['testID']
+    except (ValueError, KeyError):
+        testID = None
+    started = time.monotonic()
+    first = session.start
+    for stamp, text in session.attempts:
+        wait = started + (stamp - first).total_seconds() / speed - time.monotonic()
+        if wait > 0:
+            time.sleep(wait)
+        if testID:
+            # post under the ID the server handed out, as the game does
+            text = testID + text[text.index('\t'):]
+        request(base, 'POST', '/', text.encode('utf-8'), timeout, recorder, 'POST /')
+
+
+def start_local_app(directory: str):
+    """Run main.py on a fresh SQLite file in a server thread; return (main, server, url)."""
+    os.environ.update(DONALD_STORAGE='sqlite', DONALD_SQLITE_PATH=os.path.join(directory, 'load.sqlite3'),
+                      RATE_LIMITS='0')
+    os.chdir(APPLICATION)
+    import main
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    server = make_server('127.0.0.1', 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, name='load-replay-server', daemon=True).start()
+    return main, server, f'http://127.0.0.1:{server.server_port}'
+
+
+def quantile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def report(recorder: Recorder, seconds: float, sessions: list[Session], speed: float) -> None:
+    total = sum(len(values) for values in recorder.latencies.values())
+    print(f"replayed {len(sessions)} sessions, {total} requests in {seconds:.1f} s at speed {speed:g}: "
+          f"{total / seconds:.1f} requests/s")
+    print(f"{'route':<8} {'requests':>8} {'req/s':>7} {'p50 ms':>7} {'p95 ms':>7} {'p99 ms':>7} "
+          f"{'errors':>6} {'error %':>7}  outcomes")
+    for route in ROUTES:
+        values = recorder.latencies.get(route)
+        if not values:
+            continue
+        outcomes = recorder.outcomes[route]
+        errors = sum(count for outcome, count in outcomes.items() if not outcome.startswith(('2', '3')))
+        print(f"{route:<8} {len(values):>8} {len(values) / seconds:>7.1f} {quantile(values, 0.5) * 1000:>7.1f} "
+              f"{quantile(values, 0.95) * 1000:>7.1f} {quantile(values, 0.99) * 1000:>7.1f} {errors:>6} "
+              f"{errors / len(values):>7.2%}  {dict(sorted(outcomes.items()))}")
+    count, second = peak_rate(sessions)
+    print(f"recorded peak: {count} requests in one second at {second:%Y-%m-%d %H:%M:%S}, "
+          f"{count * speed:g}/s in this replay")
+    print(f"latest session start: {recorder.lag:.2f} s behind schedule")
+
+
+def main() -> int:
+    args = parse_args()
+    if args.synthetic:
+        sessions = synthetic_sessions(args.synthetic, args.seed)
+    else:
+        sessions = load_sessions(args.data_dir)
+    if not sessions:
+        print(f"no sessions in {args.data_dir}/POST-data-*.txt, use --synthetic for a made-up lecture")
+        return 1
+    if args.busiest:
+        sessions = busiest_window(sessions, args.busiest)
+    sessions = sessions[:args.max_sessions]
+
+    with tempfile.TemporaryDirectory(prefix='donald-load-') as directory:
+        app = server = None
+        url = args.url
+        if url is None:
+            app, server, url = start_local_app(directory)
+        base = urllib.parse.urlsplit(url)
+        recorder = Recorder()
+        rng = random.Random(args.seed)
+        first = sessions[0].start
+        begin = time.monotonic() + 0.5
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            for session in sessions:
+                due = begin + (session.start - first).total_seconds() / args.speed
+                executor.submit(replay_session, session, due, base, args.speed, args.timeout, recorder, rng)
+        seconds = time.monotonic() - begin
+        report(recorder, seconds, sessions, args.speed)
+
+        if app is not None:
+            app.writer.join()
+            stored = sum(len(page) for page in app.storage.query_results())
+            posted = recorder.outcomes['POST /']['200']
+            print(f"stored {stored} of {posted} accepted results")
+            server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""Rewrite stored testRecords in the compact entity layout.
+
+Records stored before the compact layout index every property, some carry
+only the raw line, and older ones have no storedAt. This walks all testRecords in key order and
+rewrites those that are not compact yet, see storage/datastore_backend.py;
+records already compact are only read, so a second run rewrites nothing.
+
+    DONALD_STORAGE=datastore python compact.py --time-budget 300
+
+Every batch reports its progress. A run that stops early prints the cursor it
+got to; pass it back with --cursor to resume. Add --compress (or set
+COMPRESS_VALUES=1) to store the raw lines deflated as well.
+"""
+
+import argparse
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from batchjob import BatchProgress, add_batch_arguments, print_resume_hint, run_batches
+
+
+@dataclass(kw_only=True)
+class CompactProgress(BatchProgress):
+    read: int = 0
+    rewritten: int = 0
+
+    def as_dict(self) -> dict:
+        return {'read': self.read, 'rewritten': self.rewritten, **super().as_dict()}
+
+
+def compact(storage, batch_size: int = 500, cursor: Optional[str] = None,
+            time_budget: Optional[float] = None,
+            report: Optional[Callable[[CompactProgress], None]] = None) -> CompactProgress:
+    """Rewrite the stored records batch by batch.
+
+    Stops when every record was read or when ``time_budget`` seconds have
+    passed; the returned progress then carries the cursor to resume from.
+    """
+    progress = CompactProgress(cursor=cursor)
+
+    def step(cursor: Optional[str]) -> Optional[str]:
+        read, rewritten, cursor = storage.compact_results(limit=batch_size, cursor=cursor)
+        progress.read += read
+        progress.rewritten += rewritten
+        return cursor
+
+    return run_batches(step, progress, time_budget, report)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Rewrite stored testRecords in the compact entity layout.')
+    add_batch_arguments(parser)
+    parser.add_argument('--compress', action='store_true', default=None,
+                        help='Store the raw lines deflated (default: COMPRESS_VALUES).')
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+
+    from storage import get_storage
+
+    storage = get_storage()
+    if args.compress is not None:
+        storage.compress = args.compress
+
+    def report(progress: CompactProgress) -> None:
+        print(f'batch {progress.batches}: read {progress.read}, rewrote {progress.rewritten} so far')
+
+    progress = compact(storage, batch_size=args.batch_size, cursor=args.cursor,
+                       time_budget=args.time_budget, report=report)
+    print(f'rewrote {progress.rewritten} of {progress.read} records')
+    print_resume_hint(progress)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,85 @@
+"""Per-testID cache of rendered /q exports.
+
+Every stored batch bumps a ``version:<testID>`` counter for the tests it
+contains, and every purge batch that deleted records bumps the
+``purge:generation`` counter. A test's export version combines the two; a
+cached export is only served while its version is still the current one, and
+the same version doubles as the ETag, so a browser that already has the
+current export gets a 304 without running the query.
+
+Entries are evicted least recently used first once the cached bodies together
+exceed ``max_bytes``.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Optional
+
+VERSION_PREFIX = 'version:'
+
+# a purge can delete records of any test, so it changes every test's version
+PURGE_GENERATION = 'purge:generation'
+
+
+def version_deltas(records: list[dict]) -> dict[str, int]:
+    """Return the counter increments that mark the tests in ``records`` as changed."""
+    return {VERSION_PREFIX + testID: 1 for testID in {record['testID'] for record in records}}
+
+
+def export_version(storage, testID: str) -> str:
+    """Return the current export version of ``testID``, read from the counters of ``storage``."""
+    name = VERSION_PREFIX + testID
+    stored = storage.read_counters(name).get(name, 0)
+    purged = storage.read_counters(PURGE_GENERATION).get(PURGE_GENERATION, 0)
+    return f'{stored}.{purged}'
+
+
+def etag_for(testID: str, version: str) -> str:
+    return f'{testID}-{version}'
+
+
+class ExportCache:
+    """LRU cache of export bodies keyed by testID and version."""
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, testID: str, version: str) -> Optional[bytes]:
+        """Return the cached body if it was rendered for ``version``."""
+        with self._lock:
+            entry = self._entries.get(testID)
+            if entry is None or entry[0] != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(testID)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, testID: str, version: str, body: bytes) -> None:
+        """Cache ``body`` for ``version``, evicting old entries to stay under the cap."""
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(testID, None)
+            if old is not None:
+                self.size -= len(old[1])
+            self._entries[testID] = (version, body)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.size -= len(evicted)
+
+    def discard(self, testID: str) -> None:
+        """Drop the cached export of ``testID``, if any."""
+        with self._lock:
+            entry = self._entries.pop(testID, None)
+            if entry is not None:
+                self.size -= len(entry[1])
+
+    def __len__(self) -> int:
+        return len(self._entries)
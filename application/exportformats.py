@@ -0,0 +1,105 @@
+"""Export formats for /q besides tab-separated text.
+
+The format is chosen with ``?format=`` or the Accept header:
+
+- ``text``: the raw result lines, as always
+- ``ndjson``: one JSON object per record with the typed canonical columns
+- ``arrow``: an Arrow IPC stream, one record batch per page
+- ``parquet``: a Parquet file
+
+Arrow and Parquet need the optional pyarrow package; without it those formats
+are answered with 406. Columns follow CANONICAL_SCHEMA, the schema
+data/collate_post_data.py writes.
+"""
+
+import io
+import json
+from typing import Iterable, Optional
+
+from records import CANONICAL_SCHEMA, TYPED_FIELDS, canonical_row
+
+FORMATS = {
+    'text': ('text/plain', 'txt'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrow'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+INT_COLUMNS = {'testCounter'} | {name for name, kind in TYPED_FIELDS.items() if kind is int}
+
+
+class FormatUnavailable(Exception):
+    """The requested format needs a package that is not installed."""
+
+
+def negotiate(requested: Optional[str], accept) -> Optional[str]:
+    """Return the export format for a ``format`` parameter and Accept header.
+
+    ``accept`` is a werkzeug MIMEAccept; returns None for an unknown format.
+    """
+    if requested:
+        return requested if requested in FORMATS else None
+    best = accept.best_match([mimetype for mimetype, _ in FORMATS.values()], default='text/plain')
+    return next(name for name, (mimetype, _) in FORMATS.items() if mimetype == best)
+
+
+def _json_default(value):
+    return value.isoformat()
+
+
+def ndjson_chunks(pages: Iterable[list[dict]]) -> Iterable[str]:
+    for page in pages:
+        yield ''.join(json.dumps(canonical_row(record), default=_json_default) + '\n' for record in page)
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise FormatUnavailable('pyarrow is not installed') from error
+    return pyarrow
+
+
+def arrow_schema():
+    pa = _pyarrow()
+    fields = []
+    for name in CANONICAL_SCHEMA:
+        if name == 'dtstamp':
+            fields.append(pa.field(name, pa.timestamp('us')))
+        elif name in INT_COLUMNS:
+            fields.append(pa.field(name, pa.int64()))
+        else:
+            fields.append(pa.field(name, pa.string()))
+    return pa.schema(fields)
+
+
+def _record_batch(schema, page: list[dict]):
+    pa = _pyarrow()
+    rows = [canonical_row(record) for record in page]
+    return pa.RecordBatch.from_pydict({name: [row[name] for row in rows] for name in schema.names}, schema=schema)
+
+
+def arrow_chunks(pages: Iterable[list[dict]]) -> Iterable[bytes]:
+    """Stream an Arrow IPC stream, writing each page as one record batch."""
+    pa = _pyarrow()
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for page in pages:
+            writer.write_batch(_record_batch(schema, page))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+    yield sink.getvalue()
+
+
+def parquet_bytes(pages: Iterable[list[dict]]) -> bytes:
+    """Build a Parquet file; the footer needs every row group, so it is not streamed."""
+    pa = _pyarrow()
+    import pyarrow.parquet as pq
+    schema = arrow_schema()
+    sink = io.BytesIO()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for page in pages:
+            writer.write_table(pa.Table.from_batches([_record_batch(schema, page)], schema=schema))
+    return sink.getvalue()
@@ -0,0 +1,69 @@
+"""Incremental "changes since" feed of stored results.
+
+/q?since=<timestamp> returns the records stored after that moment, in
+storedAt order, together with a continuation token; /q?token=<token> picks
+up where the previous call stopped. Syncing tools only move new rows.
+
+The feed never returns records stored less than ``settle`` seconds ago.
+ingest stamps storedAt just before the insert is committed, so a record
+stored that recently could still appear behind the token and would be
+skipped forever.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+from typing import Optional
+
+from records import TIMESTAMP_FORMAT
+
+
+def encode_token(after: datetime, until: datetime, cursor: Optional[str] = None) -> str:
+    state = {'a': after.strftime(TIMESTAMP_FORMAT), 'u': until.strftime(TIMESTAMP_FORMAT)}
+    if cursor:
+        state['c'] = cursor
+    return base64.urlsafe_b64encode(json.dumps(state).encode('utf-8')).decode('ascii')
+
+
+def decode_token(token: str) -> tuple[datetime, datetime, Optional[str]]:
+    """Return (after, until, cursor) from a token; raises ValueError when it is not one."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+        return (datetime.strptime(state['a'], TIMESTAMP_FORMAT),
+                datetime.strptime(state['u'], TIMESTAMP_FORMAT), state.get('c'))
+    except (KeyError, TypeError, UnicodeError, json.JSONDecodeError, binascii.Error) as error:
+        raise ValueError(f'invalid token: {error}') from error
+
+
+def parse_since(text: str) -> datetime:
+    """Parse an ISO 8601 timestamp such as 2026-05-01 or 2026-05-01T10:00:00Z.
+
+    Stored timeStamps are naive local times, so a timestamp with a UTC
+    offset is converted to local time and its offset dropped.
+    """
+    since = datetime.fromisoformat(text)
+    if since.tzinfo is not None:
+        since = since.astimezone().replace(tzinfo=None)
+    return since
+
+
+def read_changes(storage, since: Optional[datetime] = None, token: Optional[str] = None,
+                 limit: int = 1000, settle: float = 30,
+                 now: Optional[datetime] = None) -> tuple[list[dict], str]:
+    """Return the next records and the token to continue with."""
+    if token:
+        after, until, cursor = decode_token(token)
+    else:
+        after, until, cursor = since, None, None
+    if until is None or cursor is None:
+        # a fresh query: read up to the moment everything has settled
+        until = (now or datetime.now()) - timedelta(seconds=settle)
+    if after >= until:
+        return [], encode_token(after, until)
+
+    records, cursor = storage.query_changes(after, until, limit=limit, cursor=cursor)
+    if cursor:
+        return records, encode_token(after, until, cursor)
+    # this window is done; the next call starts where it ended
+    return records, encode_token(until, until)
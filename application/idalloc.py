@@ -0,0 +1,73 @@
+"""Block-reserving test ID allocator.
+
+Every page view needs a unique test ID. Incrementing the shared counter once
+per request serialises all page views on one entity group, so instead each
+instance reserves a block of IDs in a single storage transaction and hands
+them out from memory until the block is used up.
+
+IDs stay unique across instances because a block is only ever handed to the
+instance whose transaction moved the counter past it. IDs left over in a block
+when an instance shuts down are simply never used.
+"""
+
+import threading
+
+#
+# a test code needs to be shown and transferred to the questionaire.
+# we use alphanumeric encodong to make the code compact
+#
+chars = '0123456789ABCDEFGHIJKLMNPQRSTVWXYZ'
+
+
+def alnum4(number):
+    m = len(chars)
+    r = ''
+    r = chars[int(number % m)] + r
+    r = chars[int((number / m) % m)] + r
+    r = chars[int((number / (m * m)) % m)] + r
+    r = chars[int((number / (m * m * m)) % m)] + r
+    return 'U-' + r
+
+
+def alnum4_number(code):
+    """Return the number ``alnum4`` encoded as ``code``, or None for a code it did not make."""
+    if len(code) != 6 or not code.startswith('U-') or not all(c in chars for c in code[2:]):
+        return None
+    number = 0
+    for c in code[2:]:
+        number = number * len(chars) + chars.index(c)
+    return number
+
+
+class BlockIDAllocator:
+    """Hand out unique integer IDs from blocks reserved on the storage counter."""
+
+    def __init__(self, storage, block_size: int = 20):
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1")
+        self.storage = storage
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = 0
+        self._end = 0
+
+    def _reserve_block(self) -> None:
+        """Move the shared counter past a new block and keep it for this instance."""
+        first = self.storage.allocate_ids(self.block_size)
+        self._next = first
+        self._end = first + self.block_size
+
+    def next_id(self) -> int:
+        """Return the next unused ID, reserving a new block when needed."""
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve_block()
+            value = self._next
+            self._next += 1
+        return value
+
+    def prefetch(self) -> None:
+        """Reserve a block now if none is left, e.g. while an instance warms up."""
+        with self._lock:
+            if self._next >= self._end:
+                self._reserve_block()
@@ -0,0 +1,41 @@
+"""Storing a batch of parsed results.
+
+Shared by main.py, which stores what POST / and /batch received, and by the
+spool replay of ``python spool.py``, so both skip duplicates, bump the export
+versions and count the results the same way.
+"""
+
+import logging
+from datetime import datetime
+
+from exportcache import version_deltas
+from storage import STORED_AT
+
+logger = logging.getLogger(__name__)
+
+
+def store_results(storage, rollups, records: list[dict]) -> tuple[list[dict], set[str]]:
+    """Store ``records`` and count them.
+
+    Returns the records that were written and the testIDs whose export
+    version could not be bumped. Their bump is retried with the next counter
+    flush; until then cached exports of those tests must not be served.
+    """
+    # the feed and the snapshot deltas read records by when they were stored:
+    # results that waited in a queue or spool keep their receive time
+    now = datetime.now()
+    records = [dict(record, **{STORED_AT: now}) for record in records]
+    # results already stored (client retries, double submits) are skipped
+    inserted, conflicts = storage.insert_results(records)
+    # bumped after the insert, so a cached export never outlives newer data
+    deltas = version_deltas(inserted)
+    stale = set()
+    try:
+        storage.increment_counters(deltas)
+    except Exception:
+        logger.exception('could not bump export versions, retrying with the counters')
+        rollups.increment(deltas)
+        stale = {record['testID'] for record in inserted}
+    rollups.add(inserted)
+    rollups.increment({'ingest:duplicate': len(records) - len(inserted), 'ingest:conflict': conflicts})
+    return inserted, stale
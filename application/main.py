@@ -13,163 +13,521 @@
 # limitations under the License.
 
 # [START gae_python38_app]
+import functools
+import gzip
+import hashlib
+import io
+import logging
+import os
+import queue
+import random
 import re
+import time
+
+from flask import Flask, Response, jsonify, redirect, render_template, request, stream_with_context
+
+from datetime import date, datetime, timedelta
+
+import assets
+import ingest
+import metrics
+import ratelimit
+from exportcache import ExportCache, etag_for, export_version
+from exportformats import FORMATS, FormatUnavailable, arrow_chunks, ndjson_chunks, negotiate, parquet_bytes
+from feed import parse_since, read_changes
+from idalloc import BlockIDAllocator, alnum4
+from parallelexport import parallel_query_results
+from performance import PREFIX as PERFORMANCE_PREFIX, summarize
+from purge import purge, retention_cutoff, retention_days
+from records import parse_result
+from rollups import Rollups, query_prefixes, split_counters
+from snapshots import ConcatenatedBody, build_snapshot, delta_pages, get_snapshot_store, gzip_member, stream_export
+from spool import Spool
+from storage import get_storage, namespace_from_env, parse_namespace
+from writebehind import WriteBehindWriter
 
-from flask import Flask, Response, render_template, request, stream_with_context
-
-from google.cloud import datastore
-from google.cloud.datastore.query import PropertyFilter
-from datetime import datetime
+#
+# the storage backend (Datastore or SQLite) is chosen by DONALD_STORAGE. The
+# results of each course year go into a namespace of their own, named in
+# DONALD_NAMESPACE, so exports only read the current year.
+#
+NAMESPACE = namespace_from_env()
+storage = metrics.instrument_storage(get_storage(NAMESPACE))
 
 #
-# a test code needs to be shown and transferred to the questionaire.
-# we use alphanumeric encodong to make the code compact
+# we need to maintain the index for which of the unique test ID's we're at.
+# IDs are reserved in blocks so most page views are served from memory.
 #
-chars = '0123456789ABCDEFGHIJKLMNPQRSTVWXYZ'
+allocator = BlockIDAllocator(storage, block_size=int(os.environ.get('ID_BLOCK_SIZE', '20')))
 
 
-def alnum4(number):
-    m = len(chars)
-    r = ''
-    r = chars[int(number % m)] + r
-    r = chars[int((number / m) % m)] + r
-    r = chars[int((number / (m * m)) % m)] + r
-    r = chars[int((number / (m * m * m)) % m)] + r
-    return 'U-' + r
+def next_ID():
+    return allocator.next_id()
+#
+# counts per testSet, status and day are kept up to date at ingest
+#
+rollups = Rollups(storage, interval=float(os.environ.get('ROLLUP_FLUSH_SECONDS', '10')))
 
 
 #
-# we need to maintain the index for which of the unique test ID's we're at
+# exports per testID are cached until a newer result for that test arrives
 #
-client = datastore.Client()
-key = client.key('counter', 'test-ID')
+export_cache = ExportCache(max_bytes=int(os.environ.get('EXPORT_CACHE_BYTES', str(16 * 1024 * 1024))))
 
 
-def next_ID():
-    with client.transaction():
-        counter = client.get(key)
-        if not counter:
-            counter = datastore.Entity(key)
-            counter.update({'value': 100})
-        counter['value'] = counter['value'] + 1
-        client.put(counter)
-    return counter['value']
+def store_results(records):
+    _, stale = ingest.store_results(storage, rollups, records)
+    # until their version bump is retried this instance does not serve those
+    # tests from its cache
+    for testID in stale:
+        export_cache.discard(testID)
 #
-# received data needs to be stored for reference
+# received data needs to be stored for reference. Results are queued per
+# instance and written in batches; with SPOOL_DIR set they are first made
+# durable in a spool file on disk.
 #
+SPOOL_DIR = os.environ.get('SPOOL_DIR')
+if SPOOL_DIR:
+    writer = Spool(SPOOL_DIR, store_results, max_batch=int(os.environ.get('RESULT_BATCH_SIZE', '100')))
+else:
+    writer = WriteBehindWriter(store_results,
+                               max_batch=int(os.environ.get('RESULT_BATCH_SIZE', '100')),
+                               max_delay=float(os.environ.get('RESULT_FLUSH_SECONDS', '1.0')),
+                               max_queue=int(os.environ.get('RESULT_QUEUE_SIZE', '5000')))
 
 
 def save_result(data):
     text = data.decode("utf-8")
-    parts = text.split('\t')
-    testID = parts[0]
-    testIndex = parts[1]
-    testSet = parts[2]
-    timeStamp = datetime.now()
-    text += timeStamp.strftime('\t%Y-%m-%d %H:%M:%S.%f')
+    writer.submit(parse_result(text, datetime.now()))
+
 
-    testKey = client.key('testRecord')
-    testResult = datastore.Entity(key=testKey)
-    testResult.update({'testID': testID, 'testIndex': testIndex, 'testSet': testSet,
-                       'timeStamp': timeStamp, 'value': text})
-    client.put(testResult)
-#
 #
+# a batch holds many result lines, one per line, and is written in one go.
+# Lines get the receive time, a microsecond apart to keep their order.
 #
+MAX_BATCH_BYTES = int(os.environ.get('MAX_BATCH_BYTES', str(1024 * 1024)))
 
 
-def count_results():
-    query = client.query(kind='testRecord')
-    tests = list(query.fetch())
-    return tests
-
+def save_results(data):
+    timeStamp = datetime.now()
+    records = []
+    rejected = 0
+    for line in data.decode("utf-8").splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(parse_result(line, timeStamp + timedelta(microseconds=len(records))))
+        except ValueError:
+            rejected += 1
+    if records and SPOOL_DIR:
+        writer.submit_many(records)
+    elif records:
+        store_results(records)
+    return len(records), rejected
+#
 #
-# delete 200 old records on every request rceived. Change later to autodelete older than 100 days.
 #
 
 
-def delete_old_testRecords():
-    return # all are deleted already
-    kind = 'testRecord'
-    fetch_limit = 200
-    current_year = datetime(2025, 5, 21)
-
-    entities = True
-    while entities:
-        query = client.query(kind=kind)
-        query.add_filter(filter=PropertyFilter('timeStamp', '<=', current_year))
-        entities = list(query.fetch(limit=fetch_limit))
-        for entity in entities:
-        #        print('Deleting: {}'.format(entity))
-            client.delete(entity.key)
-
+def count_results():
+    # only the counters shown on /query, not the export versions and
+    # performance counters kept next to them, nor days it does not show
+    counters = {}
+    for prefix in query_prefixes(date.today()):
+        counters.update(rollups.counters(prefix))
+    return split_counters(counters)
 
 # If `entrypoint` is not defined in app.yaml, App Engine will look for an app
 # called `app` in `main.py`.
 app = Flask(__name__)
+metrics.init_app(app)
+assets.init_app(app)
+#
+# refresh storms and floods get a 429, and while storage is slow the routes
+# that wait on it answer 503 at once instead of piling up. Results are never
+# shed, and /batch is not limited: the end-of-session beacon cannot see a
+# refusal. /id is not shed either, a test without an ID is stored as UNKNOWN.
+#
+app.config['RATE_LIMITS'] = os.environ.get('RATE_LIMITS', '1') != '0'
+shedder = ratelimit.LoadShedder(threshold=float(os.environ.get('STORAGE_SHED_SECONDS', '1.0')))
+ratelimit.init_app(app,
+                   groups={('index', 'GET'): 'page', ('test_id', 'GET'): 'page', ('test_id', 'POST'): 'page',
+                           ('index', 'POST'): 'ingest',
+                           ('retrieve', 'GET'): 'export', ('retrieve', 'POST'): 'export',
+                           ('collisions', 'GET'): 'export', ('performance', 'GET'): 'page'},
+                   shed={'retrieve'},
+                   shedder=shedder)
+metrics.REGISTRY.gauge('donald_write_queue_depth', 'Results waiting to be written.',
+                       lambda: writer.stats()['queue_depth'])
+metrics.REGISTRY.gauge('donald_write_flush_seconds_last', 'Duration of the last batch write.',
+                       lambda: writer.stats()['flush_seconds_last'])
+metrics.REGISTRY.gauge('donald_write_flush_seconds_max', 'Slowest batch write so far.',
+                       lambda: writer.stats()['flush_seconds_max'])
+metrics.REGISTRY.gauge('donald_export_cache_bytes', 'Bytes held by the export cache.',
+                       lambda: export_cache.size)
+metrics.REGISTRY.gauge('donald_export_cache_hits', 'Exports served from the cache.',
+                       lambda: export_cache.hits)
+metrics.REGISTRY.gauge('donald_write_failed_total', 'Results dropped after failed writes.',
+                       lambda: writer.stats()['failed'])
+metrics.REGISTRY.gauge('donald_spool_dead_lettered_total', 'Spooled results set aside after storage kept refusing them.',
+                       lambda: writer.stats().get('dead_lettered', 0))
+
+
+#
+# the test page holds no per-visitor data, so it can be cached by browsers and
+# the App Engine edge. The test ID is fetched from /id when a test starts.
+#
+INDEX_MAX_AGE = int(os.environ.get('INDEX_MAX_AGE', '300'))
+TEST_SETS = 5
 
 
 @app.route('/', methods=['GET', 'POST'])
 def index():
-    delete_old_testRecords()
     if request.method == 'POST':
         data = request.get_data()
-        save_result(data)
+        try:
+            save_result(data)
+        except ValueError:
+            return 'malformed result', 400
+        except queue.Full:
+            return 'busy, try again', 503, {'Retry-After': '1'}
         return ''
     else:
-        id = next_ID()
-        testID = alnum4(id)
-        set = request.args.get('set', default=str(id % 5), type=str)
-        if not re.fullmatch(r'[-0-9a-zA-Z_]+', set):
-            set = str(id % 5)
-        return render_template('index.html', testID=testID, set=set)
+        set = request.args.get('set', type=str)
+        if not set or not re.fullmatch(r'[-0-9a-zA-Z_]+', set):
+            # pick the A/B test set here, so the page itself stays the same
+            # for every visitor of that set
+            response = redirect('/?set=' + str(random.randrange(TEST_SETS)))
+            response.headers['Cache-Control'] = 'no-store'
+            return response
+        response = Response(render_template('index.html', set=set))
+        response.headers['Cache-Control'] = f'public, max-age={INDEX_MAX_AGE}'
+        response.add_etag()
+        return response.make_conditional(request)
+
+
+@app.route('/id', methods=['GET', 'POST'])
+def test_id():
+    response = jsonify({'testID': alnum4(next_ID())})
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+#
+# App Engine sends /_ah/warmup to a new instance before giving it traffic
+# (inbound_services in app.yaml): connect to storage, reserve the first block
+# of test IDs and compile the templates now instead of for the first visitor
+#
+@app.route('/_ah/warmup')
+def warmup():
+    storage.warm_up()
+    allocator.prefetch()
+    for name in ('index.html', 'query.html'):
+        app.jinja_env.get_template(name)
+    return '', 200, {'Cache-Control': 'no-store'}
+
+
+@app.route('/batch', methods=['POST'])
+def batch():
+    data = request.get_data()
+    if request.headers.get('Content-Encoding') == 'gzip':
+        try:
+            with gzip.GzipFile(fileobj=io.BytesIO(data)) as unzipped:
+                data = unzipped.read(MAX_BATCH_BYTES + 1)
+        except (OSError, EOFError):
+            return 'malformed gzip body', 400
+    if len(data) > MAX_BATCH_BYTES:
+        return 'batch too large', 413
+    try:
+        accepted, rejected = save_results(data)
+    except UnicodeDecodeError:
+        return 'malformed batch', 400
+    except queue.Full:
+        return 'busy, try again', 503, {'Retry-After': '1'}
+    return jsonify({'accepted': accepted, 'rejected': rejected})
+
+
+@app.route('/collisions', methods=['GET'])
+def collisions():
+    # duplicates were the same line posted again and skipped, conflicts were
+    # different lines for the same testID and testCounter and were both kept
+    counters = rollups.counters('ingest:')
+    return jsonify({'duplicates': counters.get('ingest:duplicate', 0),
+                    'conflicts': counters.get('ingest:conflict', 0)})
+
+
+#
+# attempts, rates and elapsed-frame percentiles per testSet and level for the
+# teacher dashboard, read from the ingest counters and reused by every request
+# in the same PERFORMANCE_MAX_AGE window
+#
+PERFORMANCE_MAX_AGE = int(os.environ.get('PERFORMANCE_MAX_AGE', '10'))
+
+
+@functools.lru_cache(maxsize=1)
+def performance_summary(window):
+    return summarize(rollups.counters(PERFORMANCE_PREFIX))
+
+
+@app.route('/performance', methods=['GET'])
+def performance():
+    response = jsonify({'testSets': performance_summary(int(time.time() // max(PERFORMANCE_MAX_AGE, 1)))})
+    response.headers['Cache-Control'] = f'public, max-age={PERFORMANCE_MAX_AGE}'
+    return response
 
 
 @app.route('/query', methods=['GET', 'POST'])
 def query():
-    delete_old_testRecords()
-    #        count = len(count_results())
-    count = "heul veel"
-    return render_template('query.html', count=count)
+    counts = count_results()
+    return render_template('query.html', count=counts['total'], counts=counts)
+
+
+#
+# old records are deleted by cron, never on the request path. Purging is off
+# unless RETENTION_DAYS is set.
+#
+PURGE_TIME_BUDGET = float(os.environ.get('PURGE_TIME_BUDGET', '50'))
+
+
+@app.route('/tasks/purge', methods=['GET'])
+def purge_old_testRecords():
+    # App Engine strips this header from requests that do not come from cron
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        return 'forbidden', 403
+    days = retention_days()
+    if days is None:
+        return jsonify({'done': True, 'deleted': 0, 'disabled': True})
+
+    def report(progress):
+        logging.info('purge: %d records deleted in %d batches', progress.deleted, progress.batches)
+
+    progress = purge(storage, retention_cutoff(days), cursor=request.args.get('cursor'),
+                     time_budget=PURGE_TIME_BUDGET, report=report)
+    return jsonify(progress.as_dict())
+
+
+@app.route('/tasks/snapshot', methods=['GET'])
+def build_export_snapshot():
+    # App Engine strips this header from requests that do not come from cron
+    if request.headers.get('X-Appengine-Cron') != 'true':
+        return 'forbidden', 403
+    if snapshot_store is None:
+        return jsonify({'disabled': True})
+    return jsonify(build_snapshot(storage, snapshot_store, since=EXPORT_SINCE))
 
 
 filename = 'testID-'
+EXPORT_PAGE_SIZE = int(os.environ.get('EXPORT_PAGE_SIZE', '500'))
+# cuts earlier course years out of the full export while they share the
+# namespace with the current one, e.g. EXPORT_SINCE=2025-05-22
+EXPORT_SINCE = datetime.fromisoformat(os.environ['EXPORT_SINCE']) if os.environ.get('EXPORT_SINCE') else None
+# testID ranges the full export reads at the same time, 1 reads serially;
+# by default only Datastore reads ranges in parallel
+EXPORT_CONCURRENCY = int(os.environ.get('EXPORT_CONCURRENCY', storage.export_concurrency))
+
+
+def export_pages(source, since):
+    return parallel_query_results(source, since=since, page_size=EXPORT_PAGE_SIZE,
+                                  concurrency=EXPORT_CONCURRENCY)
+
+#
+# the full export is served from the latest snapshot plus a small delta
+#
+snapshot_store = get_snapshot_store(NAMESPACE)
+
+
+def snapshot_response(meta, headers):
+    pages = delta_pages(storage, meta, since=EXPORT_SINCE)
+    compressed = 'gzip' in request.accept_encodings
+    if not compressed or request.range is None:
+        response = Response(stream_export(snapshot_store, meta, pages, compressed),
+                            mimetype="text/plain", headers=headers)
+        if compressed:
+            response.headers['Content-Encoding'] = 'gzip'
+            response.headers['Accept-Ranges'] = 'bytes'
+        response.vary.add('Accept-Encoding')
+        return response
+
+    # a range needs the whole length: read the delta first. Snapshot and
+    # delta are both gzip members, together one valid gzip body
+    delta = b''.join(gzip_member(pages))
+    body = ConcatenatedBody(snapshot_store.open(meta['name']), meta['size'], delta)
+    response = Response(body, mimetype="text/plain", headers=headers, direct_passthrough=True)
+    response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.content_length = body.length
+    response.set_etag(meta['name'] + '-' + hashlib.sha1(delta).hexdigest()[:16])
+    return response.make_conditional(request, accept_ranges=True, complete_length=body.length)
+
+
+#
+# /q?set=<testSet> exports one parameter set, read with cursors a page at a
+# time so it streams whatever its size. With limit=<n> only the next n records
+# are returned, with the cursor for the next call in X-Next-Cursor (empty at
+# the end); pass it back as cursor=<cursor>.
+#
+SET_EXPORT_LIMIT = int(os.environ.get('SET_EXPORT_LIMIT', '5000'))
+
+
+def test_set_pages(source, testSet):
+    cursor = None
+    while True:
+        records, cursor = source.query_test_set(testSet, limit=EXPORT_PAGE_SIZE, cursor=cursor)
+        if records:
+            yield records
+        if cursor is None:
+            return
+
+
+#
+# /q?since=<timestamp> and /q?token=<token> return only the records stored
+# after that point, with the token for the next call in X-Next-Token
+#
+FEED_LIMIT = int(os.environ.get('FEED_LIMIT', '5000'))
+FEED_SETTLE_SECONDS = float(os.environ.get('FEED_SETTLE_SECONDS', '30'))
+
+
+def changes_response(source, since, token):
+    try:
+        records, next_token = read_changes(source, since=parse_since(since) if since else None,
+                                           token=token, limit=FEED_LIMIT, settle=FEED_SETTLE_SECONDS)
+    except ValueError:
+        return 'invalid since or token', 400
+    body = ''.join(testResult['value'] + '\n' for testResult in records)
+    return Response(body, mimetype="text/plain",
+                    headers={"Content-Disposition": "attachment; filename=changes.txt",
+                             "X-Next-Token": next_token, "X-Record-Count": str(len(records))})
+
+
+#
+# /q?format=ndjson|arrow|parquet (or a matching Accept header) exports typed
+# columns instead of the raw lines; those are always read from storage
+#
+def typed_export_response(format, pages, headers):
+    mimetype = FORMATS[format][0]
+    try:
+        if format == 'ndjson':
+            return Response(stream_with_context(ndjson_chunks(pages)), mimetype=mimetype, headers=headers)
+        if format == 'arrow':
+            chunks = arrow_chunks(pages)
+            # pyarrow is imported on the first chunk, fail before the response starts
+            first = next(chunks)
+            return Response(stream_with_context(_prepend(first, chunks)), mimetype=mimetype, headers=headers)
+        return Response(parquet_bytes(pages), mimetype=mimetype, headers=headers)
+    except FormatUnavailable:
+        return format + ' export is not available on this server', 406
+
+
+def _prepend(first, chunks):
+    yield first
+    yield from chunks
 
 
 @app.route('/q', methods=['GET', 'POST'])
 def retrieve():
-    delete_old_testRecords()
 
     if request.method == 'POST':
         testID = request.form.get('ID')
         testSet = request.form.get('set')
+        since = request.form.get('since')
+        token = request.form.get('token')
+        requested_format = request.form.get('format')
+        namespace = request.form.get('namespace')
+        limit = request.form.get('limit', type=int)
+        cursor = request.form.get('cursor')
     else:
         testID = request.args.get('ID')
         testSet = request.args.get('set')
+        since = request.args.get('since')
+        token = request.args.get('token')
+        requested_format = request.args.get('format')
+        namespace = request.args.get('namespace')
+        limit = request.args.get('limit', type=int)
+        cursor = request.args.get('cursor')
+
+    # ?namespace= exports an earlier course year, ?namespace=__default__ the
+    # default namespace; only the current one has snapshots and cached exports
+    try:
+        requested = parse_namespace(namespace) if namespace else NAMESPACE
+    except ValueError:
+        return 'invalid namespace', 400
+    current = requested == NAMESPACE
+    if current:
+        source, export_since = storage, EXPORT_SINCE
+    elif storage.namespace_exists(requested):
+        source, export_since = metrics.instrument_storage(storage.in_namespace(requested)), None
+    else:
+        return 'unknown namespace', 404
+
+    if since or token:
+        return changes_response(source, since, token)
 
+    format = negotiate(requested_format, request.accept_mimetypes)
+    if format is None:
+        return 'unknown format, use one of ' + ', '.join(FORMATS), 400
+    extension = FORMATS[format][1]
     if testID:
         safe_id = re.sub(r'[^A-Za-z0-9_]', '_', testID)
-        filename = 'testID-' + safe_id + '.txt'
+        filename = 'testID-' + safe_id + '.' + extension
+    elif testSet:
+        safe_set = re.sub(r'[^A-Za-z0-9_]', '_', testSet)
+        filename = 'testset-' + safe_set + '.' + extension
     else:
-        filename = "allResults.txt"
+        filename = "allResults." + extension
+    headers = {"Content-Disposition": "attachment; filename=" + filename}
+
+    # the pages are only read once the response needs them
+    if testID:
+        pages = source.query_results(testID=testID, page_size=EXPORT_PAGE_SIZE)
+    elif testSet and limit:
+        try:
+            records, next_cursor = source.query_test_set(testSet, limit=max(1, min(limit, SET_EXPORT_LIMIT)),
+                                                         cursor=cursor)
+        except ValueError:
+            return 'invalid cursor', 400
+        pages = [records]
+        headers.update({"X-Next-Cursor": next_cursor or '', "X-Record-Count": str(len(records))})
+    elif testSet:
+        pages = test_set_pages(source, testSet)
+    else:
+        pages = export_pages(source, export_since)
 
     def generate():
-        query = client.query(kind="testRecord")
-        if testID:
-            query.add_filter(filter=PropertyFilter('testID', '=', testID))
-            query.order = ["testIndex"]
-        else:
-            current_year = datetime(2025, 5, 22)
-            query.add_filter(filter=PropertyFilter('timeStamp', '>=', current_year))
-            query.order = ["testID", "testIndex"]
-#        if testSet:
-#            query.add_filter('testSet', '=', testSet)
-#            filename = 'testset-' + testSet
-        tests = list(query.fetch())
-        for testResult in tests:
-            yield(testResult['value'])
-            yield('\n')
-    return Response(stream_with_context(generate()), mimetype="text/plain", headers={"Content-Disposition": "attachment; filename=" + filename})
+        # one page at a time, so the first bytes go out before the query is finished
+        for page in pages:
+            yield ''.join(testResult['value'] + '\n' for testResult in page)
+
+    if format != 'text':
+        headers['Vary'] = 'Accept'
+        return typed_export_response(format, pages, headers)
+
+    if testSet and not testID:
+        return Response(stream_with_context(generate()), mimetype="text/plain", headers=headers)
+
+    if not current:
+        return Response(stream_with_context(generate()), mimetype="text/plain", headers=headers)
+
+    if not testID:
+        meta = snapshot_store.latest() if snapshot_store else None
+        if meta:
+            return snapshot_response(meta, headers)
+        return Response(stream_with_context(generate()), mimetype="text/plain", headers=headers)
+
+    # a single test's export is small: serve it from the cache while its
+    # version is current, and let browsers revalidate with the ETag
+    version = export_version(source, testID)
+    etag = etag_for(testID, version)
+    headers['Cache-Control'] = 'no-cache'
+    if request.if_none_match.contains(etag):
+        response = Response(status=304, headers=headers)
+    else:
+        body = export_cache.get(testID, version)
+        if body is None:
+            body = ''.join(generate()).encode('utf-8')
+            export_cache.put(testID, version, body)
+        response = Response(body, mimetype="text/plain", headers=headers)
+    response.set_etag(etag)
+    return response
 #    return Response("The application has been stopped on 2021 04 08", mimetype="text/plain", headers={"Content-Disposition":"attachment;filename=" + filename + ".txt"})
 #    return ''
 
@@ -179,5 +537,7 @@ if __name__ == '__main__':
     # Engine, a webserver process such as Gunicorn will serve the app. This
     # can be configured by adding an `entrypoint` to app.yaml.
     # app.run(host='127.0.0.1', port=8080, debug=True)
+    # send the .br/.gz variants written by `python assets.py`, as a CDN would
+    app.config['SERVE_PRECOMPRESSED'] = True
     app.run(debug=False)
 # [END gae_python38_app]
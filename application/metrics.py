@@ -0,0 +1,256 @@
+"""Request and storage instrumentation exposed in Prometheus text format.
+
+``init_app`` times every request per route, ``instrument_storage`` times every
+storage call (the Datastore RPCs behind them), and ``render`` produces the
+/metrics page. With METRICS_LOG=1 each request is also logged as one JSON line.
+"""
+
+import bisect
+import functools
+import json
+import os
+import threading
+import time
+from typing import Callable, Iterable
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names: tuple, values: tuple, extra: str = '') -> str:
+    pairs = [f'{name}="{str(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, *labels) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels) -> float:
+        return self._values.get(labels, 0)
+
+    def samples(self) -> Iterable[str]:
+        for labels, value in sorted(self._values.items()):
+            yield f'{self.name}{_labels(self.labelnames, labels)} {value}'
+
+
+class Histogram:
+    """Cumulative histogram of observed values with optional labels."""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labels
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            counts, total = self._series.get(labels, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self._series[labels] = (counts, total + value)
+
+    def count(self, *labels) -> int:
+        series = self._series.get(labels)
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> Iterable[str]:
+        for labels, (counts, total) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = 'le="%s"' % ('+Inf' if bound == float('inf') else repr(bound))
+                yield f'{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}'
+            yield f'{self.name}_sum{_labels(self.labelnames, labels)} {total}'
+            yield f'{self.name}_count{_labels(self.labelnames, labels)} {cumulative}'
+
+
+class Registry:
+    """The metrics of this instance, plus gauges computed at render time."""
+
+    def __init__(self):
+        self.metrics = []
+        self.gauges = []
+
+    def counter(self, name: str, help: str, labels: tuple = ()) -> Counter:
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, labels: tuple = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def gauge(self, name: str, help: str, read: Callable[[], float]) -> None:
+        """Register a gauge whose value is read when /metrics is rendered."""
+        self.gauges.append((name, help, read))
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.samples())
+        for name, help, read in self.gauges:
+            lines.append(f'# HELP {name} {help}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {read()}')
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUEST_SECONDS = REGISTRY.histogram(
+    'donald_request_seconds', 'Request latency, for streamed responses until the last byte.', ('route', 'method', 'status'))
+RESPONSE_BYTES = REGISTRY.counter(
+    'donald_response_bytes_total', 'Bytes sent in streamed responses.', ('route',))
+STORAGE_SECONDS = REGISTRY.histogram(
+    'donald_storage_call_seconds', 'Latency of storage calls.', ('backend', 'call'))
+STORAGE_ERRORS = REGISTRY.counter(
+    'donald_storage_call_errors_total', 'Storage calls that raised.', ('backend', 'call'))
+ID_TRANSACTION_RETRIES = REGISTRY.counter(
+    'donald_id_transaction_retries_total', 'Counter transactions retried after a conflict.')
+COUNTER_TRANSACTION_RETRIES = REGISTRY.counter(
+    'donald_counter_transaction_retries_total', 'Result counter transactions retried after a conflict.')
+REQUESTS_REFUSED = REGISTRY.counter(
+    'donald_requests_refused_total', 'Requests refused by rate limits or load shedding.', ('group', 'reason'))
+
+# called with the seconds every storage call took, e.g. by the load shedder
+STORAGE_LISTENERS = []
+
+
+def _observe_storage(seconds: float, backend: str, call: str) -> None:
+    STORAGE_SECONDS.observe(seconds, backend, call)
+    for listener in STORAGE_LISTENERS:
+        listener(seconds)
+
+
+def instrument_storage(storage):
+    """Wrap the public storage methods of ``storage`` with timing."""
+    backend = type(storage).__name__
+    for call in ('allocate_ids', 'last_id', 'insert_results', 'query_test_set', 'query_changes', 'delete_results',
+                 'increment_counters', 'read_counters'):
+        method = getattr(storage, call, None)
+        if method is not None:
+            setattr(storage, call, _timed(method, backend, call))
+    if hasattr(storage, 'query_results'):
+        storage.query_results = _timed_pages(storage.query_results, backend, 'query_results')
+    return storage
+
+
+def _timed(method, backend: str, call: str):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return method(*args, **kwargs)
+        except Exception:
+            STORAGE_ERRORS.inc(1, backend, call)
+            raise
+        finally:
+            _observe_storage(time.perf_counter() - start, backend, call)
+    return wrapper
+
+
+def _timed_pages(method, backend: str, call: str):
+    # a paged query is one fetch per page; time each of them
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        pages = method(*args, **kwargs)
+        while True:
+            start = time.perf_counter()
+            try:
+                page = next(pages)
+            except StopIteration:
+                _observe_storage(time.perf_counter() - start, backend, call)
+                return
+            except Exception:
+                STORAGE_ERRORS.inc(1, backend, call)
+                raise
+            _observe_storage(time.perf_counter() - start, backend, call)
+            yield page
+    return wrapper
+
+
+class _CountedBody:
+    """Response body that counts the bytes sent and reports when it is closed.
+
+    Closing it closes the wrapped body too. The server closes the body it was
+    given directly (direct_passthrough), and Response.close closes it
+    otherwise, so both kinds of streamed response are observed exactly once.
+    """
+
+    def __init__(self, body: Iterable, route: str, on_close: Callable[[], None]):
+        self.body = body
+        self.route = route
+        self.on_close = on_close
+
+    def __iter__(self):
+        for chunk in self.body:
+            RESPONSE_BYTES.inc(len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk), self.route)
+            yield chunk
+
+    def close(self) -> None:
+        on_close, self.on_close = self.on_close, None
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            if on_close is not None:
+                on_close()
+
+
+def init_app(app) -> None:
+    """Time every request and serve the registry on /metrics."""
+    from flask import Response, g, request
+
+    log_requests = os.environ.get('METRICS_LOG') == '1'
+
+    @app.before_request
+    def start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def record(response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        method = request.method
+        status = response.status_code
+
+        def observe():
+            seconds = time.perf_counter() - start
+            REQUEST_SECONDS.observe(seconds, route, method, status)
+            if log_requests:
+                # App Engine turns JSON lines on stdout into structured log entries
+                print(json.dumps({'severity': 'INFO', 'message': 'request', 'route': route, 'method': method,
+                                  'status': status, 'seconds': round(seconds, 6)}), flush=True)
+
+        # a streamed response is only done once the server closes it
+        if response.is_streamed:
+            response.response = _CountedBody(response.response, route, observe)
+        else:
+            observe()
+        return response
+
+    @app.route('/metrics')
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
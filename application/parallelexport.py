@@ -0,0 +1,133 @@
+"""Full export read as several testID ranges at once.
+
+A single query ordered by testID and testIndex fetches its pages one after
+the other, so the full export takes (number of pages) x (round trip). Here the
+testID keyspace is cut into small ranges that are dealt round robin to
+``concurrency`` threads. Each thread fetches its ranges in order, a few pages
+ahead of the reader, and the threads' streams are merged back into testID,
+testIndex order with a k-way merge.
+
+Dealing out small ranges instead of one big range per thread keeps every
+thread busy: the merge reads the ranges in key order, so a thread holding only
+the last quarter of the keyspace would sit on a full buffer until the other
+three were read.
+
+The ranges are cut at evenly spaced test IDs between the lowest test ID in
+the export and the highest one reserved so far, so each holds about the same
+number of tests. The ID counter is shared by every course year, so cutting
+from the first ID ever handed out would leave the current year's tests in
+the last few ranges. The first and the last range are open ended, which
+keeps testIDs outside the U-xxxx scheme in the export.
+"""
+
+import heapq
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterator, Optional
+
+from idalloc import alnum4, alnum4_number
+from storage import FIRST_ID
+
+# pages each thread may fetch ahead of the merge
+PREFETCH_PAGES = 4
+
+# ranges dealt to each thread
+RANGES_PER_THREAD = 4
+
+_DONE = object()
+
+
+def partition_bounds(last_id: int, partitions: int,
+                     first_id: int = FIRST_ID) -> list[tuple[Optional[str], Optional[str]]]:
+    """Return ``(start, end)`` testID ranges covering every testID, in order."""
+    span = max(last_id - first_id, 0)
+    cuts = sorted({alnum4(first_id + 1 + span * n // partitions) for n in range(1, partitions)})
+    edges = [None] + cuts + [None]
+    return list(zip(edges, edges[1:]))
+
+
+def lowest_id(storage, since: Optional[datetime] = None) -> int:
+    """Return the number of the lowest U-xxxx testID in the export, or FIRST_ID when there is none."""
+    pages = storage.query_results(since=since, page_size=1, start=alnum4(FIRST_ID + 1))
+    try:
+        page = next(iter(pages), [])
+    finally:
+        if hasattr(pages, 'close'):
+            pages.close()
+    number = alnum4_number(page[0]['testID']) if page else None
+    return number if number is not None else FIRST_ID
+
+
+def sort_key(record: dict) -> tuple[str, str]:
+    return record['testID'], record['testIndex']
+
+
+def _put(pages: queue.Queue, item, stop: threading.Event) -> bool:
+    # wait for room, but give up once the reader has gone away
+    while not stop.is_set():
+        try:
+            pages.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _fetch(storage, since, page_size, bounds, pages: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for start, end in bounds:
+            for page in storage.query_results(since=since, page_size=page_size, start=start, end=end):
+                if not _put(pages, page, stop):
+                    return
+    except Exception as error:
+        _put(pages, error, stop)
+        return
+    _put(pages, _DONE, stop)
+
+
+def _records(pages: queue.Queue) -> Iterator[dict]:
+    while True:
+        item = pages.get()
+        if item is _DONE:
+            return
+        if isinstance(item, Exception):
+            raise item
+        yield from item
+
+
+def parallel_query_results(storage, since: Optional[datetime] = None, page_size: int = 500,
+                           concurrency: int = 4) -> Iterator[list[dict]]:
+    """Yield the pages of the full export, ordered by testID and testIndex.
+
+    With ``concurrency`` 1 this is the plain serial query.
+    """
+    if concurrency <= 1:
+        yield from storage.query_results(since=since, page_size=page_size)
+        return
+
+    # the ranges start below the lowest test in the export, the first one is
+    # open ended anyway
+    bounds = partition_bounds(storage.last_id(), concurrency * RANGES_PER_THREAD,
+                              first_id=lowest_id(storage, since) - 1)
+    threads = min(concurrency, len(bounds))
+    stop = threading.Event()
+    queues = [queue.Queue(maxsize=PREFETCH_PAGES) for _ in range(threads)]
+    # one worker per stream: the merge needs the head of every stream, so no
+    # stream may wait for another one to finish
+    executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='export')
+    try:
+        for n, pages in enumerate(queues):
+            executor.submit(_fetch, storage, since, page_size, bounds[n::threads], pages, stop)
+        page = []
+        for record in heapq.merge(*(_records(pages) for pages in queues), key=sort_key):
+            page.append(record)
+            if len(page) == page_size:
+                yield page
+                page = []
+        if page:
+            yield page
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
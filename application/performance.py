@@ -0,0 +1,98 @@
+"""Performance per parameter set and level, from counters kept at ingest.
+
+Every stored result with a status adds to two rollup counters of its testSet
+and level: one for its status, and one for the elapsed_frames bucket it falls
+in. Summing them gives the attempts and the success, wrong and timeout rates;
+the bucket counts give elapsed-frame percentiles, interpolated within a bucket.
+Reading the summary costs the counters of a few hundred names, whatever the
+number of stored results.
+
+Counter names are ``perf:<testSet>|<level>|status:<status>`` and
+``perf:<testSet>|<level>|frames:<upper bound>``, the last bucket being
+``frames:inf``.
+"""
+
+from typing import Optional
+
+PREFIX = 'perf:'
+
+# upper bounds of the elapsed_frames buckets; the game runs at 60 frames a
+# second and a level times out after T4_COUNTDOWN (240-360) frames
+FRAME_BUCKETS = (10, 20, 30, 45, 60, 75, 90, 105, 120, 150, 180, 210, 240, 270, 300, 360, 420, 480, 600, 900)
+
+PERCENTILES = (50, 90, 99)
+
+# the statuses reported as rates even when none occurred
+RATE_STATUSES = ('correct', 'wrong', 'timeout')
+
+
+def frame_bucket(frames: int) -> str:
+    """Return the name of the bucket ``frames`` is counted in."""
+    for bound in FRAME_BUCKETS:
+        if frames <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def performance_keys(record: dict) -> list[str]:
+    """Return the performance counters one typed record adds to."""
+    if not record.get('status') or record.get('level') is None:
+        return []
+    prefix = f"{PREFIX}{record['testSet']}|{record['level']}|"
+    keys = [prefix + 'status:' + record['status']]
+    if record.get('elapsed_frames') is not None:
+        keys.append(prefix + 'frames:' + frame_bucket(record['elapsed_frames']))
+    return keys
+
+
+def percentile(buckets: dict[str, int], q: float) -> Optional[float]:
+    """Estimate the ``q``-th percentile from bucket counts by their upper bound."""
+    total = sum(buckets.values())
+    if not total:
+        return None
+    rank = q / 100 * total
+    seen, lower = 0, 0
+    for name, upper in [(str(bound), bound) for bound in FRAME_BUCKETS] + [('inf', None)]:
+        count = buckets.get(name, 0)
+        if count and seen + count >= rank:
+            # nothing is known about frames above the last bound
+            return float(lower) if upper is None else lower + (upper - lower) * (rank - seen) / count
+        seen += count
+        lower = upper if upper is not None else lower
+    return float(lower)
+
+
+def summarize(counters: dict[str, int]) -> dict:
+    """Turn perf: counters into {testSet: {level: summary}}."""
+    cells = {}
+    for name, value in counters.items():
+        if not name.startswith(PREFIX) or not value:
+            continue
+        try:
+            testSet, level, metric = name[len(PREFIX):].rsplit('|', 2)
+        except ValueError:
+            continue
+        kind, _, label = metric.partition(':')
+        cell = cells.setdefault(testSet, {}).setdefault(level, {'status': {}, 'frames': {}})
+        if kind in cell:
+            cell[kind][label] = cell[kind].get(label, 0) + value
+
+    summary = {}
+    for testSet in sorted(cells):
+        levels = {}
+        for level in sorted(cells[testSet], key=lambda level: (len(level), level)):
+            statuses, frames = cells[testSet][level]['status'], cells[testSet][level]['frames']
+            attempts = sum(statuses.values())
+            if not attempts:
+                continue
+            rates = {status: statuses.get(status, 0) / attempts for status in RATE_STATUSES}
+            rates.update({status: count / attempts for status, count in statuses.items()
+                          if status not in rates})
+            levels[level] = {
+                'attempts': attempts,
+                'rates': rates,
+                'elapsed_frames': {f'p{q}': percentile(frames, q) for q in PERCENTILES},
+            }
+        if levels:
+            summary[testSet] = levels
+    return summary
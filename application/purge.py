@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Delete testRecords older than the retention window.
+
+Housekeeping runs outside user requests: either from cron, which calls
+/tasks/purge in main.py, or from the command line:
+
+    DONALD_STORAGE=datastore python purge.py --days 365
+
+Records are deleted in batches of keys (delete_multi on Datastore) and every
+batch reports its progress; a batch that deleted records also invalidates the
+cached per-test exports. A run that stops early prints the cursor it got to;
+pass it back with --cursor to resume.
+
+Only the storage namespace of DONALD_NAMESPACE, or the one given with
+--namespace, is purged. A past course year is dropped as a whole with
+
+    python purge.py --namespace 2025 --all
+
+``--namespace __default__`` names the default namespace, where results were
+stored before namespaces were used.
+"""
+
+import argparse
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Optional
+
+from batchjob import BatchProgress, add_batch_arguments, print_resume_hint, run_batches
+from exportcache import PURGE_GENERATION
+
+
+@dataclass(kw_only=True)
+class PurgeProgress(BatchProgress):
+    before: datetime
+    deleted: int = 0
+
+    def as_dict(self) -> dict:
+        return {'before': self.before.isoformat(), 'deleted': self.deleted, **super().as_dict()}
+
+
+def retention_cutoff(days: int, now: Optional[datetime] = None) -> datetime:
+    """Return the moment before which records fall outside the retention window."""
+    return (now or datetime.now()) - timedelta(days=days)
+
+
+def retention_days() -> Optional[int]:
+    """Return RETENTION_DAYS from the environment; purging is off when unset."""
+    value = os.environ.get('RETENTION_DAYS')
+    return int(value) if value else None
+
+
+def purge(storage, before: datetime, batch_size: int = 500, cursor: Optional[str] = None,
+          time_budget: Optional[float] = None,
+          report: Optional[Callable[[PurgeProgress], None]] = None) -> PurgeProgress:
+    """Delete records older than ``before`` batch by batch.
+
+    Stops when nothing older is left or when ``time_budget`` seconds have
+    passed; the returned progress then carries the cursor to resume from.
+    """
+    progress = PurgeProgress(before=before, cursor=cursor)
+
+    def step(cursor: Optional[str]) -> Optional[str]:
+        deleted, cursor = storage.delete_results(before, limit=batch_size, cursor=cursor)
+        if deleted:
+            # cached exports and ETags may hold the deleted records
+            storage.increment_counters({PURGE_GENERATION: 1})
+        progress.deleted += deleted
+        return cursor
+
+    return run_batches(step, progress, time_budget, report)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description='Delete testRecords older than the retention window.')
+    parser.add_argument('--days', type=int, default=retention_days(),
+                        help='Retention window in days (default: RETENTION_DAYS).')
+    parser.add_argument('--namespace', default=None,
+                        help='Storage namespace to purge, __default__ for the default one '
+                             '(default: DONALD_NAMESPACE).')
+    parser.add_argument('--all', action='store_true',
+                        help='Delete every record of the namespace given with --namespace.')
+    add_batch_arguments(parser)
+    return parser.parse_args()
+
+
+def main() -> int:
+    args = parse_args()
+    if args.all and not args.namespace:
+        print('--all deletes a whole namespace, name it with --namespace')
+        return 1
+    if args.days is None and not args.all:
+        print('No retention window: pass --days or set RETENTION_DAYS')
+        return 1
+
+    from storage import get_storage, parse_namespace
+
+    try:
+        if args.namespace:
+            parse_namespace(args.namespace)
+    except ValueError as error:
+        print(error)
+        return 1
+    before = datetime.max if args.all else retention_cutoff(args.days)
+
+    def report(progress: PurgeProgress) -> None:
+        print(f'batch {progress.batches}: deleted {progress.deleted} so far')
+
+    progress = purge(get_storage(args.namespace), before, batch_size=args.batch_size,
+                     cursor=args.cursor, time_budget=args.time_budget, report=report)
+    if args.all:
+        print(f'deleted {progress.deleted} records of namespace {args.namespace}')
+    else:
+        print(f'deleted {progress.deleted} records older than {progress.before:%Y-%m-%d %H:%M:%S}')
+    print_resume_hint(progress)
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,166 @@
+"""Token bucket rate limits and load shedding for the public routes.
+
+Every limited route belongs to a group (the test page, ingest, the export).
+A group has a token bucket per client IP and one for the whole instance; a
+request takes a token from both or is refused with 429 and a Retry-After.
+Ingest is never shed, and the end-of-session /batch beacon is not limited
+either: it cannot see a refusal, so a refused beacon is a lost result.
+
+Independently, requests to routes that read a lot from storage are refused
+with 503 while storage is slow: once the moving average of storage call latency passes
+``threshold`` seconds. Storage calls made by requests that do get through
+keep the average current; if none are made for ``hold`` seconds the next
+requests are let through to measure again.
+
+Limits are configured per group as ``<per IP rate>:<burst>,<global rate>:<burst>``
+in RATE_LIMIT_<GROUP>, e.g. RATE_LIMIT_EXPORT=1:10,20:40. RATE_LIMITS=0
+turns limiting and shedding off.
+"""
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+import metrics
+
+
+class TokenBucket:
+    """``rate`` tokens per second, holding at most ``burst``."""
+
+    def __init__(self, rate: float, burst: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self.tokens = burst
+        self.updated = clock()
+
+    def take(self) -> float:
+        """Take a token; return 0, or the seconds until one is available."""
+        now = self.clock()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+@dataclass(frozen=True)
+class Limit:
+    per_ip_rate: float
+    per_ip_burst: float
+    total_rate: float
+    total_burst: float
+
+    @classmethod
+    def parse(cls, text: str) -> 'Limit':
+        """Parse ``<per IP rate>:<burst>,<global rate>:<burst>``."""
+        per_ip, total = text.split(',')
+        per_ip_rate, per_ip_burst = per_ip.split(':')
+        total_rate, total_burst = total.split(':')
+        return cls(float(per_ip_rate), float(per_ip_burst), float(total_rate), float(total_burst))
+
+
+# a lecture of 300 students often plays from behind one university NAT
+# address and loads the page and a test ID within a minute, so the per IP
+# page burst holds a few lecture halls. The ingest burst holds ten results
+# of every student of such a lecture at once, and its rate a result every
+# six seconds each, which still bounds one address flooding POST /. The
+# export burst lets the whole lecture download its results at once.
+DEFAULT_LIMITS = {
+    'page': Limit(20, 1000, 200, 2000),
+    'ingest': Limit(50, 3000, 500, 5000),
+    'export': Limit(5, 400, 50, 800),
+}
+
+
+def limits_from_env(defaults: dict[str, Limit] = DEFAULT_LIMITS) -> dict[str, Limit]:
+    return {group: Limit.parse(os.environ[f'RATE_LIMIT_{group.upper()}'])
+            if f'RATE_LIMIT_{group.upper()}' in os.environ else limit
+            for group, limit in defaults.items()}
+
+
+class RateLimiter:
+    """Per client and global token buckets for one group of routes."""
+
+    def __init__(self, limit: Limit, max_clients: int = 10000, clock: Callable[[], float] = time.monotonic):
+        self.limit = limit
+        self.max_clients = max_clients
+        self.clock = clock
+        self.total = TokenBucket(limit.total_rate, limit.total_burst, clock)
+        self._clients = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, client: str) -> float:
+        """Take a token for ``client``; return 0, or the seconds to wait."""
+        with self._lock:
+            bucket = self._clients.pop(client, None)
+            if bucket is None:
+                bucket = TokenBucket(self.limit.per_ip_rate, self.limit.per_ip_burst, self.clock)
+            # least recently seen clients are forgotten first, a forgotten
+            # client simply starts again with a full bucket
+            self._clients[client] = bucket
+            if len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            wait = bucket.take()
+            if wait:
+                return wait
+            return self.total.take()
+
+
+class LoadShedder:
+    """Track storage latency and tell when requests should be shed."""
+
+    def __init__(self, threshold: float = 1.0, hold: float = 5.0, weight: float = 0.2,
+                 clock: Callable[[], float] = time.monotonic):
+        self.threshold = threshold
+        self.hold = hold
+        self.weight = weight
+        self.clock = clock
+        self.average = 0.0
+        self.observed = clock()
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self.average += self.weight * (seconds - self.average)
+            self.observed = self.clock()
+
+    def overloaded(self) -> bool:
+        return self.average > self.threshold and self.clock() - self.observed < self.hold
+
+
+def client_address(request) -> str:
+    # App Engine puts the client address in this header and strips it from
+    # incoming requests; elsewhere the peer address is all there is
+    return request.headers.get('X-Appengine-User-IP') or request.remote_addr or 'unknown'
+
+
+def init_app(app, groups: dict[tuple[str, str], str], shed: set[str],
+             limits: Optional[dict[str, Limit]] = None, shedder: Optional[LoadShedder] = None) -> None:
+    """Limit the routes in ``groups``, {(endpoint, method): group}, and shed ``shed`` endpoints."""
+    from flask import request
+
+    limits = limits or limits_from_env()
+    limiters = {group: RateLimiter(limit) for group, limit in limits.items()}
+    if shedder is not None:
+        metrics.STORAGE_LISTENERS.append(shedder.observe)
+
+    @app.before_request
+    def limit_request():
+        if not app.config.get('RATE_LIMITS', True):
+            return None
+        group = groups.get((request.endpoint, request.method))
+        if shedder is not None and request.endpoint in shed and shedder.overloaded():
+            metrics.REQUESTS_REFUSED.inc(1, group or request.endpoint, 'overloaded')
+            return 'overloaded, try again', 503, {'Retry-After': str(int(shedder.hold))}
+        if group is None:
+            return None
+        wait = limiters[group].check(client_address(request))
+        if wait:
+            metrics.REQUESTS_REFUSED.inc(1, group, 'rate_limited')
+            return 'too many requests', 429, {'Retry-After': str(max(1, round(wait)))}
+        return None
@@ -0,0 +1,148 @@
+"""Parse posted result lines into typed record properties.
+
+postResults() in static/donald_2021.js posts one tab-separated line per
+attempt. Over the course years the questionnaire grew, so a line has 14, 17,
+18 or 20 fields; the server appends the receive time as dtstamp. This mirrors
+the layouts handled by data/collate_post_data.py.
+"""
+
+from datetime import datetime
+from typing import Optional
+
+TIMESTAMP_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+# testID, testCounter and testSet make up the stored name of a result and are
+# indexed, and Datastore refuses names and indexed values over 1500 bytes.
+# Real ones are a few characters long.
+MAX_KEY_FIELD_BYTES = 200
+
+# column names of the collated export, see data/collate_post_data.py
+CANONICAL_SCHEMA = [
+    "testID",
+    "testCounter",
+    "testPARAMS",
+    "T0_IDLE",
+    "T1_WARN",
+    "T2_SHOWTEST",
+    "T3_DECAY",
+    "T4_COUNTDOWN",
+    "requested_sequence",
+    "recorded_sequence",
+    "status",
+    "elapsed_frames",
+    "remaining_levels",
+    "window_size",
+    "age",
+    "hours_awake",
+    "substance_use",
+    "colorblind",
+    "instructions",
+    "experience",
+    "dtstamp",
+]
+
+# typed properties stored next to testID, testIndex, testSet, timeStamp and the
+# raw 'value' line, with their python type
+TYPED_FIELDS = {
+    'T0_IDLE': int,
+    'T1_WARN': int,
+    'T2_SHOWTEST': int,
+    'T3_DECAY': int,
+    'T4_COUNTDOWN': int,
+    'requested_sequence': str,
+    'recorded_sequence': str,
+    'status': str,
+    'elapsed_frames': int,
+    'remaining_levels': int,
+    'level': int,
+    'window_size': str,
+    'window_width': int,
+    'window_height': int,
+    'age': int,
+    'hours_awake': int,
+    'substance_use': str,
+    'colorblind': str,
+    'instructions': str,
+    'experience': str,
+}
+
+QUESTIONNAIRE = {
+    14: [],
+    17: ['age', 'hours_awake', 'substance_use'],
+    18: ['age', 'hours_awake', 'substance_use', 'colorblind'],
+    20: ['age', 'hours_awake', 'substance_use', 'colorblind', 'instructions', 'experience'],
+}
+
+
+def to_int(text: str) -> Optional[int]:
+    """Return ``text`` as an int, or None when it is empty or not a number."""
+    try:
+        return int(text.strip())
+    except (AttributeError, ValueError):
+        return None
+
+
+def parse_result(text: str, timeStamp: datetime) -> dict:
+    """Turn one posted result line into a record.
+
+    The raw line, with the receive time appended, is kept in 'value' for
+    audit and for the tab-separated export. Raises ValueError for a line
+    storage could not take.
+    """
+    fields = text.split('\t')
+    if len(fields) < 3:
+        raise ValueError(f"result line has {len(fields)} fields, expected at least 3")
+    for name, field in zip(('testID', 'testCounter', 'testSet'), fields):
+        if len(field.encode('utf-8')) > MAX_KEY_FIELD_BYTES:
+            raise ValueError(f"{name} is longer than {MAX_KEY_FIELD_BYTES} bytes")
+
+    record = dict.fromkeys(TYPED_FIELDS)
+    record.update({
+        'testID': fields[0],
+        'testIndex': fields[1],
+        'testSet': fields[2],
+        'timeStamp': timeStamp,
+        'value': text + timeStamp.strftime('\t' + TIMESTAMP_FORMAT),
+    })
+    if len(fields) < 14:
+        return record
+
+    for name, field in zip(('T0_IDLE', 'T1_WARN', 'T2_SHOWTEST', 'T3_DECAY', 'T4_COUNTDOWN'), fields[3:8]):
+        record[name] = to_int(field)
+    record['requested_sequence'] = fields[8]
+    record['recorded_sequence'] = fields[9]
+    record['status'] = fields[10]
+    record['elapsed_frames'] = to_int(fields[11])
+    record['remaining_levels'] = to_int(fields[12])
+    # the level played is the length of the requested sequence, e.g. '3,0,1'
+    record['level'] = len(fields[8].split(',')) if fields[8] else 0
+    record['window_size'] = fields[13]
+    width, _, height = fields[13].partition('x')
+    record['window_width'] = to_int(width)
+    record['window_height'] = to_int(height)
+
+    for name, field in zip(QUESTIONNAIRE.get(len(fields), []), fields[14:]):
+        record[name] = to_int(field) if TYPED_FIELDS[name] is int else field
+    return record
+
+
+def typed_record(record: dict) -> dict:
+    """Return ``record`` with typed properties, parsing 'value' for old records.
+
+    Records stored before ingest parsed the line only carry the raw 'value'.
+    """
+    if 'status' in record:
+        return record
+    line = record['value'].rsplit('\t', 1)[0]
+    return parse_result(line, record['timeStamp'])
+
+
+def canonical_row(record: dict) -> dict:
+    """Map a record onto CANONICAL_SCHEMA with typed values."""
+    record = typed_record(record)
+    row = {name: record.get(name) for name in CANONICAL_SCHEMA}
+    row['testID'] = record['testID']
+    row['testCounter'] = to_int(record['testIndex'])
+    row['testPARAMS'] = record['testSet']
+    row['dtstamp'] = record['timeStamp']
+    return row
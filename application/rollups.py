@@ -0,0 +1,145 @@
+"""Result counts maintained at ingest time.
+
+Counting testRecords by fetching them all is too slow for the /query page, so
+every stored batch adds to in-memory counters (total, per testSet, per status
+and per day). These are added to the storage counters at most every
+``interval`` seconds and when the instance shuts down, so reading them costs a
+handful of small entities whatever the number of records.
+
+Counter names are ``total`` and ``<dimension>:<value>``, e.g. ``status:wrong``,
+plus the ``perf:`` counters per testSet and level of performance.py.
+
+Counters only cover records stored after they were introduced; run
+``python rollups.py --backfill`` once to count the records already stored.
+"""
+
+import argparse
+import atexit
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import date, timedelta
+
+from performance import performance_keys
+from records import typed_record
+from storage.base import COUNTER_BATCH
+
+logger = logging.getLogger(__name__)
+
+DIMENSIONS = ('testSet', 'status', 'day')
+
+# days of 'day:' counters /query shows, the most recent ones
+QUERY_DAYS = 7
+
+
+def query_prefixes(today: date, days: int = QUERY_DAYS) -> tuple[str, ...]:
+    """Return the counter prefixes /query reads: every testSet and status, and the last ``days`` days.
+
+    A day counter exists for every day results came in, so reading them all
+    would get slower every day.
+    """
+    return ('total', 'testSet:', 'status:') + tuple(
+        f'day:{today - timedelta(days=n):%Y-%m-%d}' for n in reversed(range(days)))
+
+
+def rollup_keys(record: dict) -> list[str]:
+    """Return the names of the counters one record adds to."""
+    keys = ['total', 'testSet:' + record['testSet'], 'day:' + record['timeStamp'].strftime('%Y-%m-%d')]
+    if record.get('status'):
+        keys.append('status:' + record['status'])
+    return keys + performance_keys(record)
+
+
+def split_counters(counters: dict[str, int]) -> dict:
+    """Group flat counter names into {'total': n, 'testSet': {...}, ...}."""
+    summary = {'total': counters.get('total', 0)}
+    for dimension in DIMENSIONS:
+        prefix = dimension + ':'
+        summary[dimension] = dict(sorted((name[len(prefix):], value)
+                                         for name, value in counters.items() if name.startswith(prefix)))
+    return summary
+
+
+class Rollups:
+    """Aggregate counter increments in memory and add them to storage periodically."""
+
+    def __init__(self, storage, interval: float = 10.0):
+        self.storage = storage
+        self.interval = interval
+        self._pending = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+        atexit.register(self.flush)
+
+    def add(self, records: list[dict]) -> None:
+        """Count stored records and flush when the interval has passed."""
+        with self._lock:
+            for record in records:
+                self._pending.update(rollup_keys(record))
+        if time.monotonic() - self._last_flush >= self.interval:
+            self.flush()
+
+    def increment(self, deltas: dict[str, int]) -> None:
+        """Add to named counters other than the record dimensions."""
+        with self._lock:
+            self._pending.update({name: delta for name, delta in deltas.items() if delta})
+
+    def flush(self) -> None:
+        """Add the pending increments to the storage counters."""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        for batch in counter_batches(pending):
+            try:
+                self.storage.increment_counters(batch)
+            except Exception:
+                logger.exception('could not flush %d counters, keeping them for the next flush', len(batch))
+                with self._lock:
+                    self._pending.update(batch)
+
+    def counters(self, prefix: str = '') -> dict[str, int]:
+        """Return stored counters plus this instance's pending increments."""
+        counters = Counter(self.storage.read_counters(prefix))
+        with self._lock:
+            counters.update({name: value for name, value in self._pending.items() if name.startswith(prefix)})
+        return dict(counters)
+
+
+def counter_batches(counters: dict[str, int]) -> list[dict[str, int]]:
+    """Split ``counters`` into increments that are each written in one go."""
+    names = list(counters)
+    return [{name: counters[name] for name in names[start:start + COUNTER_BATCH]}
+            for start in range(0, len(names), COUNTER_BATCH)]
+
+
+def backfill(storage, page_size: int = 500) -> int:
+    """Count every stored record into the counters; run once, on empty counters."""
+    pending = Counter()
+    total = 0
+    for page in storage.query_results(page_size=page_size):
+        for record in page:
+            pending.update(rollup_keys(typed_record(record)))
+        total += len(page)
+        for batch in counter_batches(pending):
+            storage.increment_counters(batch)
+        pending.clear()
+    return total
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Maintain the result counters.')
+    parser.add_argument('--backfill', action='store_true',
+                        help='Count all stored records into the (empty) counters.')
+    args = parser.parse_args()
+    if not args.backfill:
+        parser.print_help()
+        return 1
+
+    from storage import get_storage
+    print(f'counted {backfill(get_storage())} records')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
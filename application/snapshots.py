@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""Precomputed snapshots of the full allResults.txt export.
+
+Building the full export means a sorted query over every testRecord. Instead
+a cron job (or this script) periodically writes the export into a gzip file on
+blob storage, and /q serves that file followed by a small delta: the records
+stored after the snapshot's watermark.
+
+Only records stored more than ``margin`` seconds before it go into a snapshot,
+so results being stored while it was built always end up in the delta
+instead of getting lost between the two. The delta is read in storedAt order
+and streamed after the snapshot; only a Range request, which needs the length
+up front, reads it whole first.
+
+SNAPSHOT_STORE selects where snapshots live: ``gs://<bucket>`` for Cloud
+Storage or a local directory (a stand-in for tests and single instances).
+Without it /q streams the live query as before. Each storage namespace has
+its snapshots in a folder of its own. Saving a snapshot deletes all but the
+one it replaces, which downloads may still be reading.
+
+    SNAPSHOT_STORE=/tmp/snapshots python snapshots.py
+"""
+
+import argparse
+import gzip
+import io
+import json
+import os
+import shutil
+import tempfile
+import zlib
+from datetime import datetime, timedelta
+from typing import BinaryIO, Iterable, Iterator, Optional
+
+from records import TIMESTAMP_FORMAT
+from storage import stored_at
+
+CHUNK_SIZE = 64 * 1024
+LATEST = 'latest.json'
+SNAPSHOT_PREFIX = 'allResults-'
+SNAPSHOT_SUFFIX = '.txt.gz'
+
+
+def stale_snapshots(names: Iterable[str], meta: dict, replaced: Optional[dict]) -> list[str]:
+    """Return the snapshots among ``names`` that neither ``meta`` nor the ``replaced`` one is."""
+    keep = {meta['name']} | ({replaced['name']} if replaced else set())
+    return [name for name in names
+            if name.startswith(SNAPSHOT_PREFIX) and name.endswith(SNAPSHOT_SUFFIX) and name not in keep]
+
+
+class LocalSnapshotStore:
+    """Snapshots as files in a local directory."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def latest(self) -> Optional[dict]:
+        try:
+            with open(os.path.join(self.directory, LATEST), encoding='utf-8') as handle:
+                return json.load(handle)
+        except FileNotFoundError:
+            return None
+
+    def open(self, name: str) -> BinaryIO:
+        return open(os.path.join(self.directory, name), 'rb')
+
+    def save(self, path: str, meta: dict) -> None:
+        replaced = self.latest()
+        shutil.copyfile(path, os.path.join(self.directory, meta['name']))
+        # the pointer is replaced atomically, readers never see half a snapshot
+        pointer = os.path.join(self.directory, LATEST + '.tmp')
+        with open(pointer, 'w', encoding='utf-8') as handle:
+            json.dump(meta, handle)
+        os.replace(pointer, os.path.join(self.directory, LATEST))
+        for name in stale_snapshots(os.listdir(self.directory), meta, replaced):
+            try:
+                os.unlink(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                pass
+
+
+class GCSSnapshotStore:
+    """Snapshots as objects in a Cloud Storage bucket, the store to use on App Engine."""
+
+    def __init__(self, bucket: str, prefix: str = 'snapshots/'):
+        self.bucket_name = bucket
+        self.prefix = prefix
+        self._bucket = None
+
+    @property
+    def bucket(self):
+        # the client is created on first use, not while the app starts
+        if self._bucket is None:
+            from google.cloud import storage as gcs
+            self._bucket = gcs.Client().bucket(self.bucket_name)
+        return self._bucket
+
+    def latest(self) -> Optional[dict]:
+        blob = self.bucket.blob(self.prefix + LATEST)
+        if not blob.exists():
+            return None
+        return json.loads(blob.download_as_bytes())
+
+    def open(self, name: str) -> BinaryIO:
+        return self.bucket.blob(self.prefix + name).open('rb')
+
+    def save(self, path: str, meta: dict) -> None:
+        replaced = self.latest()
+        self.bucket.blob(self.prefix + meta['name']).upload_from_filename(path, content_type='application/gzip')
+        self.bucket.blob(self.prefix + LATEST).upload_from_string(json.dumps(meta),
+                                                                  content_type='application/json')
+        # the delimiter leaves out the folders of other namespaces below the prefix
+        names = [blob.name[len(self.prefix):]
+                 for blob in self.bucket.list_blobs(prefix=self.prefix, delimiter='/')]
+        from google.api_core import exceptions
+        for name in stale_snapshots(names, meta, replaced):
+            try:
+                self.bucket.blob(self.prefix + name).delete()
+            except exceptions.NotFound:
+                # an overlapping run deleted it first
+                pass
+
+
+def get_snapshot_store(namespace: Optional[str] = None):
+    """Return the store configured in SNAPSHOT_STORE for ``namespace``, or None when unset."""
+    location = os.environ.get('SNAPSHOT_STORE')
+    if not location:
+        return None
+    if location.startswith('gs://'):
+        return GCSSnapshotStore(location[len('gs://'):], f'snapshots/{namespace}/' if namespace else 'snapshots/')
+    return LocalSnapshotStore(os.path.join(location, namespace) if namespace else location)
+
+
+def export_lines(records: Iterable[dict]) -> bytes:
+    return ''.join(record['value'] + '\n' for record in records).encode('utf-8')
+
+
+def build_snapshot(storage, store, since: Optional[datetime] = None, margin: float = 300,
+                   now: Optional[datetime] = None) -> dict:
+    """Write the full export up to the watermark into a new snapshot."""
+    watermark = (now or datetime.now()) - timedelta(seconds=margin)
+    name = watermark.strftime(f'{SNAPSHOT_PREFIX}%Y%m%dT%H%M%S%f{SNAPSHOT_SUFFIX}')
+    records = 0
+    with tempfile.NamedTemporaryFile(suffix='.gz', delete=False) as handle:
+        path = handle.name
+        with gzip.GzipFile(fileobj=handle, mode='wb', mtime=0) as compressed:
+            for page in storage.query_results(since=since, page_size=500):
+                page = [record for record in page if stored_at(record) <= watermark]
+                compressed.write(export_lines(page))
+                records += len(page)
+    try:
+        meta = {'name': name, 'watermark': watermark.strftime(TIMESTAMP_FORMAT),
+                'records': records, 'size': os.path.getsize(path)}
+        store.save(path, meta)
+    finally:
+        os.unlink(path)
+    return meta
+
+
+def delta_pages(storage, meta: dict, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                page_size: int = 1000) -> Iterator[list[dict]]:
+    """Yield the records stored after the snapshot's watermark, in storedAt order.
+
+    The delta is a range on storedAt read a page at a time, so its cost
+    follows the number of new records, not the number of stored ones.
+    """
+    after = datetime.strptime(meta['watermark'], TIMESTAMP_FORMAT)
+    # nothing received from ``since`` on was stored before it
+    if since and since - timedelta(microseconds=1) > after:
+        after = since - timedelta(microseconds=1)
+    until = until or datetime.now()
+    cursor = None
+    while True:
+        records, cursor = storage.query_changes(after, until, limit=page_size, cursor=cursor)
+        if since:
+            # replayed results may have been received before it
+            records = [record for record in records if record['timeStamp'] >= since]
+        if records:
+            yield records
+        if cursor is None:
+            return
+
+
+def gzip_member(pages: Iterable[list[dict]]) -> Iterator[bytes]:
+    """Compress the export lines of ``pages`` as one gzip member, chunk by chunk."""
+    # wbits=31 writes the gzip header and trailer; mtime stays 0
+    deflate = zlib.compressobj(9, zlib.DEFLATED, 31)
+    for page in pages:
+        chunk = deflate.compress(export_lines(page))
+        if chunk:
+            yield chunk
+    yield deflate.flush()
+
+
+def stream_export(store, meta: dict, pages: Iterable[list[dict]], compressed: bool) -> Iterator[bytes]:
+    """Yield the snapshot followed by the delta ``pages``, as gzip members or as plain text."""
+    # opened on the first chunk, so a response that is never sent leaks nothing
+    snapshot = store.open(meta['name'])
+    if not compressed:
+        yield from iter_decompressed(snapshot)
+        for page in pages:
+            yield export_lines(page)
+        return
+    try:
+        while True:
+            chunk = snapshot.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        snapshot.close()
+    yield from gzip_member(pages)
+
+
+class ConcatenatedBody:
+    """Seekable, chunk-iterable body made of a snapshot file and a delta."""
+
+    def __init__(self, snapshot: BinaryIO, snapshot_size: int, delta: bytes):
+        self.parts = [(snapshot, snapshot_size), (io.BytesIO(delta), len(delta))]
+        self.length = snapshot_size + len(delta)
+        self.position = 0
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self.position
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        self.position = offset if whence == io.SEEK_SET else self.position + offset
+        return self.position
+
+    def read(self, size: int = -1) -> bytes:
+        if size is None or size < 0:
+            size = self.length - self.position
+        chunks = []
+        offset = self.position
+        for stream, part_size in self.parts:
+            if size <= 0:
+                break
+            if offset < part_size:
+                stream.seek(offset)
+                chunk = stream.read(min(size, part_size - offset))
+                chunks.append(chunk)
+                size -= len(chunk)
+                offset = 0
+            else:
+                offset -= part_size
+        data = b''.join(chunks)
+        self.position += len(data)
+        return data
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> bytes:
+        chunk = self.read(CHUNK_SIZE)
+        if not chunk:
+            raise StopIteration
+        return chunk
+
+    def close(self) -> None:
+        for stream, _ in self.parts:
+            stream.close()
+
+
+def iter_decompressed(body: BinaryIO) -> Iterable[bytes]:
+    """Stream the plain text of a gzip body, which may be made of several members, and close it."""
+    try:
+        with gzip.GzipFile(fileobj=body, mode='rb') as plain:
+            while True:
+                chunk = plain.read(CHUNK_SIZE)
+                if not chunk:
+                    return
+                yield chunk
+    finally:
+        body.close()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Build a snapshot of the full export.')
+    parser.add_argument('--since', type=datetime.fromisoformat, default=None,
+                        help='Only include records from this date on (default: all).')
+    parser.add_argument('--margin', type=float, default=300,
+                        help='Leave records younger than this many seconds to the delta.')
+    args = parser.parse_args()
+
+    from storage import get_storage, namespace_from_env
+
+    store = get_snapshot_store(namespace_from_env())
+    if store is None:
+        print('SNAPSHOT_STORE is not set')
+        return 1
+    meta = build_snapshot(get_storage(), store, since=args.since, margin=args.margin)
+    print(f"wrote {meta['name']}: {meta['records']} records, {meta['size']} bytes")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
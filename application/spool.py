@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""Durable spool for incoming test results.
+
+With SPOOL_DIR set, POST / and /batch append their results to a spool file of
+this instance and answer as soon as the append is on disk. A background thread
+drains the spool into storage with ``flush``, retrying with backoff while
+storage fails, so a slow or erroring backend neither blocks requests nor loses
+results. A batch that still fails after ``max_attempts`` is stored record by
+record. When some of its records go in, the ones that fail on their own are
+moved to a dead-letter file (``dead-<instance>.log``) so one bad record
+cannot hold up the rest. When none go in, storage is down rather than the
+records bad: the batch stays in the spool and is tried again, together with
+what was appended meanwhile.
+
+Results keep the time they were received, however late they are drained or
+replayed: the feed and the snapshot deltas read records by their storedAt,
+the time ingest stored them, so late results are not skipped.
+
+Appends are fsynced in groups: a writer waits at most ``sync_interval`` for
+others to join before one fsync covers them all. Every segment file has an
+``.offset`` file next to it holding how far it has been stored. The offset is
+only moved after ``flush`` returned, so after a crash a batch may be stored a
+second time; ingest keys results by testID and testCounter, which turns such a
+replay into skipped duplicates, so each result ends up stored once.
+
+Segments of an instance that died and dead-letter files are left in the
+directory. Replay them with
+
+    SPOOL_DIR=/var/spool/donald python spool.py
+
+while no running instance uses that directory. On App Engine standard the
+only writable directory, /tmp, lives in memory: there the spool protects
+against a failing backend and process restarts, not against losing the
+instance.
+"""
+
+import argparse
+import atexit
+import json
+import logging
+import os
+import queue
+import socket
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Optional
+
+from records import TIMESTAMP_FORMAT, parse_result
+
+logger = logging.getLogger(__name__)
+
+SUFFIX = '.log'
+OFFSET_SUFFIX = '.offset'
+DEAD_LETTER_PREFIX = 'dead-'
+
+
+def encode(record: dict) -> bytes:
+    # 'value' is the posted line plus the receive time, all parse_result needs
+    return (json.dumps(record['value']) + '\n').encode('utf-8')
+
+
+def decode(line: bytes) -> dict:
+    text, stamp = json.loads(line).rsplit('\t', 1)
+    return parse_result(text, datetime.strptime(stamp, TIMESTAMP_FORMAT))
+
+
+def read_offset(segment: str) -> int:
+    try:
+        with open(segment + OFFSET_SUFFIX, encoding='ascii') as handle:
+            return int(handle.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_offset(segment: str, offset: int) -> None:
+    temporary = segment + OFFSET_SUFFIX + '.tmp'
+    with open(temporary, 'w', encoding='ascii') as handle:
+        handle.write(str(offset))
+        handle.flush()
+        os.fsync(handle.fileno())
+    os.replace(temporary, segment + OFFSET_SUFFIX)
+
+
+def segments(directory: str, prefix: str = '') -> list[str]:
+    """Return the spool segments in ``directory`` whose name starts with ``prefix``, oldest first."""
+    names = sorted(name for name in os.listdir(directory) if name.startswith(prefix) and name.endswith(SUFFIX))
+    return [os.path.join(directory, name) for name in names]
+
+
+def read_batch(segment: str, offset: int, max_records: int) -> tuple[list[bytes], int]:
+    """Return up to ``max_records`` complete lines from ``offset`` and the offset after them."""
+    with open(segment, 'rb') as handle:
+        handle.seek(offset)
+        lines = []
+        while len(lines) < max_records:
+            line = handle.readline()
+            # an unterminated last line is still being written, or was torn by
+            # a crash before its append was acknowledged
+            if not line.endswith(b'\n'):
+                break
+            lines.append(line)
+            offset += len(line)
+    return lines, offset
+
+
+def drain_segment(segment: str, flush: Callable[[list], None], max_batch: int = 100) -> int:
+    """Store everything left in ``segment``; return the number of results stored."""
+    offset = read_offset(segment)
+    stored = 0
+    while True:
+        lines, end = read_batch(segment, offset, max_batch)
+        if not lines:
+            return stored
+        flush(decode_lines(lines))
+        write_offset(segment, end)
+        offset = end
+        stored += len(lines)
+
+
+def decode_lines(lines: list[bytes]) -> list[dict]:
+    records = []
+    for line in lines:
+        try:
+            records.append(decode(line))
+        except ValueError:
+            logger.error('skipping unreadable spool line %r', line[:200])
+    return records
+
+
+def remove_segment(segment: str) -> None:
+    for path in (segment, segment + OFFSET_SUFFIX):
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+def instance_name() -> str:
+    return f"{os.environ.get('GAE_INSTANCE', socket.gethostname())[-16:]}-{os.getpid()}"
+
+
+class Spool:
+    """Append results to fsynced segment files and drain them into storage."""
+
+    def __init__(self, directory: str, flush: Callable[[list], None], max_batch: int = 100,
+                 sync_interval: float = 0.005, max_segment_bytes: int = 16 * 1024 * 1024,
+                 max_backlog_bytes: int = 256 * 1024 * 1024, max_retry_delay: float = 30.0,
+                 max_attempts: int = 20, name: Optional[str] = None):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.flush = flush
+        self.max_batch = max_batch
+        self.sync_interval = sync_interval
+        self.max_segment_bytes = max_segment_bytes
+        self.max_backlog_bytes = max_backlog_bytes
+        self.max_retry_delay = max_retry_delay
+        self.max_attempts = max_attempts
+        self.prefix = f'spool-{name or instance_name()}-'
+        self.dead_letter = os.path.join(directory, f'{DEAD_LETTER_PREFIX}{name or instance_name()}{SUFFIX}')
+        self._lock = threading.Condition()
+        self._segment_number = 0
+        self._segment, self._fd = self._open_segment()
+        self._segment_bytes = 0
+        # bytes appended, fsynced and stored, over all segments of this spool
+        self._appended = 0
+        self._synced = 0
+        self._stored = 0
+        self._threads = []
+        self._stopping = False
+        self._stopped = threading.Event()
+        self._wake_drain = threading.Event()
+        self.counters = {
+            'queued': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'batches': 0,
+            'failed': 0,
+            'retries': 0,
+            'dead_lettered': 0,
+            'fsyncs': 0,
+            'flush_seconds_total': 0.0,
+            'flush_seconds_last': 0.0,
+            'flush_seconds_max': 0.0,
+        }
+
+    def submit(self, record: dict) -> None:
+        """Append one record and return once it is on disk."""
+        self.submit_many([record])
+
+    def submit_many(self, records: list[dict]) -> None:
+        """Append records and return once they are on disk.
+
+        Raises ``queue.Full`` when more than ``max_backlog_bytes`` are waiting
+        to be stored.
+        """
+        data = b''.join(encode(record) for record in records)
+        self._ensure_started()
+        with self._lock:
+            if self._appended - self._stored + len(data) > self.max_backlog_bytes:
+                self.counters['rejected'] += len(records)
+                raise queue.Full
+            os.write(self._fd, data)
+            self._segment_bytes += len(data)
+            self._appended += len(data)
+            target = self._appended
+            self.counters['queued'] += len(records)
+            self._lock.notify_all()
+            while self._synced < target:
+                self._lock.wait()
+        self._wake_drain.set()
+
+    def stats(self) -> dict:
+        return dict(self.counters, queue_depth=self.counters['queued'] - self.counters['flushed'])
+
+    def join(self, timeout: float = 30.0) -> None:
+        """Block until everything appended so far has been stored."""
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            while self.counters['flushed'] < self.counters['queued'] and time.monotonic() < deadline:
+                self._lock.wait(0.05)
+
+    def close(self) -> None:
+        """Stop the threads; whatever could not be stored stays in the spool."""
+        with self._lock:
+            if self._fd is None:
+                return
+            self._stopping = True
+            self._lock.notify_all()
+        self._stopped.set()
+        self._wake_drain.set()
+        for thread in self._threads:
+            thread.join()
+        with self._lock:
+            os.fsync(self._fd)
+            os.close(self._fd)
+            self._fd = None
+
+    def _open_segment(self) -> tuple[str, int]:
+        self._segment_number += 1
+        path = os.path.join(self.directory, f'{self.prefix}{self._segment_number:06d}{SUFFIX}')
+        return path, os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+
+    def _ensure_started(self) -> None:
+        # started lazily so forking servers do not inherit dead threads
+        if self._threads:
+            return
+        with self._lock:
+            if not self._threads and not self._stopping:
+                self._threads = [threading.Thread(target=self._sync_loop, name='spool-sync', daemon=True),
+                                 threading.Thread(target=self._drain_loop, name='spool-drain', daemon=True)]
+                for thread in self._threads:
+                    thread.start()
+                atexit.register(self.close)
+
+    def _sync_loop(self) -> None:
+        while True:
+            with self._lock:
+                while self._synced == self._appended and not self._stopping:
+                    self._lock.wait()
+                if self._stopping and self._synced == self._appended:
+                    return
+            # let concurrent appends join this fsync
+            time.sleep(self.sync_interval)
+            with self._lock:
+                fd, target = self._fd, self._appended
+            os.fsync(fd)
+            with self._lock:
+                self.counters['fsyncs'] += 1
+                self._synced = max(self._synced, target)
+                if self._segment_bytes >= self.max_segment_bytes:
+                    self._rotate()
+                self._lock.notify_all()
+
+    def _rotate(self) -> None:
+        # called with the lock held and everything appended so far synced
+        old = self._fd
+        self._segment, self._fd = self._open_segment()
+        self._segment_bytes = 0
+        os.fsync(old)
+        os.close(old)
+
+    def _drain_loop(self) -> None:
+        while True:
+            stored = self._drain_once()
+            if self._stopping and not stored:
+                return
+            if not stored:
+                self._wake_drain.wait(0.2)
+                self._wake_drain.clear()
+
+    def _drain_once(self) -> int:
+        stored = 0
+        for segment in segments(self.directory, self.prefix):
+            offset = read_offset(segment)
+            lines, end = read_batch(segment, offset, self.max_batch)
+            if lines:
+                if not self._store(lines):
+                    return stored
+                write_offset(segment, end)
+                stored += len(lines)
+                with self._lock:
+                    self._stored += end - offset
+                    self.counters['flushed'] += len(lines)
+                    self._lock.notify_all()
+                return stored
+            with self._lock:
+                active = segment == self._segment
+            if not active:
+                remove_segment(segment)
+        return stored
+
+    def _store(self, lines: list[bytes]) -> bool:
+        """Store a batch of spooled lines, or set aside the ones storage refuses; False when left in the spool."""
+        records = decode_lines(lines)
+        stored = self._flush_with_retries(records)
+        if stored is not False:
+            return bool(stored)
+        if len(records) > 1:
+            # the batch keeps failing: store what can be stored and set
+            # aside what storage refuses while the others go in
+            failed = [record for record in records if not self._flush_once([record])]
+            if len(failed) < len(records):
+                self._write_dead_letters(failed)
+                return True
+        return False
+
+    def _flush_with_retries(self, batch: list) -> Optional[bool]:
+        """Try ``batch`` up to ``max_attempts`` times; None when stopped while waiting."""
+        delay = 0.1
+        for attempt in range(self.max_attempts):
+            if self._flush_once(batch):
+                return True
+            if attempt == self.max_attempts - 1:
+                return False
+            # the results are safe in the spool, keep trying
+            self.counters['retries'] += 1
+            logger.warning('retrying %d spooled results in %.1fs', len(batch), delay)
+            if self._stopped.wait(delay):
+                return None
+            delay = min(delay * 2, self.max_retry_delay)
+        return False
+
+    def _flush_once(self, batch: list) -> bool:
+        start = time.perf_counter()
+        try:
+            self.flush(batch)
+        except Exception:
+            logger.exception('could not store %d spooled results', len(batch))
+            return False
+        elapsed = time.perf_counter() - start
+        self.counters['batches'] += 1
+        self.counters['flush_seconds_total'] += elapsed
+        self.counters['flush_seconds_last'] = elapsed
+        self.counters['flush_seconds_max'] = max(self.counters['flush_seconds_max'], elapsed)
+        return True
+
+    def _write_dead_letters(self, records: list[dict]) -> None:
+        if not records:
+            return
+        fd = os.open(self.dead_letter, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        try:
+            os.write(fd, b''.join(encode(record) for record in records))
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        self.counters['dead_lettered'] += len(records)
+        logger.error('moved %d spooled results storage keeps refusing to %s', len(records), self.dead_letter)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description='Store the results left in a spool directory.')
+    parser.add_argument('directory', nargs='?', default=os.environ.get('SPOOL_DIR'),
+                        help='The spool directory (default: SPOOL_DIR).')
+    parser.add_argument('--keep', action='store_true', help='Keep drained segments instead of deleting them.')
+    args = parser.parse_args()
+    if not args.directory:
+        parser.error('give a spool directory or set SPOOL_DIR')
+
+    from ingest import store_results
+    from rollups import Rollups
+    from storage import get_storage
+
+    storage = get_storage()
+    rollups = Rollups(storage, interval=3600)
+
+    def store(records):
+        store_results(storage, rollups, records)
+
+    total = 0
+    for segment in segments(args.directory):
+        stored = drain_segment(segment, store)
+        print(f'{os.path.basename(segment)}: stored {stored} results')
+        total += stored
+        if not args.keep:
+            remove_segment(segment)
+    rollups.flush()
+    print(f'stored {total} results')
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
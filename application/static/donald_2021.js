@@ -34,6 +34,10 @@ var blackColors = new Array(
 
 var testCounter, age, awake, drugs, start, questions;
 
+// the test ID is fetched from the server when the test starts, so the page
+// itself can be cached
+var testID;
+
 function setup() {
   createCanvas(windowWidth, windowHeight);
   text("Leeftijd (jaren)", 10, 30)
@@ -88,6 +92,9 @@ function setup() {
   eerder.option('ik heb donald niet eerder gespeeld');
   eerder.selected('zeg ik niet')
 
+  // send whatever a previous session left behind
+  flushResults(false);
+
   start = createButton('Starten');
   start.position(10, 330);
   start.mouseClicked(startLoop);
@@ -95,6 +102,28 @@ function setup() {
 }
 
 function startLoop() {
+  start.attribute('disabled', '');
+  requestTestID(3);
+}
+
+function requestTestID(attempts) {
+  fetch('/id', {method: 'POST', cache: 'no-store'})
+    .then(function (response) {
+      if (!response.ok) { throw response; }
+      return response.json();
+    })
+    .then(function (data) { testID = data.testID; runLoop(); })
+    .catch(function (error) {
+      // server busy (429/503): try again shortly; offline: results are sent as UNKNOWN
+      if (attempts > 1 && error instanceof Response) {
+        setTimeout(function () { requestTestID(attempts - 1); }, 1000);
+      } else {
+        runLoop();
+      }
+    });
+}
+
+function runLoop() {
   questions = '' + age.value() + '\t' + awake.value() + '\t' + drugs.value() + '\t' + cb.value()+ '\t' + instructie.value()+ '\t' + eerder.value();
   removeElements();
   frameRate(60);
@@ -237,9 +266,97 @@ function postResults(req, rec, status, time) {
     + currentLevel + '\t'
     + ''+windowWidth+'x'+windowHeight + '\t'
     + questions;
-  httpPost('/', data);
+  queueResult(data);
+}
+
+//
+// results are queued in localStorage and sent to /batch in one request when
+// enough have been collected, when the phone comes back online and when the
+// page is hidden or closed, so results survive a flaky network.
+//
+var RESULTS_KEY = 'donald-results';
+var RESULTS_SEQUENCE_KEY = 'donald-results-sequence';
+var RESULTS_FLUSH_AT = 10;
+var RESULTS_MAX_BATCH = 200;
+var resultsInFlight = false;
+
+// every queued line carries a sequence number that is never reused, so a
+// request removes exactly the lines it sent even when a beacon sent them too
+function nextSequence() {
+  var sequence = parseInt(localStorage.getItem(RESULTS_SEQUENCE_KEY) || '0', 10) + 1;
+  localStorage.setItem(RESULTS_SEQUENCE_KEY, String(sequence));
+  return sequence;
+}
+
+function queuedResults() {
+  try {
+    var entries = JSON.parse(localStorage.getItem(RESULTS_KEY) || '[]');
+    // queues stored before sequence numbers were added hold bare lines
+    if (entries.some(function(entry) { return typeof entry === 'string'; })) {
+      entries = entries.map(function(entry) {
+        return typeof entry === 'string' ? {seq: nextSequence(), data: entry} : entry;
+      });
+      storeQueuedResults(entries);
+    }
+    return entries;
+  } catch (e) {
+    return [];
+  }
+}
+
+function storeQueuedResults(entries) {
+  localStorage.setItem(RESULTS_KEY, JSON.stringify(entries));
+}
+
+function queueResult(data) {
+  try {
+    var entries = queuedResults();
+    entries.push({seq: nextSequence(), data: data});
+    storeQueuedResults(entries);
+  } catch (e) {
+    // no localStorage (private mode, quota): send it right away
+    httpPost('/', data);
+    return;
+  }
+  if (queuedResults().length >= RESULTS_FLUSH_AT) {
+    flushResults(false);
+  }
 }
 
+function flushResults(closing) {
+  var entries = queuedResults().slice(0, RESULTS_MAX_BATCH);
+  if (entries.length == 0 || !navigator.onLine || (resultsInFlight && !closing)) {
+    return;
+  }
+  var body = entries.map(function(entry) { return entry.data; }).join('\n');
+  var sent = function() {
+    // drop only the lines this request carried: results may have been queued
+    // meanwhile and a beacon may already have removed some of these
+    var sentSequences = {};
+    entries.forEach(function(entry) { sentSequences[entry.seq] = true; });
+    storeQueuedResults(queuedResults().filter(function(entry) { return !sentSequences[entry.seq]; }));
+  };
+  if (closing && navigator.sendBeacon) {
+    if (navigator.sendBeacon('/batch', new Blob([body], {type: 'text/plain'}))) {
+      sent();
+    }
+    return;
+  }
+  resultsInFlight = true;
+  fetch('/batch', {method: 'POST', body: body, keepalive: true})
+    .then(function(response) { if (response.ok) { sent(); } })
+    .catch(function() {})
+    .then(function() { resultsInFlight = false; });
+}
+
+window.addEventListener('online', function() { flushResults(false); });
+window.addEventListener('pagehide', function() { flushResults(true); });
+document.addEventListener('visibilitychange', function() {
+  if (document.visibilityState === 'hidden') {
+    flushResults(true);
+  }
+});
+
 
 //
 // below is the statemachine implementing the test program and UI
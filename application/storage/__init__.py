@@ -0,0 +1,64 @@
+"""Pluggable storage for test IDs and results.
+
+The backend is chosen with the DONALD_STORAGE environment variable:
+
+- ``datastore`` (default): Google Cloud Datastore
+- ``sqlite``: a local SQLite file, path in DONALD_SQLITE_PATH
+
+Results and their counters are kept per namespace, one per course year or
+cohort, named in DONALD_NAMESPACE; without it they live in the default
+namespace. Test IDs are allocated from one counter for all namespaces, so an
+ID is never handed out twice. Where a namespace has to be named, e.g. to
+export or purge the default one while DONALD_NAMESPACE is set, the default
+namespace is called ``__default__``.
+"""
+
+import os
+import re
+from typing import Optional
+
+from storage.base import FIRST_ID, RECORD_FIELDS, STORED_AT, Storage, stored_at
+
+# what Datastore accepts as a namespace name; names like __kind__ are reserved
+NAMESPACE_PATTERN = re.compile(r'(?!__)[0-9A-Za-z._-]{1,100}')
+
+# stands for the default namespace; being reserved it cannot name another one
+DEFAULT_NAMESPACE = '__default__'
+
+
+def valid_namespace(namespace: str) -> bool:
+    return NAMESPACE_PATTERN.fullmatch(namespace) is not None
+
+
+def parse_namespace(name: str) -> Optional[str]:
+    """Return the namespace ``name`` refers to, None for DEFAULT_NAMESPACE; raises ValueError when invalid."""
+    if name == DEFAULT_NAMESPACE:
+        return None
+    if not valid_namespace(name):
+        raise ValueError(f"invalid namespace: {name!r}")
+    return name
+
+
+def namespace_from_env() -> Optional[str]:
+    """Return DONALD_NAMESPACE, or None for the default namespace."""
+    namespace = os.environ.get('DONALD_NAMESPACE') or None
+    if namespace is not None and not valid_namespace(namespace):
+        raise ValueError(f"invalid DONALD_NAMESPACE: {namespace!r}")
+    return namespace
+
+
+def get_storage(namespace: Optional[str] = None) -> Storage:
+    """Create the backend selected by the environment, in ``namespace`` or DONALD_NAMESPACE."""
+    namespace = parse_namespace(namespace) if namespace else namespace_from_env()
+    backend = os.environ.get('DONALD_STORAGE', 'datastore')
+    if backend == 'datastore':
+        from storage.datastore_backend import DatastoreStorage
+        return DatastoreStorage(namespace=namespace)
+    if backend == 'sqlite':
+        from storage.sqlite_backend import SQLiteStorage
+        return SQLiteStorage(os.environ.get('DONALD_SQLITE_PATH', 'donald.sqlite3'), namespace=namespace)
+    raise ValueError(f"unknown DONALD_STORAGE backend: {backend!r}")
+
+
+__all__ = ['DEFAULT_NAMESPACE', 'FIRST_ID', 'RECORD_FIELDS', 'STORED_AT', 'Storage', 'get_storage',
+           'namespace_from_env', 'parse_namespace', 'stored_at', 'valid_namespace']
@@ -0,0 +1,181 @@
+"""Interface every storage backend implements."""
+
+import hashlib
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Iterator, Optional
+
+# a result record is a plain dict with at least these keys:
+# testID, testIndex, testSet (str), timeStamp (datetime), value (str)
+RECORD_FIELDS = ('testID', 'testIndex', 'testSet', 'timeStamp', 'value')
+
+# when the record was stored, set by ingest; timeStamp and 'value' keep the
+# receive time. Records stored without it count as stored at their timeStamp,
+# and backends return it for every record.
+STORED_AT = 'storedAt'
+
+
+def stored_at(record: dict) -> datetime:
+    """Return when ``record`` was stored, its timeStamp when that is not known."""
+    return record.get(STORED_AT) or record['timeStamp']
+
+# the first ID ever handed out is FIRST_ID + 1, as with the original counter
+FIRST_ID = 100
+
+# most counters increment_counters adds in one write, Datastore's limit of
+# entities per commit
+COUNTER_BATCH = 500
+
+
+def line_hash(record: dict) -> str:
+    """Hash of the posted line, i.e. 'value' without the receive time."""
+    return hashlib.sha256(record['value'].rsplit('\t', 1)[0].encode('utf-8')).hexdigest()[:16]
+
+
+def record_key(record: dict, tiebreak: Optional[str] = None) -> str:
+    """Return the stored name of a result: testID and testCounter, plus ``tiebreak`` if given."""
+    key = f"{record['testID']}|{record['testIndex']}"
+    return f'{key}|{tiebreak}' if tiebreak else key
+
+
+def candidate_keys(records: list[dict]) -> list[str]:
+    """Every name ``plan_inserts`` may need to look up for ``records``."""
+    keys = []
+    for record in records:
+        keys.append(record_key(record))
+        keys.append(record_key(record, line_hash(record)))
+    return list(dict.fromkeys(keys))
+
+
+def plan_inserts(records: list[dict], stored: dict[str, str]) -> tuple[list[tuple[str, str, dict]], int]:
+    """Decide which records to write, given the line hashes already ``stored`` by name.
+
+    A result is stored under its testID and testCounter. The same line posted
+    again (a retry or a double submit) is a duplicate and is skipped. A
+    different line under the same testID and testCounter is a conflict: it is
+    kept under a name with its line hash appended.
+
+    Returns ``(name, line hash, record)`` for every record to write and the
+    number of conflicts among them.
+    """
+    claimed = dict(stored)
+    writes = []
+    conflicts = 0
+    for record in records:
+        digest = line_hash(record)
+        name = record_key(record)
+        if name in claimed:
+            if claimed[name] == digest:
+                continue
+            name = record_key(record, digest)
+            if name in claimed:
+                continue
+            conflicts += 1
+        claimed[name] = digest
+        writes.append((name, digest, record))
+    return writes, conflicts
+
+
+class Storage(ABC):
+    """Storage for the ID counter and the testRecord results.
+
+    Results and result counters live in ``namespace`` (None is the default
+    one); the ID counter is shared by all namespaces.
+    """
+
+    namespace: Optional[str] = None
+
+    # testID ranges the full export reads at the same time; reading ranges in
+    # parallel only pays off when every page is a network round trip
+    export_concurrency: int = 1
+
+    @abstractmethod
+    def in_namespace(self, namespace: Optional[str]) -> 'Storage':
+        """Return this backend for the results of another namespace."""
+
+    @abstractmethod
+    def namespace_exists(self, namespace: Optional[str]) -> bool:
+        """Return whether results were ever stored in ``namespace``, without creating it."""
+
+    @abstractmethod
+    def allocate_ids(self, count: int) -> int:
+        """Reserve ``count`` consecutive IDs and return the first one."""
+
+    def warm_up(self) -> None:
+        """Open connections ahead of the first request; optional."""
+
+    @abstractmethod
+    def last_id(self) -> int:
+        """Return the highest ID reserved so far, without reserving any."""
+
+    @abstractmethod
+    def insert_results(self, records: list[dict]) -> tuple[list[dict], int]:
+        """Store a batch of result records, skipping results already stored.
+
+        Returns the records that were written and how many of them conflicted
+        with a different result under the same testID and testCounter, see
+        ``plan_inserts``.
+        """
+
+    @abstractmethod
+    def query_results(self, testID: Optional[str] = None, since: Optional[datetime] = None,
+                      page_size: int = 500, start: Optional[str] = None,
+                      end: Optional[str] = None) -> Iterator[list[dict]]:
+        """Yield pages of records.
+
+        With ``testID`` the records of that test are ordered by testIndex,
+        otherwise all records (optionally from ``since`` on, and optionally
+        only testIDs with ``start <= testID < end``) are ordered by testID and
+        testIndex.
+        """
+
+    @abstractmethod
+    def query_test_set(self, testSet: str, limit: int = 500,
+                       cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        """Return the records of ``testSet`` in testID and testIndex order.
+
+        At most ``limit`` records are returned, with an opaque cursor to get
+        the next ones, or None when there are no more. Raises ValueError for
+        a cursor that was not handed out by this method.
+        """
+
+    @abstractmethod
+    def query_changes(self, after: datetime, until: datetime, limit: int = 1000,
+                      cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        """Return records with ``after < storedAt <= until`` in storedAt order.
+
+        At most ``limit`` records are returned, with an opaque cursor to get
+        the next ones, or None when there are no more. Raises ValueError for
+        a cursor that was not handed out by this method.
+        """
+
+    @abstractmethod
+    def delete_results(self, before: datetime, limit: int = 500,
+                       cursor: Optional[str] = None) -> tuple[int, Optional[str]]:
+        """Delete up to ``limit`` records older than ``before``.
+
+        Returns the number deleted and an opaque cursor to continue from, or
+        None when no older records are left.
+        """
+
+    def compact_results(self, limit: int = 500,
+                        cursor: Optional[str] = None) -> tuple[int, int, Optional[str]]:
+        """Rewrite up to ``limit`` stored records in the backend's compact layout.
+
+        Returns the number of records read, how many of them were rewritten
+        and an opaque cursor to continue from, or None when all were read.
+        Backends without a separate compact layout have nothing to do.
+        """
+        return 0, 0, None
+
+    @abstractmethod
+    def increment_counters(self, deltas: dict[str, int]) -> None:
+        """Add ``deltas`` to the named result counters.
+
+        Up to COUNTER_BATCH counters are added in one write; a larger call may
+        fail with only some of its writes applied.
+        """
+
+    @abstractmethod
+    def read_counters(self, prefix: str = '') -> dict[str, int]:
+        """Return the current value of every counter whose name starts with ``prefix``."""
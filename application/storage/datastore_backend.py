@@ -0,0 +1,333 @@
+"""Google Cloud Datastore backend.
+
+The google.cloud modules and the client are only loaded on first use:
+importing them and looking up credentials takes seconds on a cold instance,
+which should not delay pages that never touch Datastore.
+
+testRecord entities are stored in a compact layout: they hold the same
+properties as the SQLite backend's rows, but only the ones queries filter or
+sort on are indexed. With COMPRESS_VALUES=1 the raw line is stored deflated
+as 'valueZ'. ``python compact.py`` rewrites older entities; entities stored
+before 'storedAt' existed only show up in the changes feed once it has.
+
+testRecord and resultCount entities are kept in the namespace the backend
+was created for; the test-ID counter always lives in the default namespace.
+"""
+
+import os
+import random
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from typing import Iterator, Optional
+
+import metrics
+from records import TYPED_FIELDS, typed_record
+from storage.base import FIRST_ID, STORED_AT, Storage, candidate_keys, line_hash, plan_inserts, stored_at
+
+# concurrent counter transactions conflict; retry them this often
+TRANSACTION_ATTEMPTS = 5
+
+# most keys in one lookup and entities in one commit Datastore accepts
+GET_BATCH = 1000
+PUT_BATCH = 500
+
+# properties queries filter or sort on, see index.yaml; every other property
+# is left out of the built-in indexes
+INDEXED_PROPERTIES = ('testID', 'testIndex', 'testSet', 'timeStamp', STORED_AT)
+
+# preset dictionary for compressing 'value': the parts result lines share.
+# Stored values can only be inflated with the dictionary they were deflated
+# with, so never change it; zlib checks its id on decompress.
+VALUE_DICTIONARY = (b'\tniet kleurenblind\tdonald is mij uitgelegd\tzeg ik niet\tcorrect\twrong\ttimeout'
+                    b'\t20\t120\t40\t120\t360\t0,1,2,3,0,1,2,3\t412x766\t2026-0')
+
+# result counters are spread over this many shard entities per name so
+# concurrent flushes from different instances rarely touch the same entity
+COUNTER_SHARDS = int(os.environ.get('COUNTER_SHARDS', '20'))
+
+# instances that predate 'valueZ' cannot read it, so compression is only
+# turned on once every serving version does
+COMPRESS_VALUES = os.environ.get('COMPRESS_VALUES', '0') == '1'
+
+
+# set by _import_datastore()
+datastore = exceptions = PropertyFilter = None
+_import_lock = threading.Lock()
+
+
+def _import_datastore() -> None:
+    global datastore, exceptions, PropertyFilter
+    with _import_lock:
+        if datastore is not None:
+            return
+        from google.api_core import exceptions as api_exceptions
+        from google.cloud import datastore as datastore_module
+        from google.cloud.datastore.query import PropertyFilter as property_filter
+        exceptions, PropertyFilter = api_exceptions, property_filter
+        datastore = datastore_module
+
+
+def compress_value(value: str) -> bytes:
+    deflate = zlib.compressobj(9, zdict=VALUE_DICTIONARY)
+    return deflate.compress(value.encode('utf-8')) + deflate.flush()
+
+
+def decompress_value(data: bytes) -> str:
+    inflate = zlib.decompressobj(zdict=VALUE_DICTIONARY)
+    return (inflate.decompress(data) + inflate.flush()).decode('utf-8')
+
+
+def compact_properties(record: dict, digest: str, compress: bool = False) -> dict:
+    """Return the properties of ``record`` as a compact testRecord stores them."""
+    stored = stored_at(record)
+    # entities stored before ingest parsed the line only carry the raw line
+    record = dict(typed_record(record), storedAt=stored)
+    properties = {name: record[name] for name in INDEXED_PROPERTIES + tuple(TYPED_FIELDS)}
+    if compress:
+        properties['valueZ'] = compress_value(record['value'])
+    else:
+        properties['value'] = record['value']
+    properties['lineHash'] = digest
+    return properties
+
+
+def entity_record(entity) -> dict:
+    """Return a stored testRecord as a record dict with its raw line in 'value'."""
+    record = dict(entity)
+    # Datastore hands back aware UTC datetimes; the app and the SQLite
+    # backend work with naive ones, which cannot be compared with them
+    for name in ('timeStamp', STORED_AT):
+        if record.get(name) is not None and record[name].tzinfo is not None:
+            record[name] = record[name].astimezone(timezone.utc).replace(tzinfo=None)
+    record[STORED_AT] = stored_at(record)
+    if 'valueZ' in record:
+        record['value'] = decompress_value(record.pop('valueZ'))
+    return record
+
+
+def is_compact(entity, compress: bool = False) -> bool:
+    """Tell whether ``entity`` is already stored in the compact layout."""
+    expected = INDEXED_PROPERTIES + tuple(TYPED_FIELDS) + (('valueZ' if compress else 'value'), 'lineHash')
+    return (set(entity) == set(expected)
+            and set(entity.exclude_from_indexes) == set(expected) - set(INDEXED_PROPERTIES))
+
+
+class DatastoreStorage(Storage):
+    """Store the counter and testRecord entities in Datastore."""
+
+    export_concurrency = 4
+
+    def __init__(self, client=None, compress: Optional[bool] = None, namespace: Optional[str] = None):
+        self._client = client
+        self.compress = COMPRESS_VALUES if compress is None else compress
+        self.namespace = namespace or None
+        self._client_lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None or datastore is None:
+            _import_datastore()
+            with self._client_lock:
+                if self._client is None:
+                    self._client = datastore.Client()
+        return self._client
+
+    def in_namespace(self, namespace: Optional[str]) -> 'DatastoreStorage':
+        return DatastoreStorage(self.client, self.compress, namespace)
+
+    def namespace_exists(self, namespace: Optional[str]) -> bool:
+        if not namespace:
+            return True
+        # a metadata query: Datastore lists every namespace holding entities
+        query = self.client.query(kind='__namespace__')
+        query.key_filter(self.client.key('__namespace__', namespace), '=')
+        query.keys_only()
+        return any(True for _ in query.fetch(limit=1))
+
+    @property
+    def counter_key(self):
+        return self.client.key('counter', 'test-ID')
+
+    def _key(self, kind: str, name: str):
+        return self.client.key(kind, name, namespace=self.namespace)
+
+    def _query(self, kind: str):
+        return self.client.query(kind=kind, namespace=self.namespace)
+
+    def warm_up(self) -> None:
+        # creates the client and opens its connection
+        self.last_id()
+
+    @staticmethod
+    def _retried(transaction, retries):
+        """Run ``transaction`` again with backoff when it conflicts with a concurrent one."""
+        for attempt in range(TRANSACTION_ATTEMPTS):
+            try:
+                return transaction()
+            except (exceptions.Conflict, exceptions.Aborted):
+                if attempt == TRANSACTION_ATTEMPTS - 1:
+                    raise
+                retries.inc()
+                time.sleep(0.05 * 2 ** attempt)
+
+    def allocate_ids(self, count: int) -> int:
+        return self._retried(lambda: self._allocate_ids(count), metrics.ID_TRANSACTION_RETRIES)
+
+    def _allocate_ids(self, count: int) -> int:
+        with self.client.transaction():
+            counter = self.client.get(self.counter_key)
+            if not counter:
+                counter = datastore.Entity(self.counter_key)
+                counter.update({'value': FIRST_ID})
+            first = counter['value'] + 1
+            counter['value'] = counter['value'] + count
+            self.client.put(counter)
+        return first
+
+    def last_id(self) -> int:
+        counter = self.client.get(self.counter_key)
+        return counter['value'] if counter else FIRST_ID
+
+    def insert_results(self, records: list[dict]) -> tuple[list[dict], int]:
+        # results have a name made from testID and testCounter, so a retried
+        # post finds the stored entity instead of creating a second one
+        names = candidate_keys(records)
+        stored = {}
+        for start in range(0, len(names), GET_BATCH):
+            keys = [self._key('testRecord', name) for name in names[start:start + GET_BATCH]]
+            stored.update({entity.key.name: entity.get('lineHash') for entity in self.client.get_multi(keys)})
+        writes, conflicts = plan_inserts(records, stored)
+        entities = [self._result_entity(self._key('testRecord', name), record, digest)
+                    for name, digest, record in writes]
+        for start in range(0, len(entities), PUT_BATCH):
+            self.client.put_multi(entities[start:start + PUT_BATCH])
+        return [record for _, _, record in writes], conflicts
+
+    def query_results(self, testID: Optional[str] = None, since: Optional[datetime] = None,
+                      page_size: int = 500, start: Optional[str] = None,
+                      end: Optional[str] = None) -> Iterator[list[dict]]:
+        query = self._query('testRecord')
+        if testID:
+            query.add_filter(filter=PropertyFilter('testID', '=', testID))
+            query.order = ['testIndex']
+        else:
+            if since:
+                query.add_filter(filter=PropertyFilter('timeStamp', '>=', since))
+            if start:
+                query.add_filter(filter=PropertyFilter('testID', '>=', start))
+            if end:
+                query.add_filter(filter=PropertyFilter('testID', '<', end))
+            query.order = ['testID', 'testIndex']
+        # page through the results with cursors so only one page is held in
+        # memory and the first page goes out before the query is finished
+        cursor = None
+        while True:
+            tests = query.fetch(limit=page_size, start_cursor=cursor)
+            page = [entity_record(entity) for entity in next(tests.pages, [])]
+            if page:
+                yield page
+            cursor = tests.next_page_token
+            if not cursor or not page:
+                break
+
+    def query_test_set(self, testSet: str, limit: int = 500,
+                       cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        query = self._query('testRecord')
+        query.add_filter(filter=PropertyFilter('testSet', '=', testSet))
+        query.order = ['testID', 'testIndex']
+        try:
+            tests = query.fetch(limit=limit, start_cursor=cursor)
+            records = [entity_record(entity) for entity in next(tests.pages, [])]
+        except exceptions.InvalidArgument as error:
+            raise ValueError(f'invalid cursor: {cursor!r}') from error
+        next_cursor = tests.next_page_token
+        if len(records) < limit or not next_cursor:
+            return records, None
+        return records, next_cursor.decode('ascii')
+
+    def query_changes(self, after: datetime, until: datetime, limit: int = 1000,
+                      cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        query = self._query('testRecord')
+        query.add_filter(filter=PropertyFilter(STORED_AT, '>', after))
+        query.add_filter(filter=PropertyFilter(STORED_AT, '<=', until))
+        query.order = [STORED_AT]
+        try:
+            tests = query.fetch(limit=limit, start_cursor=cursor)
+            records = [entity_record(entity) for entity in next(tests.pages, [])]
+        except exceptions.InvalidArgument as error:
+            raise ValueError(f'invalid cursor: {cursor!r}') from error
+        next_cursor = tests.next_page_token
+        if len(records) < limit or not next_cursor:
+            return records, None
+        return records, next_cursor.decode('ascii')
+
+    def delete_results(self, before: datetime, limit: int = 500,
+                       cursor: Optional[str] = None) -> tuple[int, Optional[str]]:
+        query = self._query('testRecord')
+        query.add_filter(filter=PropertyFilter('timeStamp', '<=', before))
+        query.keys_only()
+        entities = query.fetch(limit=limit, start_cursor=cursor)
+        keys = [entity.key for entity in next(entities.pages, [])]
+        if keys:
+            self.client.delete_multi(keys)
+        next_cursor = entities.next_page_token
+        return len(keys), next_cursor.decode('ascii') if keys and next_cursor else None
+
+    def compact_results(self, limit: int = 500,
+                        cursor: Optional[str] = None) -> tuple[int, int, Optional[str]]:
+        query = self._query('testRecord')
+        query.order = ['__key__']
+        entities = query.fetch(limit=limit, start_cursor=cursor)
+        page = list(next(entities.pages, []))
+        rewrites = []
+        for entity in page:
+            if is_compact(entity, self.compress):
+                continue
+            record = entity_record(entity)
+            rewrites.append(self._result_entity(entity.key, record, record.get('lineHash') or line_hash(record)))
+        for start in range(0, len(rewrites), PUT_BATCH):
+            self.client.put_multi(rewrites[start:start + PUT_BATCH])
+        next_cursor = entities.next_page_token
+        return len(page), len(rewrites), next_cursor.decode('ascii') if page and next_cursor else None
+
+    def _result_entity(self, key, record: dict, digest: str):
+        properties = compact_properties(record, digest, self.compress)
+        entity = datastore.Entity(key=key, exclude_from_indexes=tuple(
+            name for name in properties if name not in INDEXED_PROPERTIES))
+        entity.update(properties)
+        return entity
+
+    def increment_counters(self, deltas: dict[str, int]) -> None:
+        # a commit holds at most PUT_BATCH entities: larger increments are
+        # split, and a chunk that fails leaves the chunks before it applied
+        items = list(deltas.items())
+        for start in range(0, len(items), PUT_BATCH):
+            chunk = dict(items[start:start + PUT_BATCH])
+            self._retried(lambda: self._increment_counters(chunk), metrics.COUNTER_TRANSACTION_RETRIES)
+
+    def _increment_counters(self, deltas: dict[str, int]) -> None:
+        shard = random.randrange(COUNTER_SHARDS)
+        keys = [self._key('resultCount', f'{name}#{shard}') for name in deltas]
+        with self.client.transaction():
+            found = {entity.key.name: entity for entity in self.client.get_multi(keys)}
+            entities = []
+            for key, (name, delta) in zip(keys, deltas.items()):
+                entity = found.get(key.name)
+                if entity is None:
+                    entity = datastore.Entity(key)
+                    entity.update({'name': name, 'value': 0})
+                entity['value'] += delta
+                entities.append(entity)
+            self.client.put_multi(entities)
+
+    def read_counters(self, prefix: str = '') -> dict[str, int]:
+        query = self._query('resultCount')
+        if prefix:
+            query.add_filter(filter=PropertyFilter('name', '>=', prefix))
+            query.add_filter(filter=PropertyFilter('name', '<', prefix + '\ufffd'))
+        counters = {}
+        for entity in query.fetch():
+            counters[entity['name']] = counters.get(entity['name'], 0) + entity['value']
+        return counters
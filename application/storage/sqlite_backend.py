@@ -0,0 +1,264 @@
+"""In-process SQLite backend for local load tests and small deployments.
+
+The test-ID counter is kept in the file at ``path``. Results and result
+counters of a namespace are kept in a file of their own next to it, e.g.
+donald.2026.sqlite3, attached to every connection; dropping a namespace is
+deleting its file.
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from typing import Iterator, Optional
+
+from records import TIMESTAMP_FORMAT, TYPED_FIELDS
+from storage.base import FIRST_ID, RECORD_FIELDS, STORED_AT, Storage, candidate_keys, plan_inserts, stored_at
+
+SQL_TYPES = {int: 'INTEGER', str: 'TEXT'}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS counter (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+"""
+
+# the tables of one namespace, in database {db}
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {db}.resultCount (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS {db}.testRecord (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    testID TEXT NOT NULL,
+    testIndex TEXT NOT NULL,
+    testSet TEXT NOT NULL,
+    timeStamp TEXT NOT NULL,
+    value TEXT NOT NULL,
+    recordKey TEXT,
+    lineHash TEXT
+);
+CREATE INDEX IF NOT EXISTS {db}.testRecord_testID ON testRecord (testID, testIndex);
+CREATE INDEX IF NOT EXISTS {db}.testRecord_timeStamp ON testRecord (timeStamp);
+DROP INDEX IF EXISTS {db}.testRecord_testSet;
+CREATE INDEX IF NOT EXISTS {db}.testRecord_testSet_testID ON testRecord (testSet, testID, testIndex);
+"""
+
+
+def namespace_path(path: str, namespace: Optional[str]) -> str:
+    """Return the file next to ``path`` that holds the results of ``namespace``."""
+    if not namespace:
+        return path
+    stem, extension = os.path.splitext(path)
+    return f'{stem}.{namespace}{extension}'
+
+
+class SQLiteStorage(Storage):
+    """Store the counter and results in one SQLite file in WAL mode."""
+
+    def __init__(self, path: str = 'donald.sqlite3', namespace: Optional[str] = None):
+        self.path = path
+        self.namespace = namespace or None
+        self.db = 'results' if self.namespace else 'main'
+        self.records = self.db + '.testRecord'
+        self.counts = self.db + '.resultCount'
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript(SCHEMA + RESULTS_SCHEMA.format(db=self.db))
+        # add typed columns to files created before they existed
+        present = {row['name'] for row in connection.execute(f'PRAGMA {self.db}.table_info(testRecord)')}
+        for name, kind in {'recordKey': str, 'lineHash': str, STORED_AT: str, **TYPED_FIELDS}.items():
+            if name not in present:
+                connection.execute(f'ALTER TABLE {self.records} ADD COLUMN {name} {SQL_TYPES[kind]}')
+        if STORED_AT not in present:
+            # older rows count as stored when they were received
+            connection.execute(f'UPDATE {self.records} SET {STORED_AT} = timeStamp')
+        connection.execute(f'CREATE INDEX IF NOT EXISTS {self.db}.testRecord_storedAt ON testRecord ({STORED_AT})')
+        # records stored before results had a key have none; NULLs never collide
+        connection.execute(f'CREATE UNIQUE INDEX IF NOT EXISTS {self.db}.testRecord_recordKey '
+                           'ON testRecord (recordKey)')
+        self.columns = RECORD_FIELDS + (STORED_AT,) + tuple(TYPED_FIELDS)
+
+    @property
+    def results_path(self) -> str:
+        """The file holding the results of this namespace."""
+        return namespace_path(self.path, self.namespace)
+
+    def in_namespace(self, namespace: Optional[str]) -> 'SQLiteStorage':
+        return SQLiteStorage(self.path, namespace)
+
+    def namespace_exists(self, namespace: Optional[str]) -> bool:
+        # opening a namespace creates its file, so look for the file instead
+        return not namespace or os.path.exists(namespace_path(self.path, namespace))
+
+    def _connection(self) -> sqlite3.Connection:
+        # sqlite3 connections may not be shared between threads
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.row_factory = sqlite3.Row
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            if self.namespace:
+                connection.execute(f'ATTACH DATABASE ? AS {self.db}', (self.results_path,))
+                connection.execute(f'PRAGMA {self.db}.journal_mode=WAL')
+                connection.execute(f'PRAGMA {self.db}.synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+    def allocate_ids(self, count: int) -> int:
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute("SELECT value FROM counter WHERE name = 'test-ID'").fetchone()
+            current = row['value'] if row else FIRST_ID
+            connection.execute("INSERT OR REPLACE INTO counter (name, value) VALUES ('test-ID', ?)",
+                               (current + count,))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return current + 1
+
+    def last_id(self) -> int:
+        row = self._connection().execute("SELECT value FROM counter WHERE name = 'test-ID'").fetchone()
+        return row['value'] if row else FIRST_ID
+
+    def insert_results(self, records: list[dict]) -> tuple[list[dict], int]:
+        connection = self._connection()
+        names = candidate_keys(records)
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            stored = {}
+            for start in range(0, len(names), 500):
+                chunk = names[start:start + 500]
+                stored.update(connection.execute(
+                    f"SELECT recordKey, lineHash FROM {self.records} WHERE recordKey IN ({', '.join('?' * len(chunk))})",
+                    chunk).fetchall())
+            writes, conflicts = plan_inserts(records, stored)
+            columns = self.columns + ('recordKey', 'lineHash')
+            connection.executemany(
+                f"INSERT INTO {self.records} ({', '.join(columns)}) "
+                f"VALUES ({', '.join(':' + name for name in columns)})",
+                [dict(self._row(record), recordKey=name, lineHash=digest) for name, digest, record in writes])
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        return [record for _, _, record in writes], conflicts
+
+    def query_results(self, testID: Optional[str] = None, since: Optional[datetime] = None,
+                      page_size: int = 500, start: Optional[str] = None,
+                      end: Optional[str] = None) -> Iterator[list[dict]]:
+        sql = f"SELECT {', '.join(self.columns)} FROM {self.records}"
+        if testID:
+            sql += ' WHERE testID = ? ORDER BY testIndex'
+            args = (testID,)
+        else:
+            where, args = [], []
+            if since:
+                where.append('timeStamp >= ?')
+                args.append(since.strftime(TIMESTAMP_FORMAT))
+            if start:
+                where.append('testID >= ?')
+                args.append(start)
+            if end:
+                where.append('testID < ?')
+                args.append(end)
+            if where:
+                sql += ' WHERE ' + ' AND '.join(where)
+            sql += ' ORDER BY testID, testIndex'
+        rows = self._connection().execute(sql, args)
+        while True:
+            page = rows.fetchmany(page_size)
+            if not page:
+                break
+            yield [self._record(row) for row in page]
+
+    def query_test_set(self, testSet: str, limit: int = 500,
+                       cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        # the cursor is the (testID, testIndex, id) of the last record returned,
+        # base64 encoded so it can go into a URL as it is
+        try:
+            last_test, last_index, last_id = json.loads(base64.urlsafe_b64decode(cursor)) if cursor else ('', '', 0)
+        except (TypeError, ValueError) as error:
+            raise ValueError(f'invalid cursor: {cursor!r}') from error
+        rows = self._connection().execute(
+            f"SELECT id, {', '.join(self.columns)} FROM {self.records} "
+            'WHERE testSet = ? AND (testID, testIndex, id) > (?, ?, ?) '
+            'ORDER BY testID, testIndex, id LIMIT ?',
+            (testSet, last_test, last_index, last_id, limit)).fetchall()
+        if len(rows) < limit:
+            return [self._record(row) for row in rows], None
+        last = json.dumps([rows[-1]['testID'], rows[-1]['testIndex'], rows[-1]['id']])
+        return [self._record(row) for row in rows], base64.urlsafe_b64encode(last.encode('utf-8')).decode('ascii')
+
+    def query_changes(self, after: datetime, until: datetime, limit: int = 1000,
+                      cursor: Optional[str] = None) -> tuple[list[dict], Optional[str]]:
+        # the cursor is the (storedAt, id) of the last record returned
+        try:
+            last_stamp, last_id = (cursor.split('|') if cursor else (after.strftime(TIMESTAMP_FORMAT), 0))
+            last_id = int(last_id)
+        except (AttributeError, ValueError) as error:
+            raise ValueError(f'invalid cursor: {cursor!r}') from error
+        rows = self._connection().execute(
+            f"SELECT id, {', '.join(self.columns)} FROM {self.records} "
+            'WHERE storedAt > ? AND storedAt <= ? AND (storedAt, id) > (?, ?) '
+            'ORDER BY storedAt, id LIMIT ?',
+            (after.strftime(TIMESTAMP_FORMAT), until.strftime(TIMESTAMP_FORMAT),
+             last_stamp, last_id, limit)).fetchall()
+        if len(rows) < limit:
+            return [self._record(row) for row in rows], None
+        return [self._record(row) for row in rows], f"{rows[-1]['storedAt']}|{rows[-1]['id']}"
+
+    def delete_results(self, before: datetime, limit: int = 500,
+                       cursor: Optional[str] = None) -> tuple[int, Optional[str]]:
+        connection = self._connection()
+        # the cursor is the highest row id deleted so far
+        ids = [row['id'] for row in connection.execute(
+            f'SELECT id FROM {self.records} WHERE timeStamp <= ? AND id > ? ORDER BY id LIMIT ?',
+            (before.strftime(TIMESTAMP_FORMAT), int(cursor or 0), limit))]
+        if not ids:
+            return 0, None
+        connection.execute(f"DELETE FROM {self.records} WHERE id IN ({', '.join('?' * len(ids))})", ids)
+        return len(ids), str(ids[-1])
+
+    def increment_counters(self, deltas: dict[str, int]) -> None:
+        if not deltas:
+            return
+        connection = self._connection()
+        connection.execute('BEGIN')
+        try:
+            connection.executemany(
+                f'INSERT INTO {self.counts} (name, value) VALUES (?, ?) '
+                'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+                list(deltas.items()))
+            connection.execute('COMMIT')
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+
+    def read_counters(self, prefix: str = '') -> dict[str, int]:
+        # a range on the primary key, so only the counters asked for are read
+        rows = self._connection().execute(
+            f'SELECT name, value FROM {self.counts} WHERE name >= ? AND name < ?', (prefix, prefix + '\U0010ffff'))
+        return {row['name']: row['value'] for row in rows}
+
+    def _row(self, record: dict) -> dict:
+        row = dict.fromkeys(self.columns)
+        row.update(record)
+        row['timeStamp'] = record['timeStamp'].strftime(TIMESTAMP_FORMAT)
+        row[STORED_AT] = stored_at(record).strftime(TIMESTAMP_FORMAT)
+        return row
+
+    @staticmethod
+    def _record(row: sqlite3.Row) -> dict:
+        record = dict(row)
+        record.pop('id', None)
+        record['timeStamp'] = datetime.strptime(record['timeStamp'], TIMESTAMP_FORMAT)
+        record[STORED_AT] = datetime.strptime(record[STORED_AT], TIMESTAMP_FORMAT)
+        return record
@@ -0,0 +1,54 @@
+"""Pytest configuration and fixtures."""
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Add the application directory to path
+project_root = Path(__file__).parent.parent
+sys.path.insert(0, str(project_root))
+
+# main.py picks its storage backend at import time; tests run on SQLite
+os.environ['DONALD_STORAGE'] = 'sqlite'
+os.environ['DONALD_SQLITE_PATH'] = os.path.join(tempfile.mkdtemp(prefix='donald-tests-'), 'main.sqlite3')
+os.environ['RESULT_FLUSH_SECONDS'] = '0.01'
+# tests send many requests from one address; tests/test_ratelimit.py covers the limits
+os.environ['RATE_LIMITS'] = '0'
+
+import pytest
+
+from benchmarks.datastore_standin import StandinClient
+
+
+@pytest.fixture
+def standin_client():
+    """In-memory Datastore stand-in without simulated latency."""
+    return StandinClient(rpc_latency=0)
+
+
+@pytest.fixture
+def sqlite_storage(tmp_path):
+    """Empty SQLite backend in a temporary directory."""
+    from storage.sqlite_backend import SQLiteStorage
+    return SQLiteStorage(str(tmp_path / 'test.sqlite3'))
+
+
+@pytest.fixture
+def main_module():
+    """The application module, running on the SQLite backend."""
+    import main
+    return main
+
+
+@pytest.fixture
+def client(main_module):
+    """Flask test client for the application."""
+    main_module.app.config['TESTING'] = True
+    return main_module.app.test_client()
+
+
+def post_result(client, main_module, line):
+    """POST one tab-separated result line and wait until it is stored."""
+    response = client.post('/', data=line.encode('utf-8'))
+    main_module.writer.join()
+    return response
@@ -0,0 +1,91 @@
+"""Tests for the hashed, precompressed static files."""
+import gzip
+import os
+import shutil
+
+import pytest
+from flask import Flask, render_template_string
+
+import assets
+
+
+@pytest.fixture
+def static_app(tmp_path):
+    """A Flask app on a copy of two static scripts, built into dist/."""
+    static = tmp_path / 'static'
+    (static / 'libraries').mkdir(parents=True)
+    shutil.copy('static/game.js', static / 'game.js')
+    shutil.copy('static/libraries/p5.sound.min.js', static / 'libraries' / 'p5.sound.min.js')
+    (static / 'site.webmanifest').write_text('{}')
+    assets.build(str(static))
+    app = Flask(__name__, static_folder=str(static))
+    assets.init_app(app)
+    return app
+
+
+def test_build_writes_hashed_and_gzip_copies(static_app):
+    """Test every script gets a content-hashed copy with a gzip variant."""
+    manifest = assets.load_manifest(static_app.static_folder)
+    path = static_app.static_folder + '/' + manifest['game.js']
+
+    assert sorted(manifest) == ['game.js', 'libraries/p5.sound.min.js']
+    assert manifest['game.js'].startswith('dist/game.') and manifest['game.js'].endswith('.js')
+    with open('static/game.js', 'rb') as original, gzip.open(path + '.gz') as compressed:
+        assert compressed.read() == original.read()
+
+
+def test_url_for_links_the_hashed_copy(static_app):
+    """Test templates link scripts from the manifest and other files by fingerprint."""
+    with static_app.test_request_context():
+        script = render_template_string("{{ url_for('static', filename='game.js') }}")
+        other = render_template_string("{{ url_for('static', filename='site.webmanifest') }}")
+
+    assert script.startswith('/static/dist/game.')
+    assert other.startswith('/static/site.webmanifest?v=')
+
+
+def test_precompressed_variant_by_accept_encoding(static_app):
+    """Test the dev server sends the gzip file to clients that accept it."""
+    static_app.config['SERVE_PRECOMPRESSED'] = True
+    client = static_app.test_client()
+    with static_app.test_request_context():
+        url = render_template_string("{{ url_for('static', filename='game.js') }}")
+
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    plain = client.get(url, headers={'Accept-Encoding': 'identity'})
+
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.mimetype in ('text/javascript', 'application/javascript')
+    assert compressed.headers['Cache-Control'] == assets.IMMUTABLE
+    assert gzip.decompress(compressed.get_data()) == plain.get_data()
+    assert 'Content-Encoding' not in plain.headers
+    compressed.close()
+    plain.close()
+
+
+def test_source_changed_since_build_is_linked_by_fingerprint(static_app):
+    """Test a script edited after the build is not linked to its stale hashed copy."""
+    with open(static_app.static_folder + '/game.js', 'a') as handle:
+        handle.write('\n// edited\n')
+
+    with static_app.test_request_context():
+        script = render_template_string("{{ url_for('static', filename='game.js') }}")
+
+    assert script == '/static/game.js?v=' + assets.fingerprint(static_app.static_folder + '/game.js')
+    assert assets.load_manifest(static_app.static_folder)['game.js'] not in script
+
+
+def test_rebuild_keeps_the_previous_build(static_app):
+    """Test a page cached before a deploy still finds its scripts, and older builds are deleted."""
+    static = static_app.static_folder
+    builds = [assets.load_manifest(static)['game.js']]
+    for n in range(2):
+        with open(static + '/game.js', 'a') as handle:
+            handle.write(f'\n// edit {n}\n')
+        builds.append(assets.build(static)['game.js'])
+
+    assert len(set(builds)) == 3
+    assert not os.path.exists(static + '/' + builds[0])
+    assert not os.path.exists(static + '/' + builds[0] + '.gz')
+    assert all(os.path.exists(static + '/' + build) for build in builds[1:])
+    assert os.path.exists(static + '/' + assets.load_manifest(static)['libraries/p5.sound.min.js'])
@@ -0,0 +1,113 @@
+"""Tests for the Datastore testRecord layout, its migration and namespaces."""
+from datetime import datetime
+
+from google.cloud import datastore
+
+from compact import compact
+from records import TYPED_FIELDS, parse_result, typed_record
+from storage.base import line_hash
+from storage.datastore_backend import INDEXED_PROPERTIES, DatastoreStorage, compress_value, decompress_value
+
+STAMP = datetime(2026, 3, 4, 10, 11, 12, 131415)
+LINE = 'U-00ZI\t{}\tPARAMS-2\t20\t120\t40\t120\t360\t1,3,3,0\t1,3,3\ttimeout\t361\t1\t412x766'
+UNINDEXED = set(TYPED_FIELDS) | {'value', 'lineHash'}
+
+
+def stored(client, name):
+    """Return the stored values and unindexed property names of a testRecord."""
+    return client.entities[None, ('testRecord', name)]
+
+
+def put_legacy(client, name, record):
+    """Store ``record`` the way ingest did before the compact layout."""
+    entity = datastore.Entity(key=client.key('testRecord', name))
+    entity.update(record)
+    client.put(entity)
+
+
+def test_only_queried_properties_are_indexed(standin_client):
+    """Test a stored result indexes the query properties and keeps the typed ones unindexed."""
+    storage = DatastoreStorage(standin_client)
+    record = parse_result(LINE.format(1), STAMP)
+    storage.insert_results([record])
+
+    values, exclude_from_indexes = stored(standin_client, 'U-00ZI|1')
+    assert set(values) == set(INDEXED_PROPERTIES) | UNINDEXED
+    assert exclude_from_indexes == UNINDEXED
+    assert {name: values[name] for name in TYPED_FIELDS} == {name: record[name] for name in TYPED_FIELDS}
+
+
+def test_compact_records_read_back_typed(standin_client):
+    """Test reading a compact record gives the same typed values as ingest."""
+    storage = DatastoreStorage(standin_client, compress=True)
+    record = parse_result(LINE.format(1), STAMP)
+    storage.insert_results([record])
+
+    [[read]] = list(storage.query_results())
+    assert 'valueZ' in stored(standin_client, 'U-00ZI|1')[0]
+    assert read['value'] == record['value']
+    assert read['storedAt'] == STAMP
+    assert {name: value for name, value in typed_record(read).items() if name not in ('lineHash', 'storedAt')} == record
+
+
+def test_compressed_value_is_smaller():
+    """Test the preset dictionary makes short result lines compress well."""
+    value = parse_result(LINE.format(1), STAMP)['value']
+
+    assert decompress_value(compress_value(value)) == value
+    assert len(compress_value(value)) < len(value.encode('utf-8')) * 0.7
+
+
+def test_migration_rewrites_old_records_once(standin_client):
+    """Test old entities are rewritten compact and a second run leaves them alone."""
+    storage = DatastoreStorage(standin_client)
+    for index in range(5):
+        put_legacy(standin_client, f'U-00ZI|{index}', parse_result(LINE.format(index), STAMP))
+    storage.insert_results([parse_result(LINE.format(5), STAMP)])
+
+    first = compact(storage, batch_size=2)
+    again = compact(storage, batch_size=2)
+
+    assert (first.read, first.rewritten, first.batches) == (6, 5, 3)
+    assert (again.read, again.rewritten) == (6, 0)
+    values, exclude_from_indexes = stored(standin_client, 'U-00ZI|0')
+    assert set(values) == set(INDEXED_PROPERTIES) | UNINDEXED
+    assert exclude_from_indexes == UNINDEXED
+
+
+def test_migration_adds_typed_properties_to_raw_line_records(standin_client):
+    """Test records holding only the raw line get their typed properties and a storedAt."""
+    storage = DatastoreStorage(standin_client)
+    record = parse_result(LINE.format(1), STAMP)
+    legacy = {name: record[name] for name in ('testID', 'testIndex', 'testSet', 'timeStamp', 'value')}
+    put_legacy(standin_client, 'U-00ZI|1', dict(legacy, lineHash=line_hash(record)))
+
+    assert compact(storage).rewritten == 1
+    values, _ = stored(standin_client, 'U-00ZI|1')
+    assert values['status'] == 'timeout' and values['level'] == 4 and values['window_width'] == 412
+    assert values['storedAt'] == STAMP
+
+
+def test_migration_resumes_from_cursor(standin_client):
+    """Test a run stopped by its time budget continues where it stopped."""
+    storage = DatastoreStorage(standin_client, compress=True)
+    for index in range(5):
+        put_legacy(standin_client, f'U-00ZI|{index}', parse_result(LINE.format(index), STAMP))
+
+    first = compact(storage, batch_size=2, time_budget=0)
+    assert not first.done and first.rewritten == 2
+
+    second = compact(storage, batch_size=2, cursor=first.cursor)
+    assert second.done and second.rewritten == 3
+    assert all('valueZ' in values for values, _ in standin_client.entities.values())
+
+
+def test_namespace_holds_results_but_not_the_id_counter(standin_client):
+    """Test results go into the namespace while test IDs come from the shared counter."""
+    storage = DatastoreStorage(standin_client)
+    cohort = storage.in_namespace('2026')
+    cohort.insert_results([parse_result(LINE.format(1), STAMP)])
+
+    assert ('2026', ('testRecord', 'U-00ZI|1')) in standin_client.entities
+    assert list(storage.query_results()) == []
+    assert cohort.allocate_ids(1) == 101 and storage.last_id() == 101
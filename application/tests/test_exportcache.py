@@ -0,0 +1,116 @@
+"""Tests for the per-testID export cache."""
+from datetime import date, datetime
+
+from exportcache import ExportCache, version_deltas
+from purge import purge
+from rollups import query_prefixes
+from tests.conftest import post_result
+from tests.test_main import RESULT
+from tests.test_storage import make_record
+
+
+def test_stale_version_misses():
+    """Test an entry rendered for an older version is not served."""
+    cache = ExportCache()
+    cache.put('U-0001', '3.0', b'old')
+
+    assert cache.get('U-0001', '3.0') == b'old'
+    assert cache.get('U-0001', '4.0') is None
+    assert cache.get('U-0001', '3.1') is None
+
+
+def test_least_recently_used_is_evicted():
+    """Test the memory cap evicts the entry used longest ago."""
+    cache = ExportCache(max_bytes=10)
+    cache.put('a', 1, b'1234')
+    cache.put('b', 1, b'1234')
+    cache.get('a', 1)
+    cache.put('c', 1, b'1234')
+
+    assert cache.get('b', 1) is None
+    assert cache.get('a', 1) == b'1234'
+    assert cache.size == 8
+
+
+def test_version_deltas_once_per_test():
+    """Test a batch bumps each test it contains once."""
+    records = [{'testID': 'U-0001'}, {'testID': 'U-0001'}, {'testID': 'U-0002'}]
+
+    assert version_deltas(records) == {'version:U-0001': 1, 'version:U-0002': 1}
+
+
+def test_unchanged_export_returns_304(client, main_module):
+    """Test a browser with the current ETag gets a 304 without a query."""
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00D1'))
+    first = client.get('/q?ID=U-00D1')
+    etag = first.headers['ETag']
+
+    again = client.get('/q?ID=U-00D1', headers={'If-None-Match': etag})
+
+    assert first.status_code == 200
+    assert again.status_code == 304
+
+
+def test_new_result_changes_etag(client, main_module):
+    """Test storing a result for the test invalidates the cached export."""
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00D2'))
+    first = client.get('/q?ID=U-00D2')
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00D2').replace('\t1\t', '\t2\t', 1))
+
+    second = client.get('/q?ID=U-00D2', headers={'If-None-Match': first.headers['ETag']})
+
+    assert second.status_code == 200
+    assert second.headers['ETag'] != first.headers['ETag']
+    assert len(second.get_data(as_text=True).splitlines()) == 2
+
+
+def test_purge_changes_every_etag(client, main_module):
+    """Test a purge that deleted records invalidates cached exports and ETags."""
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00D3'))
+    main_module.storage.insert_results([make_record('U-00D4', '1', datetime(2020, 1, 1))])
+    first = client.get('/q?ID=U-00D3')
+    old = client.get('/q?ID=U-00D4')
+
+    purge(main_module.storage, datetime(2021, 1, 1))
+
+    assert client.get('/q?ID=U-00D3', headers={'If-None-Match': first.headers['ETag']}).status_code == 200
+    purged = client.get('/q?ID=U-00D4', headers={'If-None-Match': old.headers['ETag']})
+    assert purged.status_code == 200
+    assert purged.get_data() == b''
+
+
+def test_failed_version_bump_is_retried(client, main_module, monkeypatch):
+    """Test a version bump that fails is not lost: the cache entry is dropped and the bump retried."""
+    line = RESULT.replace('U-00A1', 'U-00D5')
+    post_result(client, main_module, line)
+    first = client.get('/q?ID=U-00D5')
+    increment = main_module.storage.increment_counters
+
+    def unavailable(deltas):
+        raise RuntimeError('storage unavailable')
+
+    monkeypatch.setattr(main_module.storage, 'increment_counters', unavailable)
+    post_result(client, main_module, line.replace('\t1\t', '\t2\t', 1))
+
+    assert 'U-00D5' not in main_module.export_cache._entries
+    assert len(client.get('/q?ID=U-00D5').get_data(as_text=True).splitlines()) == 2
+    monkeypatch.setattr(main_module.storage, 'increment_counters', increment)
+    main_module.rollups.flush()
+    assert client.get('/q?ID=U-00D5').headers['ETag'] != first.headers['ETag']
+
+
+def test_query_page_reads_only_its_counters(client, main_module, monkeypatch):
+    """Test /query does not read the export version counters, however many tests there are, nor old days."""
+    prefixes = []
+    read_counters = main_module.storage.read_counters
+
+    def spy(prefix=''):
+        prefixes.append(prefix)
+        return read_counters(prefix)
+
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00D6'))
+    monkeypatch.setattr(main_module.storage, 'read_counters', spy)
+
+    assert client.get('/query').status_code == 200
+    assert prefixes == list(query_prefixes(date.today()))
+    assert len(prefixes) == 3 + 7 and prefixes[-1] == f'day:{date.today():%Y-%m-%d}'
@@ -0,0 +1,69 @@
+"""Tests for the NDJSON, Arrow and Parquet exports of /q."""
+import io
+import json
+
+import pytest
+
+from records import CANONICAL_SCHEMA
+from tests.conftest import post_result
+from tests.test_main import RESULT
+
+
+@pytest.fixture
+def stored(client, main_module):
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00F1'))
+
+
+def test_ndjson_export_has_typed_columns(client, stored):
+    """Test ?format=ndjson returns one typed JSON object per record."""
+    response = client.get('/q?ID=U-00F1&format=ndjson')
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+    assert response.mimetype == 'application/x-ndjson'
+    assert response.headers['Content-Disposition'] == 'attachment; filename=testID-U_00F1.ndjson'
+    assert list(rows[0]) == CANONICAL_SCHEMA
+    assert rows[0]['testCounter'] == 1
+    assert rows[0]['elapsed_frames'] == 139
+    assert rows[0]['window_size'] == '412x766'
+
+
+def test_format_from_accept_header(client, stored):
+    """Test the Accept header picks the format when no parameter is given."""
+    response = client.get('/q?ID=U-00F1', headers={'Accept': 'application/x-ndjson'})
+
+    assert response.mimetype == 'application/x-ndjson'
+
+
+def test_browser_accept_header_gets_text(client, stored):
+    """Test a browser's Accept header keeps the tab-separated export."""
+    response = client.get('/q?ID=U-00F1', headers={'Accept': 'text/html,*/*;q=0.8'})
+
+    assert response.mimetype == 'text/plain'
+
+
+def test_unknown_format_is_refused(client):
+    """Test an unknown ?format= gets a 400."""
+    assert client.get('/q?ID=U-00F1&format=xlsx').status_code == 400
+
+
+def test_arrow_stream_export(client, stored):
+    """Test ?format=arrow returns an Arrow IPC stream with the canonical schema."""
+    pa = pytest.importorskip('pyarrow')
+    response = client.get('/q?ID=U-00F1&format=arrow')
+
+    table = pa.ipc.open_stream(io.BytesIO(response.get_data())).read_all()
+
+    assert table.schema.names == CANONICAL_SCHEMA
+    assert set(table.column('T0_IDLE').to_pylist()) == {10}
+
+
+def test_parquet_export(client, stored):
+    """Test ?format=parquet returns a Parquet file."""
+    pytest.importorskip('pyarrow')
+    import pyarrow.parquet as pq
+    response = client.get('/q?ID=U-00F1&format=parquet')
+
+    table = pq.read_table(io.BytesIO(response.get_data()))
+
+    assert table.num_rows >= 1
+    assert set(table.column('status').to_pylist()) == {'correct'}
@@ -0,0 +1,120 @@
+"""Tests for the incremental changes feed."""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from google.api_core import exceptions
+
+from feed import decode_token, encode_token, parse_since, read_changes
+from storage.datastore_backend import DatastoreStorage
+from tests.test_storage import make_record
+
+NOW = datetime(2026, 6, 1, 12, 0, 0)
+
+
+def stamps(n, start=NOW - timedelta(hours=1)):
+    return [start + timedelta(seconds=i) for i in range(n)]
+
+
+def test_changes_come_in_timestamp_order_across_pages(sqlite_storage):
+    """Test paging with tokens returns every new record exactly once."""
+    sqlite_storage.insert_results([make_record(f'U-{n:04d}', '1', stamp)
+                                   for n, stamp in zip((3, 1, 4, 2, 5), stamps(5))])
+    since = NOW - timedelta(days=1)
+
+    seen = []
+    records, token = read_changes(sqlite_storage, since=since, limit=2, now=NOW)
+    while records:
+        seen.extend(records)
+        records, token = read_changes(sqlite_storage, token=token, limit=2, now=NOW)
+
+    assert [r['timeStamp'] for r in seen] == stamps(5)
+
+
+def test_token_only_moves_new_rows(sqlite_storage):
+    """Test a later call with the last token returns only what arrived since."""
+    sqlite_storage.insert_results([make_record('U-0001', '1', NOW - timedelta(hours=2))])
+    records, token = read_changes(sqlite_storage, since=NOW - timedelta(days=1), now=NOW)
+    assert len(records) == 1
+
+    sqlite_storage.insert_results([make_record('U-0001', '2', NOW + timedelta(minutes=5))])
+    records, token = read_changes(sqlite_storage, token=token, now=NOW + timedelta(hours=1))
+
+    assert [r['testIndex'] for r in records] == ['2']
+
+
+def test_unsettled_records_wait(sqlite_storage):
+    """Test records younger than the settle time are held back."""
+    sqlite_storage.insert_results([make_record('U-0001', '1', NOW - timedelta(seconds=5))])
+
+    records, token = read_changes(sqlite_storage, since=NOW - timedelta(hours=1), settle=30, now=NOW)
+    assert records == []
+
+    records, _ = read_changes(sqlite_storage, token=token, settle=30, now=NOW + timedelta(minutes=1))
+    assert len(records) == 1
+
+
+def test_garbage_token_is_rejected():
+    """Test a token that was not issued by the feed raises ValueError."""
+    with pytest.raises(ValueError):
+        decode_token('not-a-token')
+
+
+@pytest.mark.parametrize('cursor', ['forged', 'a|b', '2026-05-01|1|2', 5])
+def test_forged_cursor_in_token_is_a_bad_request(client, cursor):
+    """Test a well-formed token carrying a cursor the storage never handed out gets a 400."""
+    token = encode_token(NOW - timedelta(days=1), NOW, cursor)
+
+    assert client.get(f'/q?token={token}').status_code == 400
+
+
+def test_datastore_refusing_the_cursor_raises_value_error(standin_client, monkeypatch):
+    """Test the InvalidArgument Datastore raises for a stale or forged cursor becomes a ValueError."""
+    class RefusingQuery:
+        order = []
+
+        def add_filter(self, filter):
+            pass
+
+        def fetch(self, limit=None, start_cursor=None):
+            raise exceptions.InvalidArgument('invalid cursor')
+
+    storage = DatastoreStorage(standin_client)
+    monkeypatch.setattr(standin_client, 'query', lambda **kwargs: RefusingQuery(), raising=False)
+
+    with pytest.raises(ValueError):
+        storage.query_changes(NOW - timedelta(days=1), NOW, cursor='forged')
+
+
+def test_feed_endpoint_returns_next_token(client):
+    """Test /q?since returns text lines plus X-Next-Token."""
+    response = client.get('/q?since=2026-01-01')
+
+    assert response.status_code == 200
+    assert response.headers['X-Next-Token']
+    assert client.get('/q?token=bogus').status_code == 400
+
+
+def test_since_with_utc_offset_is_local_time(client):
+    """Test a since with Z or an offset is read as the same moment in local time."""
+    since = parse_since('2026-05-01T10:00:00+00:00')
+
+    assert since.tzinfo is None
+    assert since == datetime(2026, 5, 1, 10, 0, tzinfo=timezone.utc).astimezone().replace(tzinfo=None)
+    assert client.get('/q?since=2026-05-01T10:00:00Z').status_code == 200
+    assert client.get('/q?since=2026-05-01T12:00:00%2B02:00').status_code == 200
+
+
+def test_late_stored_results_keep_receive_time_and_reach_the_feed(sqlite_storage):
+    """Test a result replayed long after it was received is stored as received and still read by the feed."""
+    from ingest import store_results
+    from rollups import Rollups
+
+    first = read_changes(sqlite_storage, since=NOW - timedelta(days=1), settle=0)[1]
+    late = make_record('U-0001', '1', NOW - timedelta(days=2))
+
+    store_results(sqlite_storage, Rollups(sqlite_storage, interval=3600), [late])
+    records, _ = read_changes(sqlite_storage, token=first, settle=0)
+
+    assert [(record['timeStamp'], record['value']) for record in records] == [(late['timeStamp'], late['value'])]
+    assert records[0]['storedAt'] > NOW
@@ -0,0 +1,81 @@
+"""Tests for block-reserving test ID allocation."""
+import threading
+
+import pytest
+
+from idalloc import BlockIDAllocator, alnum4
+from storage.datastore_backend import DatastoreStorage
+
+
+def test_first_id_matches_original_counter(standin_client):
+    """Test the first ID is 101, as with the per-request counter."""
+    allocator = BlockIDAllocator(DatastoreStorage(standin_client), block_size=20)
+
+    assert allocator.next_id() == 101
+    assert allocator.next_id() == 102
+
+
+def test_block_is_reserved_in_one_transaction(standin_client):
+    """Test a whole block is served from memory after one transaction."""
+    allocator = BlockIDAllocator(DatastoreStorage(standin_client), block_size=10)
+
+    ids = [allocator.next_id() for _ in range(25)]
+
+    assert ids == list(range(101, 126))
+    assert standin_client.transactions == 3
+
+
+def test_instances_never_share_ids(standin_client):
+    """Test two allocators on the same counter hand out disjoint IDs."""
+    storage = DatastoreStorage(standin_client)
+    first = BlockIDAllocator(storage, block_size=5)
+    second = BlockIDAllocator(storage, block_size=5)
+
+    ids = [first.next_id(), second.next_id(), first.next_id(), second.next_id()]
+
+    assert len(set(ids)) == len(ids)
+    assert ids[1] == 106
+
+
+def test_concurrent_clients_get_unique_codes(standin_client):
+    """Test IDs stay unique and distinct through alnum4 under concurrency."""
+    allocator = BlockIDAllocator(DatastoreStorage(standin_client), block_size=7)
+    seen = []
+
+    def worker():
+        for _ in range(50):
+            seen.append(alnum4(allocator.next_id()))
+
+    threads = [threading.Thread(target=worker) for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(seen) == 500
+    assert len(set(seen)) == 500
+
+
+def test_block_size_must_be_positive(standin_client):
+    """Test a zero block size is rejected."""
+    with pytest.raises(ValueError):
+        BlockIDAllocator(DatastoreStorage(standin_client), block_size=0)
+
+
+def test_prefetch_reserves_a_block_ahead(standin_client):
+    """Test a warm-up prefetch leaves the first ID to be served from memory."""
+    allocator = BlockIDAllocator(DatastoreStorage(standin_client), block_size=10)
+
+    allocator.prefetch()
+    allocator.prefetch()
+    transactions = standin_client.transactions
+
+    assert allocator.next_id() == 101
+    assert standin_client.transactions == transactions == 1
+
+
+def test_datastore_client_is_created_on_first_use():
+    """Test creating the backend does not build a client or look up credentials."""
+    storage = DatastoreStorage()
+
+    assert storage._client is None
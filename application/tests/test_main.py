@@ -0,0 +1,176 @@
+"""Tests for the Flask routes in main.py."""
+import os
+from datetime import datetime
+
+from records import parse_result
+from tests.conftest import post_result
+
+RESULT = 'U-00A1\t1\tPARAMS-0\t10\t60\t20\t60\t240\t3,0\t3,0\tcorrect\t139\t0\t412x766\t\t\tgeen\t\t\t'
+
+
+def test_index_without_set_redirects_to_a_set(client):
+    """Test a bare / picks an A/B test set and does not get cached."""
+    response = client.get('/')
+
+    assert response.status_code == 302
+    assert response.headers['Location'].startswith('/?set=')
+    assert response.headers['Cache-Control'] == 'no-store'
+
+
+def test_index_page_is_cacheable(client):
+    """Test the page for a set is the same for everyone and may be cached."""
+    first = client.get('/?set=2')
+    second = client.get('/?set=2')
+
+    assert first.get_data() == second.get_data()
+    assert first.headers['Cache-Control'].startswith('public, max-age=')
+    assert 'testID' not in first.get_data(as_text=True)
+    assert 'animations-2.js"' not in first.get_data(as_text=True)
+    assert client.get('/?set=2', headers={'If-None-Match': first.headers['ETag']}).status_code == 304
+
+
+def test_id_endpoint_hands_out_test_ids(client):
+    """Test every test start gets a fresh U- test ID that is never cached."""
+    first = client.post('/id')
+    second = client.post('/id')
+
+    assert first.get_json()['testID'].startswith('U-')
+    assert first.get_json() != second.get_json()
+    assert first.headers['Cache-Control'] == 'no-store'
+
+
+def test_fingerprinted_static_files_are_immutable(client):
+    """Test a static URL with its fingerprint may be cached for a year."""
+    page = client.get('/?set=0').get_data(as_text=True)
+    url = page[page.index('/static/game.js?v='):].split('"')[0]
+
+    response = client.get(url)
+
+    assert response.headers['Cache-Control'] == 'public, max-age=31536000, immutable'
+    response.close()
+
+
+def test_posted_result_is_exported(client, main_module):
+    """Test a posted line comes back from /q with a server timestamp."""
+    assert post_result(client, main_module, RESULT).status_code == 200
+
+    response = client.get('/q?ID=U-00A1')
+    lines = response.get_data(as_text=True).splitlines()
+
+    assert response.headers['Content-Disposition'] == 'attachment; filename=testID-U_00A1.txt'
+    assert len(lines) == 1
+    assert lines[0].startswith(RESULT + '\t')
+
+
+def test_malformed_result_is_refused(client):
+    """Test a line missing the test columns gets a 400."""
+    assert client.post('/', data=b'garbage').status_code == 400
+
+
+def test_query_page_shows_counts(client, main_module):
+    """Test /query shows the number of received results."""
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00A2'))
+    expected = main_module.count_results()['total']
+
+    page = client.get('/query').get_data(as_text=True)
+
+    assert expected >= 1
+    assert f'Ik heb al {expected} resultaten' in page
+
+
+def test_batch_upload_stores_every_line(client):
+    """Test /batch stores all valid lines in order and counts bad ones."""
+    lines = [RESULT.replace('U-00A1', 'U-00B1').replace('\t1\t', f'\t{n}\t', 1) for n in range(1, 4)]
+    body = '\n'.join(lines[:2] + ['garbage'] + lines[2:]) + '\n'
+
+    response = client.post('/batch', data=body.encode('utf-8'))
+
+    assert response.get_json() == {'accepted': 3, 'rejected': 1}
+    exported = client.get('/q?ID=U-00B1').get_data(as_text=True).splitlines()
+    assert [line.split('\t')[1] for line in exported] == ['1', '2', '3']
+
+
+def test_over_long_testID_is_refused_alone(client):
+    """Test a line whose testID Datastore could not take is refused without the rest of its batch."""
+    long_line = RESULT.replace('U-00A1', 'U-' + 'x' * 2000)
+
+    assert client.post('/', data=long_line.encode('utf-8')).status_code == 400
+    response = client.post('/batch', data=(long_line + '\n' + RESULT.replace('U-00A1', 'U-00B3')).encode('utf-8'))
+    assert response.get_json() == {'accepted': 1, 'rejected': 1}
+
+
+def test_batch_upload_accepts_gzip(client):
+    """Test a gzip-encoded batch is decompressed before parsing."""
+    import gzip
+    body = gzip.compress((RESULT.replace('U-00A1', 'U-00B2') + '\n').encode('utf-8'))
+
+    response = client.post('/batch', data=body, headers={'Content-Encoding': 'gzip'})
+
+    assert response.get_json()['accepted'] == 1
+
+
+def test_batch_upload_rejects_bad_gzip(client):
+    """Test a body that claims gzip but is not gets a 400."""
+    response = client.post('/batch', data=b'plain', headers={'Content-Encoding': 'gzip'})
+
+    assert response.status_code == 400
+
+
+def test_duplicate_batches_are_reported(client, main_module):
+    """Test a resent batch is not stored twice and shows up in /collisions."""
+    body = (RESULT.replace('U-00A1', 'U-00E1') + '\n').encode('utf-8')
+    main_module.writer.join()
+    before = client.get('/collisions').get_json()
+
+    client.post('/batch', data=body)
+    client.post('/batch', data=body)
+    main_module.rollups.flush()
+
+    assert len(client.get('/q?ID=U-00E1').get_data(as_text=True).splitlines()) == 1
+    assert client.get('/collisions').get_json()['duplicates'] == before['duplicates'] + 1
+
+
+def test_warmup_prepares_the_instance(client, main_module):
+    """Test /_ah/warmup reserves the first ID block and compiles the templates."""
+    response = client.get('/_ah/warmup')
+
+    assert response.status_code == 200
+    assert main_module.allocator._next < main_module.allocator._end
+
+
+def test_export_of_another_namespace(client, main_module):
+    """Test /q?namespace= exports an earlier course year and nothing else."""
+    earlier = main_module.storage.in_namespace('2025')
+    earlier.insert_results([parse_result(RESULT.replace('U-00A1', 'U-00G1'), datetime(2025, 6, 1))])
+
+    assert client.get('/q?ID=U-00G1&namespace=2025').get_data(as_text=True).startswith('U-00G1\t')
+    assert client.get('/q?ID=U-00G1').get_data(as_text=True) == ''
+    assert client.get('/q?namespace=__kind__').status_code == 400
+
+
+def test_unknown_namespace_is_not_created(client, main_module):
+    """Test exporting a namespace nothing was stored in answers 404 and leaves no file behind."""
+    path = main_module.storage.path
+
+    assert client.get('/q?namespace=a1').status_code == 404
+    assert not os.path.exists(os.path.splitext(path)[0] + '.a1.sqlite3')
+    assert client.get('/q?ID=U-00A1&namespace=__default__').status_code == 200
+
+
+def test_export_of_one_test_set(client):
+    """Test /q?set= streams one testSet and pages through it with limit and cursor."""
+    body = '\n'.join(RESULT.replace('U-00A1', testID).replace('PARAMS-0', testSet)
+                     for testID, testSet in (('U-00J2', 'PARAMS-9'), ('U-00J1', 'PARAMS-9'), ('U-00J3', 'PARAMS-8')))
+    client.post('/batch', data=body.encode('utf-8'))
+
+    response = client.post('/q', data={'set': 'PARAMS-9'})
+    assert response.headers['Content-Disposition'] == 'attachment; filename=testset-PARAMS_9.txt'
+    assert [line[:6] for line in response.get_data(as_text=True).splitlines()] == ['U-00J1', 'U-00J2']
+
+    first = client.get('/q?set=PARAMS-9&limit=1')
+    assert first.get_data(as_text=True).startswith('U-00J1\t')
+    second = client.get('/q?set=PARAMS-9&limit=1&cursor=' + first.headers['X-Next-Cursor'])
+    assert second.get_data(as_text=True).startswith('U-00J2\t')
+    last = client.get('/q?set=PARAMS-9&limit=1&cursor=' + second.headers['X-Next-Cursor'])
+    assert (last.get_data(as_text=True), last.headers['X-Next-Cursor']) == ('', '')
+    assert client.get('/q?set=PARAMS-9&limit=1&cursor=junk').status_code == 400
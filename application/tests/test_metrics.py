@@ -0,0 +1,48 @@
+"""Tests for request and storage instrumentation."""
+import metrics
+from tests.conftest import post_result
+from tests.test_main import RESULT
+
+
+def test_histogram_renders_cumulative_buckets():
+    """Test the Prometheus text format of a labelled histogram."""
+    registry = metrics.Registry()
+    histogram = registry.histogram('demo_seconds', 'Demo.', ('route',), buckets=(0.1, 1.0))
+    histogram.observe(0.05, '/')
+    histogram.observe(0.5, '/')
+    histogram.observe(5, '/')
+
+    text = registry.render()
+
+    assert '# TYPE demo_seconds histogram' in text
+    assert 'demo_seconds_bucket{route="/",le="0.1"} 1' in text
+    assert 'demo_seconds_bucket{route="/",le="1.0"} 2' in text
+    assert 'demo_seconds_bucket{route="/",le="+Inf"} 3' in text
+    assert 'demo_seconds_count{route="/"} 3' in text
+
+
+def test_storage_calls_are_timed(sqlite_storage):
+    """Test wrapped storage calls and query pages are counted."""
+    storage = metrics.instrument_storage(sqlite_storage)
+    before = metrics.STORAGE_SECONDS.count('SQLiteStorage', 'allocate_ids')
+
+    storage.allocate_ids(5)
+    list(storage.query_results())
+
+    assert metrics.STORAGE_SECONDS.count('SQLiteStorage', 'allocate_ids') == before + 1
+    assert metrics.STORAGE_SECONDS.count('SQLiteStorage', 'query_results') >= 1
+
+
+def test_metrics_endpoint_reports_routes_and_streamed_bytes(client, main_module):
+    """Test /metrics shows per-route latency and bytes streamed by /q."""
+    post_result(client, main_module, RESULT.replace('U-00A1', 'U-00C1'))
+    before = metrics.RESPONSE_BYTES.value('/q')
+    response = client.get('/q')
+    body = response.get_data()
+    response.close()
+
+    text = client.get('/metrics').get_data(as_text=True)
+
+    assert metrics.RESPONSE_BYTES.value('/q') == before + len(body)
+    assert 'donald_request_seconds_count{route="/q",method="GET",status="200"}' in text
+    assert 'donald_write_queue_depth 0' in text
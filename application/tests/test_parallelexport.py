@@ -0,0 +1,73 @@
+"""Tests for the partitioned full export."""
+import pytest
+
+from idalloc import alnum4
+from parallelexport import RANGES_PER_THREAD, lowest_id, parallel_query_results, partition_bounds
+from tests.test_storage import make_record
+
+
+def test_partition_bounds_cover_the_keyspace():
+    """Test the ranges are contiguous, ordered and open at both ends."""
+    bounds = partition_bounds(last_id=1100, partitions=4)
+
+    assert len(bounds) == 4
+    assert bounds[0][0] is None and bounds[-1][1] is None
+    assert all(left[1] == right[0] for left, right in zip(bounds, bounds[1:]))
+    assert [end for _, end in bounds[:-1]] == sorted(end for _, end in bounds[:-1])
+
+
+def test_partition_bounds_with_few_ids():
+    """Test a counter that has barely moved still gives one open range."""
+    assert partition_bounds(last_id=100, partitions=4) == [(None, alnum4(101)), (alnum4(101), None)]
+
+
+def test_ranges_cover_the_exported_tests_not_earlier_years(sqlite_storage):
+    """Test the ranges are cut from the lowest exported test, so IDs of earlier years leave none empty."""
+    sqlite_storage.allocate_ids(5000)
+    first = sqlite_storage.allocate_ids(40)
+    sqlite_storage.insert_results([make_record(alnum4(first + n), '1') for n in range(40)])
+
+    bounds = partition_bounds(sqlite_storage.last_id(), 2 * RANGES_PER_THREAD,
+                              first_id=lowest_id(sqlite_storage) - 1)
+    sizes = [sum(len(page) for page in sqlite_storage.query_results(start=start, end=end))
+             for start, end in bounds]
+
+    assert lowest_id(sqlite_storage) == first
+    assert len(bounds) == 2 * RANGES_PER_THREAD and all(sizes)
+
+
+@pytest.mark.parametrize('concurrency', [1, 2, 5])
+def test_parallel_export_matches_serial_order(sqlite_storage, concurrency):
+    """Test the merged ranges return the same records in the same order."""
+    first = sqlite_storage.allocate_ids(60)
+    records = [make_record(alnum4(first + n), str(index)) for n in range(60) for index in range(1, 4)]
+    records.append(make_record('legacy', '1'))
+    sqlite_storage.insert_results(records)
+    serial = [sort_key for page in sqlite_storage.query_results(page_size=7)
+              for sort_key in ((r['testID'], r['testIndex']) for r in page)]
+
+    pages = list(parallel_query_results(sqlite_storage, page_size=7, concurrency=concurrency))
+
+    assert [(r['testID'], r['testIndex']) for page in pages for r in page] == serial
+    assert all(len(page) == 7 for page in pages[:-1])
+
+
+def test_parallel_export_raises_storage_errors(sqlite_storage):
+    """Test an error in one range reaches the reader."""
+    def failing(**kwargs):
+        raise RuntimeError('backend down')
+        yield
+
+    sqlite_storage.query_results = failing
+
+    with pytest.raises(RuntimeError):
+        list(parallel_query_results(sqlite_storage, concurrency=3))
+
+
+def test_only_datastore_exports_in_parallel_by_default(main_module, sqlite_storage):
+    """Test the full export reads serially unless the backend is Datastore."""
+    from storage.datastore_backend import DatastoreStorage
+
+    assert sqlite_storage.export_concurrency == 1
+    assert DatastoreStorage.export_concurrency > 1
+    assert main_module.EXPORT_CONCURRENCY == 1
@@ -0,0 +1,69 @@
+"""Tests for the per testSet and level performance counters."""
+from datetime import datetime
+
+from performance import frame_bucket, percentile, performance_keys, summarize
+from records import parse_result
+from rollups import Rollups
+
+LINE = 'U-0001\t{n}\tPARAMS-{s}\t10\t60\t20\t60\t240\t{sequence}\t3,0\t{status}\t{frames}\t0\t412x766'
+
+
+def result(n, testSet, sequence, status, frames):
+    return parse_result(LINE.format(n=n, s=testSet, sequence=sequence, status=status, frames=frames),
+                        datetime(2026, 4, 1))
+
+
+def test_result_counts_under_its_set_and_level():
+    """Test a result adds to its status and elapsed-frame bucket counters."""
+    keys = performance_keys(result(1, 2, '3,0,1', 'wrong', 100))
+
+    assert keys == ['perf:PARAMS-2|3|status:wrong', 'perf:PARAMS-2|3|frames:105']
+    assert performance_keys(parse_result('U-0001\t1\tPARAMS-0', datetime(2026, 4, 1))) == []
+
+
+def test_frame_buckets_are_closed_above():
+    """Test a value on a bound counts in that bound's bucket."""
+    assert (frame_bucket(0), frame_bucket(60), frame_bucket(61), frame_bucket(5000)) == ('10', '60', '75', 'inf')
+
+
+def test_percentiles_interpolate_within_a_bucket():
+    """Test percentiles are interpolated between the bounds of the bucket they fall in."""
+    buckets = {'60': 2, '120': 2}
+
+    assert percentile(buckets, 50) == 60
+    assert percentile(buckets, 75) == 112.5
+    assert percentile({'inf': 3}, 50) == 900
+    assert percentile({}, 50) is None
+
+
+def test_summary_from_rollups(sqlite_storage):
+    """Test attempts, rates and percentiles per testSet and level after a flush."""
+    rollups = Rollups(sqlite_storage, interval=0)
+    rollups.add([result(1, 0, '3,0', 'correct', 50), result(2, 0, '3,0', 'correct', 55),
+                 result(3, 0, '3,0', 'timeout', 361), result(4, 0, '3,0,1', 'wrong', 90),
+                 result(5, 1, '3,0', 'correct', 30)])
+
+    summary = summarize(sqlite_storage.read_counters('perf:'))
+
+    assert list(summary) == ['PARAMS-0', 'PARAMS-1']
+    level = summary['PARAMS-0']['2']
+    assert level['attempts'] == 3
+    assert level['rates'] == {'correct': 2 / 3, 'wrong': 0, 'timeout': 1 / 3}
+    assert 45 < level['elapsed_frames']['p50'] <= 60
+    assert level['elapsed_frames']['p99'] > 360
+    assert summary['PARAMS-0']['3']['rates']['wrong'] == 1
+
+
+def test_performance_endpoint(client, main_module):
+    """Test /performance reports the results posted so far, cacheable for a short while."""
+    body = '\n'.join(LINE.format(n=n, s=7, sequence='3,0', status='correct', frames=40).replace('U-0001', 'U-00H1')
+                     for n in range(1, 4))
+    client.post('/batch', data=body.encode('utf-8'))
+    main_module.rollups.flush()
+    main_module.performance_summary.cache_clear()
+
+    response = client.get('/performance')
+
+    assert response.headers['Cache-Control'].startswith('public, max-age=')
+    level = response.get_json()['testSets']['PARAMS-7']['2']
+    assert level['attempts'] == 3 and level['rates']['correct'] == 1
@@ -0,0 +1,63 @@
+"""Tests for the retention purge job."""
+from datetime import datetime
+
+from purge import purge, retention_cutoff
+from tests.test_storage import make_record
+
+
+def count(storage):
+    return sum(len(page) for page in storage.query_results())
+
+
+def test_purge_deletes_only_old_records(sqlite_storage):
+    """Test records inside the retention window are kept."""
+    now = datetime(2026, 6, 1)
+    sqlite_storage.insert_results([make_record('U-0001', str(n), datetime(2024, 1, 1)) for n in range(7)]
+                                  + [make_record('U-0002', '1', datetime(2026, 5, 30))])
+    reports = []
+
+    progress = purge(sqlite_storage, retention_cutoff(365, now), batch_size=3, report=reports.append)
+
+    assert progress.done
+    assert progress.deleted == 7
+    assert len(reports) == progress.batches == 4
+    assert count(sqlite_storage) == 1
+
+
+def test_purge_resumes_from_cursor(sqlite_storage):
+    """Test a run stopped by its time budget can be resumed with its cursor."""
+    sqlite_storage.insert_results([make_record('U-0001', str(n), datetime(2024, 1, 1)) for n in range(5)])
+    before = datetime(2025, 1, 1)
+
+    first = purge(sqlite_storage, before, batch_size=2, time_budget=0)
+    assert not first.done and first.deleted == 2
+
+    second = purge(sqlite_storage, before, batch_size=2, cursor=first.cursor)
+    assert second.done and second.deleted == 3
+    assert count(sqlite_storage) == 0
+
+
+def test_purge_endpoint_requires_cron(client):
+    """Test the purge endpoint refuses requests that do not come from cron."""
+    assert client.get('/tasks/purge').status_code == 403
+
+
+def test_purge_endpoint_is_off_without_retention(client, monkeypatch):
+    """Test nothing is deleted unless RETENTION_DAYS is configured."""
+    monkeypatch.delenv('RETENTION_DAYS', raising=False)
+
+    response = client.get('/tasks/purge', headers={'X-Appengine-Cron': 'true'})
+
+    assert response.get_json()['disabled'] is True
+
+
+def test_purge_stays_in_its_namespace(sqlite_storage):
+    """Test dropping an old namespace leaves the records of the current one alone."""
+    earlier = sqlite_storage.in_namespace('2025')
+    earlier.insert_results([make_record('U-0001', str(n)) for n in range(3)])
+    sqlite_storage.insert_results([make_record('U-0002', '1')])
+
+    progress = purge(earlier, datetime.max)
+
+    assert progress.deleted == 3
+    assert count(earlier) == 0 and count(sqlite_storage) == 1
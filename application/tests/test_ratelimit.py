@@ -0,0 +1,132 @@
+"""Tests for the rate limits and load shedding."""
+import pytest
+from flask import Flask
+
+import ratelimit
+from ratelimit import DEFAULT_LIMITS, Limit, LoadShedder, RateLimiter, TokenBucket
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_bucket_refills_at_rate():
+    """Test a burst is allowed and further tokens come at the configured rate."""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=3, clock=clock)
+
+    assert [bucket.take() for _ in range(3)] == [0, 0, 0]
+    assert bucket.take() == pytest.approx(0.5)
+    clock.now = 0.5
+    assert bucket.take() == 0
+
+
+def test_limiter_is_per_client_and_global():
+    """Test one client's flood does not use up another client's bucket, until the global one is empty."""
+    limiter = RateLimiter(Limit(per_ip_rate=1, per_ip_burst=2, total_rate=1, total_burst=3), clock=FakeClock())
+
+    assert [limiter.check('a') for _ in range(3)][:2] == [0, 0]
+    assert limiter.check('a') > 0
+    assert limiter.check('b') == 0
+    assert limiter.check('c') > 0
+
+
+def test_limit_from_text():
+    """Test the RATE_LIMIT_<GROUP> format."""
+    assert Limit.parse('1:10,20:40') == Limit(1, 10, 20, 40)
+
+
+def test_shedder_recovers_without_observations():
+    """Test shedding stops once slow calls are older than the hold time."""
+    clock = FakeClock()
+    shedder = LoadShedder(threshold=0.5, hold=5, weight=1, clock=clock)
+
+    shedder.observe(2.0)
+    assert shedder.overloaded()
+    clock.now = 6
+    assert not shedder.overloaded()
+    shedder.observe(0.1)
+    assert not shedder.overloaded()
+
+
+@pytest.fixture
+def limited_app():
+    app = Flask(__name__)
+    app.add_url_rule('/q', 'retrieve', lambda: 'export')
+    app.add_url_rule('/', 'index', lambda: 'page')
+    shedder = LoadShedder(threshold=0.5)
+    ratelimit.init_app(app, groups={('retrieve', 'GET'): 'export'}, shed={'retrieve'},
+                       limits={'export': Limit(1, 2, 100, 100)}, shedder=shedder)
+    yield app, shedder
+    ratelimit.metrics.STORAGE_LISTENERS.remove(shedder.observe)
+
+
+def test_flood_gets_429_with_retry_after(limited_app):
+    """Test requests past the per IP burst are refused, other routes are not."""
+    app, _ = limited_app
+    client = app.test_client()
+
+    statuses = [client.get('/q').status_code for _ in range(3)]
+    refused = client.get('/q')
+
+    assert statuses == [200, 200, 429]
+    assert int(refused.headers['Retry-After']) >= 1
+    assert client.get('/').status_code == 200
+    assert client.get('/q', headers={'X-Appengine-User-IP': '10.0.0.2'}).status_code == 200
+
+
+def test_slow_storage_sheds_with_503(limited_app):
+    """Test storage latency over the threshold turns requests away with a 503."""
+    app, shedder = limited_app
+    shedder.observe(3.0)
+
+    response = app.test_client().get('/q')
+
+    assert shedder.overloaded()
+    assert response.status_code == 503
+    assert 'Retry-After' in response.headers
+
+
+def test_lecture_behind_one_address_gets_through(client, main_module):
+    """Test the default limits let a 300 student lecture behind one NAT address play, even while storage is slow."""
+    headers = {'X-Appengine-User-IP': '10.1.2.3'}
+    line = 'U-00K1\t{n}\tPARAMS-1\t10\t60\t20\t60\t240\t3,0\t3,0\tcorrect\t40\t2\t412x766'
+    main_module.app.config['RATE_LIMITS'] = True
+    try:
+        pages = [client.get('/?set=1', headers=headers).status_code for _ in range(300)]
+        ids = [client.post('/id', headers=headers).status_code for _ in range(300)]
+        posts = [client.post('/', data=line.format(n=n).encode('utf-8'), headers=headers).status_code
+                 for n in range(301, 601)]
+        exports = [client.get('/q?ID=U-00K1', headers=headers).status_code for _ in range(300)]
+        main_module.shedder.observe(30.0)
+        batches = [client.post('/batch', data=line.format(n=n).encode('utf-8'), headers=headers).status_code
+                   for n in range(1, 301)]
+        # the writes above were fast; storage turns slow again
+        main_module.shedder.observe(30.0)
+        export = client.get('/q', headers=headers)
+    finally:
+        main_module.app.config['RATE_LIMITS'] = False
+        main_module.shedder.average = 0.0
+
+    assert set(pages) == {200}
+    assert set(ids) == {200}
+    assert set(posts) == {200}
+    assert set(exports) == {200}
+    assert set(batches) == {200}
+    assert export.status_code == 503
+
+
+def test_one_address_flooding_results_is_bounded():
+    """Test the default ingest limit refuses an address posting past a lecture's worth of results."""
+    limit = DEFAULT_LIMITS['ingest']
+    limiter = RateLimiter(limit, clock=FakeClock())
+
+    waits = [limiter.check('10.1.2.3') for _ in range(int(limit.per_ip_burst) + 1)]
+
+    assert limit.per_ip_burst >= 300 * 10
+    assert set(waits[:-1]) == {0} and waits[-1] > 0
+    assert limiter.check('10.9.9.9') == 0
@@ -0,0 +1,81 @@
+"""Tests for parsing posted result lines."""
+from datetime import datetime
+
+import pytest
+
+from records import CANONICAL_SCHEMA, MAX_KEY_FIELD_BYTES, TYPED_FIELDS, canonical_row, parse_result
+
+STAMP = datetime(2026, 3, 4, 10, 11, 12, 131415)
+BASE = 'U-00ZI\t3\tPARAMS-2\t20\t120\t40\t120\t360\t1,3,3,0\t1,3,3\ttimeout\t361\t1\t412x766'
+
+
+def test_base_layout_is_typed():
+    """Test the 14 base columns become typed properties."""
+    record = parse_result(BASE, STAMP)
+
+    assert record['testID'] == 'U-00ZI'
+    assert record['testIndex'] == '3'
+    assert record['testSet'] == 'PARAMS-2'
+    assert record['T4_COUNTDOWN'] == 360
+    assert record['status'] == 'timeout'
+    assert record['elapsed_frames'] == 361
+    assert record['remaining_levels'] == 1
+    assert record['level'] == 4
+    assert (record['window_width'], record['window_height']) == (412, 766)
+    assert record['age'] is None
+
+
+def test_raw_line_is_kept_with_timestamp():
+    """Test the raw line is stored for audit with the receive time appended."""
+    record = parse_result(BASE, STAMP)
+
+    assert record['value'] == BASE + '\t2026-03-04 10:11:12.131415'
+    assert record['timeStamp'] == STAMP
+
+
+def test_2026_questionnaire_fields():
+    """Test the six questionnaire answers posted since 2026."""
+    line = BASE + '\t21\t\tgeen\tniet kleurenblind\tdonald is mij uitgelegd\tzeg ik niet'
+    record = parse_result(line, STAMP)
+
+    assert record['age'] == 21
+    assert record['hours_awake'] is None
+    assert record['substance_use'] == 'geen'
+    assert record['colorblind'] == 'niet kleurenblind'
+    assert record['experience'] == 'zeg ik niet'
+
+
+def test_every_typed_field_is_present():
+    """Test records always carry the full set of typed properties."""
+    record = parse_result('U-0001\t1\tPARAMS-0', STAMP)
+
+    assert set(TYPED_FIELDS) <= set(record)
+
+
+def test_short_line_is_rejected():
+    """Test a line without testID, testIndex and testSet is refused."""
+    with pytest.raises(ValueError):
+        parse_result('U-0001\t1', STAMP)
+
+
+def test_canonical_row_of_an_old_record():
+    """Test a record holding only the raw line maps onto the collated columns."""
+    stored = {key: value for key, value in parse_result(BASE, STAMP).items() if key not in TYPED_FIELDS}
+
+    row = canonical_row(stored)
+
+    assert list(row) == CANONICAL_SCHEMA
+    assert row['testCounter'] == 3
+    assert row['testPARAMS'] == 'PARAMS-2'
+    assert row['status'] == 'timeout'
+    assert row['dtstamp'] == STAMP
+
+
+def test_over_long_key_fields_are_refused():
+    """Test a testID, testCounter or testSet too long for a Datastore key or index is refused."""
+    for n in range(3):
+        fields = BASE.split('\t')
+        fields[n] = 'x' * (MAX_KEY_FIELD_BYTES + 1)
+        with pytest.raises(ValueError):
+            parse_result('\t'.join(fields), STAMP)
+    assert parse_result(BASE.replace('U-00ZI', 'é' * (MAX_KEY_FIELD_BYTES // 2)), STAMP)
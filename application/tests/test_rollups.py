@@ -0,0 +1,109 @@
+"""Tests for result counters maintained at ingest."""
+from datetime import datetime
+
+from google.api_core import exceptions
+
+from records import parse_result
+from rollups import Rollups, backfill, split_counters
+from storage.base import COUNTER_BATCH
+from storage.datastore_backend import DatastoreStorage
+
+LINE = 'U-0001\t{n}\tPARAMS-{s}\t10\t60\t20\t60\t240\t3,0\t3,0\t{status}\t139\t0\t412x766'
+
+
+def records(*specs):
+    return [parse_result(LINE.format(n=n, s=s, status=status), datetime(2026, 4, 1 + n))
+            for n, (s, status) in enumerate(specs)]
+
+
+def test_counts_by_dimension(sqlite_storage):
+    """Test totals per testSet, status and day after a flush."""
+    rollups = Rollups(sqlite_storage, interval=0)
+    rollups.add(records((0, 'correct'), (0, 'wrong'), (1, 'correct')))
+
+    summary = split_counters(sqlite_storage.read_counters())
+
+    assert summary['total'] == 3
+    assert summary['testSet'] == {'PARAMS-0': 2, 'PARAMS-1': 1}
+    assert summary['status'] == {'correct': 2, 'wrong': 1}
+    assert summary['day']['2026-04-01'] == 1
+
+
+def test_pending_counts_are_visible_before_flush(sqlite_storage):
+    """Test an instance sees its own unflushed increments."""
+    rollups = Rollups(sqlite_storage, interval=3600)
+    rollups.add(records((0, 'timeout')))
+
+    assert sqlite_storage.read_counters() == {}
+    assert rollups.counters()['status:timeout'] == 1
+
+    rollups.flush()
+    assert sqlite_storage.read_counters('status:') == {'status:timeout': 1}
+
+
+def test_failed_flush_keeps_increments(sqlite_storage, monkeypatch):
+    """Test increments survive a storage error and go out with the next flush."""
+    rollups = Rollups(sqlite_storage, interval=3600)
+    rollups.add(records((0, 'correct')))
+
+    def unavailable(deltas):
+        raise RuntimeError('unavailable')
+
+    monkeypatch.setattr(sqlite_storage, 'increment_counters', unavailable)
+    rollups.flush()
+    monkeypatch.undo()
+    rollups.flush()
+
+    assert sqlite_storage.read_counters('total') == {'total': 1}
+
+
+def test_backfill_counts_stored_records(sqlite_storage):
+    """Test backfill counts records that were stored before the counters."""
+    sqlite_storage.insert_results(records((2, 'wrong'), (2, 'wrong')))
+
+    assert backfill(sqlite_storage) == 2
+    assert sqlite_storage.read_counters('testSet:') == {'testSet:PARAMS-2': 2}
+
+
+def test_flush_writes_counters_in_batches(sqlite_storage, monkeypatch):
+    """Test a flush of many counters is split into writes Datastore accepts and only a failed one is kept."""
+    rollups = Rollups(sqlite_storage, interval=3600)
+    rollups.increment({f'perf:PARAMS-0|{n}|status:correct': 1 for n in range(1200)})
+    increment = sqlite_storage.increment_counters
+    sizes = []
+
+    def second_fails(deltas):
+        sizes.append(len(deltas))
+        if len(sizes) == 2:
+            raise RuntimeError('unavailable')
+        increment(deltas)
+
+    monkeypatch.setattr(sqlite_storage, 'increment_counters', second_fails)
+    rollups.flush()
+    monkeypatch.undo()
+    rollups.flush()
+
+    assert sizes == [COUNTER_BATCH, COUNTER_BATCH, 200]
+    assert set(sqlite_storage.read_counters('perf:').values()) == {1}
+    assert len(sqlite_storage.read_counters('perf:')) == 1200
+
+
+def test_datastore_counters_commit_in_chunks_and_retry(standin_client, monkeypatch):
+    """Test counters are written at most 500 per commit and a conflicting commit is retried."""
+    storage = DatastoreStorage(standin_client)
+    put_multi = standin_client.put_multi
+    sizes = []
+
+    def conflict_once(entities):
+        sizes.append(len(entities))
+        if len(sizes) == 1:
+            raise exceptions.Conflict('concurrent flush')
+        put_multi(entities)
+
+    monkeypatch.setattr(standin_client, 'put_multi', conflict_once)
+    monkeypatch.setattr('storage.datastore_backend.time.sleep', lambda seconds: None)
+    storage.increment_counters({f'day:{n}': 2 for n in range(720)})
+
+    assert sizes == [500, 500, 220]
+    counters = [values for values, _ in standin_client.entities.values()]
+    assert len(counters) == 720 and {values['value'] for values in counters} == {2}
@@ -0,0 +1,185 @@
+"""Tests for the precomputed full-export snapshots."""
+import gzip
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from google.cloud import datastore
+from google.cloud.datastore.helpers import entity_from_protobuf, entity_to_protobuf
+
+from snapshots import GCSSnapshotStore, LocalSnapshotStore, build_snapshot
+from storage.datastore_backend import entity_record
+from tests.test_storage import make_record
+
+NOW = datetime(2026, 6, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def store(tmp_path):
+    return LocalSnapshotStore(str(tmp_path / 'snapshots'))
+
+
+def test_snapshot_holds_records_up_to_watermark(sqlite_storage, store):
+    """Test records younger than the margin are left out of the snapshot."""
+    sqlite_storage.insert_results([make_record('U-0001', '1', NOW - timedelta(hours=1)),
+                                   make_record('U-0002', '1', NOW - timedelta(seconds=10))])
+
+    meta = build_snapshot(sqlite_storage, store, margin=60, now=NOW)
+
+    assert meta == store.latest()
+    assert meta['records'] == 1
+    with store.open(meta['name']) as handle:
+        assert gzip.decompress(handle.read()).decode().startswith('U-0001\t1\t')
+
+
+def test_saving_keeps_only_the_replaced_snapshot(sqlite_storage, store):
+    """Test each snapshot deletes the older ones but the one downloads may still read."""
+    sqlite_storage.insert_results([make_record('U-0001', '1', NOW - timedelta(hours=1))])
+
+    metas = [build_snapshot(sqlite_storage, store, margin=60, now=NOW + timedelta(hours=hour)) for hour in range(4)]
+
+    assert sorted(os.listdir(store.directory)) == sorted([metas[2]['name'], metas[3]['name'], 'latest.json'])
+    assert store.latest() == metas[3]
+
+
+class FakeBucket:
+    """The part of a Cloud Storage bucket GCSSnapshotStore uses, in memory."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def blob(self, name):
+        bucket = self
+
+        class Blob:
+            def exists(self):
+                return name in bucket.objects
+
+            def download_as_bytes(self):
+                return bucket.objects[name]
+
+            def upload_from_filename(self, path, content_type=None):
+                with open(path, 'rb') as handle:
+                    bucket.objects[name] = handle.read()
+
+            def upload_from_string(self, data, content_type=None):
+                bucket.objects[name] = data.encode()
+
+            def delete(self):
+                del bucket.objects[name]
+
+        blob = Blob()
+        blob.name = name
+        return blob
+
+    def list_blobs(self, prefix, delimiter):
+        return [self.blob(name) for name in list(self.objects)
+                if name.startswith(prefix) and delimiter not in name[len(prefix):]]
+
+
+def test_bucket_keeps_only_the_replaced_snapshot(sqlite_storage):
+    """Test the Cloud Storage store prunes its own snapshots and leaves other namespaces alone."""
+    bucket = FakeBucket()
+    bucket.objects['snapshots/2025/allResults-20250101T000000000000.txt.gz'] = b''
+    store = GCSSnapshotStore('donald')
+    store._bucket = bucket
+    sqlite_storage.insert_results([make_record('U-0001', '1', NOW - timedelta(hours=1))])
+
+    metas = [build_snapshot(sqlite_storage, store, margin=60, now=NOW + timedelta(hours=hour)) for hour in range(3)]
+
+    assert sorted(bucket.objects) == sorted(['snapshots/' + metas[1]['name'], 'snapshots/' + metas[2]['name'],
+                                             'snapshots/2025/allResults-20250101T000000000000.txt.gz',
+                                             'snapshots/latest.json'])
+
+
+def test_snapshot_of_datastore_records(store):
+    """Test records read back from Datastore, whose timestamps are aware UTC, go into a snapshot."""
+    class DatastorePages:
+        def query_results(self, since=None, page_size=500):
+            page = []
+            for index, stamp in enumerate((NOW - timedelta(hours=1), NOW - timedelta(seconds=10))):
+                entity = datastore.Entity(key=datastore.Key('testRecord', f'U-0001|{index}', project='donald'))
+                entity.update(make_record('U-0001', str(index), stamp))
+                page.append(entity_record(entity_from_protobuf(entity_to_protobuf(entity)._pb)))
+            yield page
+
+    meta = build_snapshot(DatastorePages(), store, margin=60, now=NOW)
+
+    assert meta['records'] == 1
+
+
+@pytest.fixture
+def snapshot_app(client, main_module, store, monkeypatch):
+    """The app serving the full export from a snapshot plus a delta."""
+    monkeypatch.setattr(main_module, 'snapshot_store', store)
+    storage = main_module.storage
+    storage.insert_results([make_record('U-0S01', '1', datetime.now() - timedelta(hours=1))])
+    build_snapshot(storage, store, since=main_module.EXPORT_SINCE, margin=60)
+    storage.insert_results([make_record('U-0S02', '1', datetime.now())])
+    return client
+
+
+def test_export_is_snapshot_plus_delta(snapshot_app):
+    """Test a gzip client gets the snapshot followed by the newer records."""
+    response = snapshot_app.get('/q', headers={'Accept-Encoding': 'gzip'})
+
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert response.headers['Accept-Ranges'] == 'bytes'
+    text = gzip.decompress(response.get_data()).decode()
+    ids = [line.split('\t')[0] for line in text.splitlines()]
+    assert 'U-0S01' in ids and 'U-0S02' in ids
+    assert ids.index('U-0S01') < ids.index('U-0S02')
+
+
+def test_export_supports_range(snapshot_app):
+    """Test a Range request returns the matching slice of the gzip body."""
+    full = snapshot_app.get('/q', headers={'Accept-Encoding': 'gzip'}).get_data()
+
+    part = snapshot_app.get('/q', headers={'Accept-Encoding': 'gzip', 'Range': 'bytes=5-24'})
+
+    assert part.status_code == 206
+    assert part.get_data() == full[5:25]
+    assert part.headers['Content-Range'] == f'bytes 5-24/{len(full)}'
+
+
+def test_export_without_gzip_is_plain_text(snapshot_app):
+    """Test clients that do not accept gzip get the decompressed export."""
+    response = snapshot_app.get('/q', headers={'Accept-Encoding': 'identity'})
+
+    assert 'Content-Encoding' not in response.headers
+    assert 'U-0S02\t1\t' in response.get_data(as_text=True)
+
+
+@pytest.mark.parametrize('extra', [{}, {'Range': 'bytes=0-'}])
+def test_download_closes_snapshot_and_is_measured(snapshot_app, store, main_module, monkeypatch, extra):
+    """Test a gzip download, streamed or ranged, closes the snapshot file and records its request metric."""
+    opened = []
+    open_snapshot = store.open
+
+    def tracked(name):
+        opened.append(open_snapshot(name))
+        return opened[-1]
+
+    monkeypatch.setattr(store, 'open', tracked)
+    measured = main_module.metrics.REQUEST_SECONDS.count('/q', 'GET', 206 if extra else 200)
+
+    for _ in range(3):
+        response = snapshot_app.get('/q', headers={'Accept-Encoding': 'gzip', **extra})
+        response.get_data()
+        response.close()
+
+    assert len(opened) == 3 and all(handle.closed for handle in opened)
+    assert main_module.metrics.REQUEST_SECONDS.count('/q', 'GET', 206 if extra else 200) == measured + 3
+
+
+def test_delta_is_streamed_in_timestamp_order(snapshot_app, main_module):
+    """Test records stored after the snapshot follow it in the order they were received."""
+    now = datetime.now()
+    main_module.storage.insert_results([make_record('U-0S04', '1', now), make_record('U-0S03', '1', now)])
+    main_module.storage.insert_results([make_record('U-0S05', '1', now - timedelta(seconds=1))])
+
+    text = gzip.decompress(snapshot_app.get('/q', headers={'Accept-Encoding': 'gzip'}).get_data()).decode()
+
+    ids = [line.split('\t')[0] for line in text.splitlines()]
+    assert ids.index('U-0S05') < ids.index('U-0S04') and ids.index('U-0S05') < ids.index('U-0S03')
@@ -0,0 +1,143 @@
+"""Tests for the durable result spool."""
+import threading
+from datetime import datetime
+
+import pytest
+
+import spool
+from records import parse_result
+from spool import Spool
+
+STAMP = datetime(2026, 3, 4, 10, 11, 12, 131415)
+
+
+def result(n):
+    return parse_result(f'U-0S{n:02d}\t{n}\tPARAMS-0', STAMP)
+
+
+def test_records_round_trip_through_the_spool_format():
+    """Test a spooled line parses back into the same record."""
+    record = result(1)
+
+    assert spool.decode(spool.encode(record)) == record
+
+
+def test_appended_results_are_drained(tmp_path):
+    """Test submitted results reach flush and drained segments are removed."""
+    stored = []
+    # every append fills a segment, so the spool rotates after each fsync
+    writer = Spool(str(tmp_path), stored.extend, name='test', max_segment_bytes=1)
+    writer.submit(result(1))
+    writer.submit_many([result(2), result(3)])
+
+    writer.join(timeout=5)
+    writer.close()
+
+    assert [record['testID'] for record in stored] == ['U-0S01', 'U-0S02', 'U-0S03']
+    assert writer.stats()['queue_depth'] == 0
+    assert len(spool.segments(str(tmp_path))) == 1
+
+
+def test_failing_backend_is_retried_without_losing_results(tmp_path):
+    """Test results wait in the spool until storage accepts them."""
+    stored = []
+    failures = iter([RuntimeError('down'), RuntimeError('down')])
+
+    def flush(batch):
+        error = next(failures, None)
+        if error:
+            raise error
+        stored.extend(batch)
+
+    writer = Spool(str(tmp_path), flush, name='test')
+    writer.submit(result(1))
+    writer.join(timeout=5)
+    writer.close()
+
+    assert len(stored) == 1
+    assert writer.stats()['retries'] == 2
+
+
+def test_unstored_results_survive_for_replay(tmp_path):
+    """Test what could not be stored before shutdown is replayed from the directory."""
+    down = threading.Event()
+
+    def flush(batch):
+        down.set()
+        raise RuntimeError('down')
+
+    writer = Spool(str(tmp_path), flush, name='crashed')
+    writer.submit_many([result(1), result(2)])
+    assert down.wait(5)
+    writer.close()
+
+    replayed = []
+    segments = spool.segments(str(tmp_path))
+    assert [spool.drain_segment(segment, replayed.extend) for segment in segments] == [2]
+    assert spool.drain_segment(segments[0], replayed.extend) == 0
+    assert [record['testIndex'] for record in replayed] == ['1', '2']
+
+
+def test_torn_last_line_is_not_replayed(tmp_path):
+    """Test an unterminated line left by a crash mid-append is ignored."""
+    segment = str(tmp_path / 'spool-x-000001.log')
+    with open(segment, 'wb') as handle:
+        handle.write(spool.encode(result(1)) + b'"U-0S02\\t2')
+
+    lines, offset = spool.read_batch(segment, 0, 100)
+
+    assert len(lines) == 1
+    assert offset == len(spool.encode(result(1)))
+
+
+def test_backlog_limit_refuses_appends(tmp_path):
+    """Test appends are refused once too much waits to be stored."""
+    import queue
+    blocked = threading.Event()
+    writer = Spool(str(tmp_path), lambda batch: blocked.wait(5), name='full', max_backlog_bytes=100)
+
+    with pytest.raises(queue.Full):
+        writer.submit_many([result(n) for n in range(5)])
+    blocked.set()
+    writer.close()
+
+
+def test_lone_result_outlasting_the_attempts_waits_for_storage(tmp_path):
+    """Test a single result is kept in the spool, not dead-lettered, while storage is down."""
+    stored = []
+    failures = iter([RuntimeError('down')] * 6)
+
+    def flush(batch):
+        error = next(failures, None)
+        if error:
+            raise error
+        stored.extend(batch)
+
+    writer = Spool(str(tmp_path), flush, name='test', max_attempts=2, max_retry_delay=0.01)
+    writer.submit(result(1))
+    writer.join(timeout=5)
+    writer.close()
+
+    assert [record['testID'] for record in stored] == ['U-0S01']
+    assert writer.stats()['dead_lettered'] == 0
+
+
+def test_record_storage_keeps_refusing_is_set_aside(tmp_path):
+    """Test a record that always fails goes to the dead-letter file and the others are stored."""
+    stored = []
+
+    def flush(batch):
+        if any(record['testID'] == 'U-0S02' for record in batch):
+            raise RuntimeError('entity too large')
+        stored.extend(batch)
+
+    writer = Spool(str(tmp_path), flush, name='test', max_attempts=2, max_retry_delay=0.01)
+    writer.submit_many([result(1), result(2), result(3)])
+    writer.submit(result(4))
+    writer.join(timeout=5)
+    writer.close()
+
+    assert [record['testID'] for record in stored] == ['U-0S01', 'U-0S03', 'U-0S04']
+    assert writer.stats()['dead_lettered'] == 1
+    with open(writer.dead_letter, 'rb') as handle:
+        assert [spool.decode(line)['testID'] for line in handle] == ['U-0S02']
@@ -0,0 +1,198 @@
+"""Tests for the SQLite storage backend."""
+import sqlite3
+from datetime import datetime, timedelta
+
+import pytest
+
+
+def make_record(testID, testIndex, timeStamp=None, testSet='PARAMS-0'):
+    timeStamp = timeStamp or datetime(2026, 5, 1, 12, 0, 0)
+    value = f"{testID}\t{testIndex}\t{testSet}\t{timeStamp}"
+    return {'testID': testID, 'testIndex': testIndex, 'testSet': testSet,
+            'timeStamp': timeStamp, 'value': value}
+
+
+def test_allocate_ids_reserves_consecutive_blocks(sqlite_storage):
+    """Test blocks start after the original counter value and never overlap."""
+    assert sqlite_storage.allocate_ids(10) == 101
+    assert sqlite_storage.allocate_ids(5) == 111
+    assert sqlite_storage.allocate_ids(1) == 116
+
+
+def test_query_by_testID_is_ordered_by_testIndex(sqlite_storage):
+    """Test a single test's records come back in testIndex order."""
+    sqlite_storage.insert_results([make_record('U-0002', '2'), make_record('U-0001', '1'),
+                                   make_record('U-0002', '1')])
+
+    pages = list(sqlite_storage.query_results(testID='U-0002'))
+
+    assert [r['testIndex'] for page in pages for r in page] == ['1', '2']
+    assert isinstance(pages[0][0]['timeStamp'], datetime)
+
+
+def test_query_all_is_paged_and_ordered(sqlite_storage):
+    """Test the full export is split into pages ordered by testID, testIndex."""
+    sqlite_storage.insert_results([make_record(f'U-{n % 3:04d}', str(n)) for n in range(7)])
+
+    pages = list(sqlite_storage.query_results(page_size=3))
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    keys = [(r['testID'], r['testIndex']) for page in pages for r in page]
+    assert keys == sorted(keys)
+
+
+def test_query_since_skips_older_records(sqlite_storage):
+    """Test records before ``since`` are left out of the full export."""
+    old = datetime(2024, 1, 1)
+    sqlite_storage.insert_results([make_record('U-0001', '1', old), make_record('U-0002', '1')])
+
+    records = [r for page in sqlite_storage.query_results(since=old + timedelta(days=1)) for r in page]
+
+    assert [r['testID'] for r in records] == ['U-0002']
+
+
+def test_delete_results_honours_limit(sqlite_storage):
+    """Test deletion removes at most ``limit`` old records per call."""
+    old = datetime(2024, 1, 1)
+    sqlite_storage.insert_results([make_record('U-0001', str(n), old) for n in range(5)])
+
+    deleted, cursor = sqlite_storage.delete_results(before=old, limit=3)
+    assert (deleted, cursor is not None) == (3, True)
+    deleted, cursor = sqlite_storage.delete_results(before=old, limit=3, cursor=cursor)
+    assert (deleted, cursor is not None) == (2, True)
+    assert sqlite_storage.delete_results(before=old, limit=3, cursor=cursor) == (0, None)
+
+
+def test_unknown_backend_is_rejected(monkeypatch):
+    """Test a typo in DONALD_STORAGE fails loudly."""
+    from storage import get_storage
+    monkeypatch.setenv('DONALD_STORAGE', 'postgres')
+
+    with pytest.raises(ValueError):
+        get_storage()
+
+
+def test_typed_fields_round_trip(sqlite_storage):
+    """Test typed properties are stored in their own columns."""
+    from records import parse_result
+    line = 'U-00ZI\t3\tPARAMS-2\t20\t120\t40\t120\t360\t1,3\t1,3\tcorrect\t99\t0\t412x766'
+    sqlite_storage.insert_results([parse_result(line, datetime(2026, 3, 4))])
+
+    record = next(sqlite_storage.query_results(testID='U-00ZI'))[0]
+
+    assert record['status'] == 'correct'
+    assert record['elapsed_frames'] == 99
+    assert record['level'] == 2
+
+
+def test_query_all_within_testID_range(sqlite_storage):
+    """Test start and end limit the full export to start <= testID < end."""
+    sqlite_storage.insert_results([make_record(f'U-000{n}', '1') for n in range(5)])
+
+    pages = list(sqlite_storage.query_results(start='U-0001', end='U-0003'))
+
+    assert [r['testID'] for page in pages for r in page] == ['U-0001', 'U-0002']
+
+
+def test_last_id_does_not_reserve(sqlite_storage):
+    """Test last_id reports the counter without moving it."""
+    assert sqlite_storage.last_id() == 100
+    sqlite_storage.allocate_ids(10)
+
+    assert sqlite_storage.last_id() == 110
+    assert sqlite_storage.allocate_ids(1) == 111
+
+
+def test_reposted_result_is_stored_once(sqlite_storage):
+    """Test a retried post of the same line is skipped, in a batch and across batches."""
+    first = make_record('U-0001', '1', datetime(2026, 5, 1, 12, 0, 0))
+    retry = make_record('U-0001', '1', datetime(2026, 5, 1, 12, 0, 5))
+
+    assert sqlite_storage.insert_results([first, first]) == ([first], 0)
+    assert sqlite_storage.insert_results([retry]) == ([], 0)
+    stored = [r for page in sqlite_storage.query_results() for r in page]
+    assert [r['timeStamp'] for r in stored] == [first['timeStamp']]
+
+
+def test_conflicting_result_is_kept(sqlite_storage):
+    """Test a different line with the same testID and testCounter is stored next to the first."""
+    sqlite_storage.insert_results([make_record('U-0001', '1')])
+    other = make_record('U-0001', '1', testSet='PARAMS-3')
+
+    assert sqlite_storage.insert_results([other]) == ([other], 1)
+    assert sqlite_storage.insert_results([other]) == ([], 0)
+    assert len([r for page in sqlite_storage.query_results() for r in page]) == 2
+
+
+def test_namespaces_keep_results_apart_and_share_ids(sqlite_storage):
+    """Test each namespace has its own results and counters but IDs stay unique."""
+    cohort = sqlite_storage.in_namespace('2026')
+    sqlite_storage.insert_results([make_record('U-0001', '1')])
+    cohort.insert_results([make_record('U-0002', '1'), make_record('U-0002', '2')])
+    cohort.increment_counters({'total': 2})
+
+    assert [r['testID'] for page in cohort.query_results() for r in page] == ['U-0002', 'U-0002']
+    assert [r['testID'] for page in sqlite_storage.query_results() for r in page] == ['U-0001']
+    assert (cohort.read_counters(), sqlite_storage.read_counters()) == ({'total': 2}, {})
+    assert cohort.allocate_ids(5) == 101
+    assert sqlite_storage.allocate_ids(1) == 106
+
+
+def test_default_namespace_can_be_named(monkeypatch, tmp_path):
+    """Test __default__ reaches the default namespace while DONALD_NAMESPACE names another."""
+    from storage import get_storage
+
+    monkeypatch.setenv('DONALD_STORAGE', 'sqlite')
+    monkeypatch.setenv('DONALD_SQLITE_PATH', str(tmp_path / 'donald.sqlite3'))
+    monkeypatch.setenv('DONALD_NAMESPACE', '2026')
+
+    assert get_storage().namespace == '2026'
+    assert get_storage('__default__').namespace is None
+    assert get_storage().namespace_exists(None)
+    assert not get_storage().namespace_exists('2025')
+
+
+def test_invalid_namespace_is_rejected(monkeypatch):
+    """Test DONALD_NAMESPACE must be a valid Datastore namespace name."""
+    from storage import get_storage
+
+    monkeypatch.setenv('DONALD_NAMESPACE', '__kind__')
+
+    with pytest.raises(ValueError):
+        get_storage()
+
+
+def test_query_test_set_pages_with_cursor(sqlite_storage):
+    """Test one testSet is returned in testID and testIndex order, page by page."""
+    sqlite_storage.insert_results([make_record('U-0002', '1', testSet='PARAMS-1'),
+                                   make_record('U-0001', '2', testSet='PARAMS-1'),
+                                   make_record('U-0001', '1', testSet='PARAMS-1'),
+                                   make_record('U-0003', '1', testSet='PARAMS-2')])
+
+    first, cursor = sqlite_storage.query_test_set('PARAMS-1', limit=2)
+    second, end = sqlite_storage.query_test_set('PARAMS-1', limit=2, cursor=cursor)
+
+    assert [(r['testID'], r['testIndex']) for r in first + second] == [('U-0001', '1'), ('U-0001', '2'),
+                                                                       ('U-0002', '1')]
+    assert end is None
+    with pytest.raises(ValueError):
+        sqlite_storage.query_test_set('PARAMS-1', cursor='not a cursor')
+
+
+def test_rows_stored_before_storedAt_count_as_stored_when_received(tmp_path):
+    """Test opening an older file gives its rows their timeStamp as storedAt."""
+    from storage.sqlite_backend import SQLiteStorage
+
+    path = str(tmp_path / 'old.sqlite3')
+    connection = sqlite3.connect(path)
+    connection.execute('CREATE TABLE testRecord (id INTEGER PRIMARY KEY AUTOINCREMENT, testID TEXT NOT NULL, '
+                       'testIndex TEXT NOT NULL, testSet TEXT NOT NULL, timeStamp TEXT NOT NULL, value TEXT NOT NULL)')
+    connection.execute("INSERT INTO testRecord (testID, testIndex, testSet, timeStamp, value) "
+                       "VALUES ('U-0001', '1', 'PARAMS-0', '2026-05-01 12:00:00.000000', 'line')")
+    connection.commit()
+    connection.close()
+
+    storage = SQLiteStorage(path)
+    records, _ = storage.query_changes(datetime(2026, 5, 1), datetime(2026, 5, 2))
+
+    assert [record['storedAt'] for record in records] == [datetime(2026, 5, 1, 12)]
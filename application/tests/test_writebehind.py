@@ -0,0 +1,81 @@
+"""Tests for write-behind result batching."""
+import queue
+import threading
+
+import pytest
+
+from writebehind import WriteBehindWriter
+
+
+def test_flushes_on_batch_size():
+    """Test a full batch is written with a single flush call."""
+    batches = []
+    flushed = threading.Event()
+
+    def flush(batch):
+        batches.append(list(batch))
+        flushed.set()
+
+    writer = WriteBehindWriter(flush, max_batch=3, max_delay=10)
+    for n in range(3):
+        writer.submit(n)
+
+    assert flushed.wait(2)
+    assert batches == [[0, 1, 2]]
+    writer.close()
+
+
+def test_flushes_on_delay():
+    """Test a partial batch is written once max_delay has passed."""
+    flushed = threading.Event()
+    writer = WriteBehindWriter(lambda batch: flushed.set(), max_batch=100, max_delay=0.05)
+    writer.submit('line')
+
+    assert flushed.wait(2)
+    writer.close()
+    assert writer.stats()['flushed'] == 1
+
+
+def test_close_flushes_everything():
+    """Test records still queued at shutdown are written."""
+    written = []
+    writer = WriteBehindWriter(written.extend, max_batch=10, max_delay=60)
+    for n in range(25):
+        writer.submit(n)
+    writer.close()
+
+    assert sorted(written) == list(range(25))
+    assert writer.stats()['queue_depth'] == 0
+
+
+def test_full_queue_rejects():
+    """Test backpressure when the bounded queue stays full."""
+    release = threading.Event()
+    writer = WriteBehindWriter(lambda batch: release.wait(5), max_batch=1, max_delay=0,
+                               max_queue=1, put_timeout=0.01)
+    writer.submit('a')
+    with pytest.raises(queue.Full):
+        for n in range(10):
+            writer.submit(n)
+
+    assert writer.stats()['rejected'] == 1
+    release.set()
+    writer.close()
+
+
+def test_failed_flush_is_retried():
+    """Test a failing flush is retried before the batch counts as written."""
+    calls = []
+
+    def flush(batch):
+        calls.append(batch)
+        if len(calls) == 1:
+            raise RuntimeError('datastore unavailable')
+
+    writer = WriteBehindWriter(flush, max_batch=1, max_delay=0)
+    writer.submit('x')
+    writer.close()
+
+    assert len(calls) == 2
+    assert writer.stats()['flushed'] == 1
+    assert writer.stats()['failed'] == 0
@@ -0,0 +1,139 @@
+"""Write-behind batching for incoming test results.
+
+POST / only has to hand its record to a bounded in-memory queue; a background
+thread collects queued records and writes them as one batch (``put_multi`` on
+Datastore) whenever ``max_batch`` records are waiting or the oldest one has
+waited ``max_delay`` seconds. Whatever is still queued is flushed on shutdown.
+"""
+
+import atexit
+import logging
+import queue
+import threading
+import time
+
+# Datastore accepts at most 500 entities per commit
+MAX_BATCH = 500
+
+logger = logging.getLogger(__name__)
+
+
+class WriteBehindWriter:
+    """Buffer records per instance and flush them in batches."""
+
+    def __init__(self, flush, max_batch: int = 100, max_delay: float = 1.0,
+                 max_queue: int = 5000, put_timeout: float = 0.5, retries: int = 3):
+        self.flush = flush
+        self.max_batch = max(1, min(max_batch, MAX_BATCH))
+        self.max_delay = max_delay
+        self.put_timeout = put_timeout
+        self.retries = retries
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = False
+        self.counters = {
+            'queued': 0,
+            'rejected': 0,
+            'flushed': 0,
+            'batches': 0,
+            'failed': 0,
+            'flush_seconds_total': 0.0,
+            'flush_seconds_last': 0.0,
+            'flush_seconds_max': 0.0,
+        }
+
+    def submit(self, record) -> None:
+        """Queue one record; raises ``queue.Full`` when the buffer stays full."""
+        self._ensure_started()
+        try:
+            self._queue.put(record, timeout=self.put_timeout)
+        except queue.Full:
+            self.counters['rejected'] += 1
+            raise
+        self.counters['queued'] += 1
+
+    def stats(self) -> dict:
+        """Return the counters together with the current queue depth."""
+        return dict(self.counters, queue_depth=self._queue.qsize())
+
+    def join(self) -> None:
+        """Block until every record queued so far has been written or dropped."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Stop the background thread after flushing everything still queued."""
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        self._drain()
+
+    def _ensure_started(self) -> None:
+        # started lazily so forking servers do not inherit a dead thread
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._stopping:
+                self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _run(self) -> None:
+        while not self._stopping:
+            try:
+                first = self._queue.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.max_delay
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or self._stopping:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._write(batch)
+
+    def _drain(self) -> None:
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+            if len(batch) == self.max_batch:
+                self._write(batch)
+                batch = []
+        if batch:
+            self._write(batch)
+
+    def _write(self, batch: list) -> None:
+        try:
+            self._write_with_retries(batch)
+        finally:
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write_with_retries(self, batch: list) -> None:
+        for attempt in range(self.retries + 1):
+            start = time.perf_counter()
+            try:
+                self.flush(batch)
+            except Exception:
+                if attempt == self.retries:
+                    self.counters['failed'] += len(batch)
+                    logger.exception('dropping %d results after %d attempts', len(batch), attempt + 1)
+                    return
+                time.sleep(0.1 * 2 ** attempt)
+                continue
+            elapsed = time.perf_counter() - start
+            self.counters['flushed'] += len(batch)
+            self.counters['batches'] += 1
+            self.counters['flush_seconds_total'] += elapsed
+            self.counters['flush_seconds_last'] = elapsed
+            self.counters['flush_seconds_max'] = max(self.counters['flush_seconds_max'], elapsed)
+            return
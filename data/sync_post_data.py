@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Append results stored since the last sync to a POST-data file.
+
+Behavior:
+- Calls /q?since=<date> the first time and /q?token=<token> afterwards
+- Appends the returned lines to the output file (default POST-data-<year>.txt)
+- Keeps the continuation token in <output>.token so the next run only moves new rows
+- Stops when a call returns no records
+"""
+
+from __future__ import annotations
+
+import argparse
+import urllib.parse
+import urllib.request
+from datetime import date
+from pathlib import Path
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Append new results from the Donald server to a POST-data file."
+    )
+    parser.add_argument(
+        "--url",
+        default="https://donald-2021.appspot.com",
+        help="Base URL of the Donald application.",
+    )
+    parser.add_argument(
+        "--since",
+        default=f"{date.today().year}-01-01",
+        help="Start date for the first sync (default: January 1st of this year).",
+    )
+    parser.add_argument(
+        "--output",
+        type=Path,
+        default=Path(__file__).resolve().parent / f"POST-data-{date.today().year}.txt",
+        help="File to append to (default: POST-data-<year>.txt next to this script).",
+    )
+    return parser.parse_args()
+
+
+def fetch(url: str) -> tuple[bytes, str]:
+    with urllib.request.urlopen(url) as response:
+        return response.read(), response.headers["X-Next-Token"]
+
+
+def main() -> int:
+    args = parse_args()
+    token_path = args.output.with_name(args.output.name + ".token")
+    token = token_path.read_text(encoding="utf-8").strip() if token_path.exists() else None
+
+    rows = 0
+    while True:
+        query = {"token": token} if token else {"since": args.since}
+        body, token = fetch(f"{args.url.rstrip('/')}/q?{urllib.parse.urlencode(query)}")
+        if body:
+            with args.output.open("ab") as handle:
+                handle.write(body)
+            rows += body.count(b"\n")
+        # saved after every append, so a rerun after a crash repeats at most one page
+        token_path.write_text(token, encoding="utf-8")
+        if not body:
+            break
+
+    print(f"Output: {args.output}")
+    print(f"- rows_appended={rows}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())